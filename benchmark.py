@@ -0,0 +1,386 @@
+######################################
+# Benchmarks
+######################################
+# Compares the per-customer lambda aggregations the pipelines used to run
+# with the single pass customer_summary kernel, on synthetic Online Retail shaped transactions,
+# measures how sharded execution scales with the number of processes
+# and how much memory the low-memory transaction schema saves on the Online Retail II workbook.
+# The native BG-NBD fitter is compared with lifetimes.BetaGeoFitter on simulated customers.
+# The pipeline suite runs create_rfm, create_cltv_calculation and create_cltv_p on synthetic.py transactions of
+# several sizes, records their stages through the instrumentation hooks and writes the results as JSON.
+# The shared feature build (features.py) is compared with the three pipelines' own cleaning and aggregation.
+# Usage : python benchmark.py
+#         python benchmark.py scaling
+#         python benchmark.py memory
+#         python benchmark.py cleaning
+#         python benchmark.py bgnbd
+#         python benchmark.py suite [output.json]
+#         python benchmark.py compare <baseline.json> <current.json>
+#         python benchmark.py features
+
+# 1. Synthetic Transactions
+# 2. Lambda Aggregations
+# 3. Benchmark
+# 4. Sharded Execution Scaling
+# 5. Low-Memory Schema
+# 6. Fused Cleaning Stage
+# 7. BG-NBD Fit
+# 8. Pipeline Stage Suite
+# 9. Shared Feature Build
+
+import datetime as dt
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from customer_summary import customer_summary, rfm_metrics, cltv_metrics, lifetime_metrics
+from parallel import sharded_summary
+from ingestion import load_transactions, TEXT_COLUMNS
+from preprocessing import prepare_rfm, prepare_cltv, filter_cltv_p, OutlierCapper
+from lifetime_models import BGNBDFitter
+from customer_summary import lifetime_data
+from instrumentation import instrumented
+from synthetic import generate_transactions
+from features import customer_frames
+from pipelines import create_rfm, create_cltv_calculation, create_cltv_p
+
+
+######################################
+# 1. Synthetic Transactions
+######################################
+
+def cleaned_transactions(n_rows, n_customers, seed=42):
+    """
+        synthetic.py transactions cleaned like create_rfm (with TotalPrice), the input of the aggregation step.
+    """
+
+    return prepare_rfm(generate_transactions(n_rows, n_customers, seed)).reset_index(drop=True)
+
+
+######################################
+# 2. Lambda Aggregations
+######################################
+
+def lambda_rfm(dataframe, today_date):
+    rfm = dataframe.groupby('Customer ID').agg({'InvoiceDate': lambda InvoiceDate: (today_date - InvoiceDate.max()).days,
+                                                'Invoice': lambda Invoice: Invoice.nunique(),
+                                                'TotalPrice': lambda TotalPrice: TotalPrice.sum()})
+    rfm.columns = ["recency", "frequency", "monetary"]
+    return rfm
+
+
+def lambda_cltv(dataframe):
+    cltv_c = dataframe.groupby('Customer ID').agg({'Invoice': lambda x: x.nunique(),
+                                                   'Quantity': lambda x: x.sum(),
+                                                   'TotalPrice': lambda x: x.sum()})
+    cltv_c.columns = ["total_transaction", "total_unit", "total_price"]
+    return cltv_c
+
+
+def lambda_lifetime(dataframe, today_date):
+    cltv_df = dataframe.groupby('Customer ID').agg({
+        'InvoiceDate': [lambda InvoiceDate: (InvoiceDate.max() - InvoiceDate.min()).days,
+                        lambda InvoiceDate: (today_date - InvoiceDate.min()).days],
+        'Invoice': lambda Invoice: Invoice.nunique(),
+        'TotalPrice': lambda TotalPrice: TotalPrice.sum()
+    })
+    cltv_df.columns = cltv_df.columns.droplevel(0)
+    cltv_df.columns = ['recency', 'T', 'frequency', 'monetary']
+    return cltv_df
+
+
+######################################
+# 3. Benchmark
+######################################
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run_benchmark(n_rows=1_000_000, n_customers=50_000):
+    """
+        Times the lambda aggregations against the kernel for the three pipelines and checks that the outputs are equal.
+    """
+
+    dataframe = cleaned_transactions(n_rows, n_customers)
+    today_date = dt.datetime(2011, 12, 11)
+
+    lambda_funcs = {"rfm": lambda: lambda_rfm(dataframe, today_date),
+                    "cltv_calculation": lambda: lambda_cltv(dataframe),
+                    "cltv_prediction": lambda: lambda_lifetime(dataframe, today_date)}
+
+    summary, summary_time = timed(customer_summary, dataframe)
+    kernel_funcs = {"rfm": lambda: rfm_metrics(summary, today_date),
+                    "cltv_calculation": lambda: cltv_metrics(summary),
+                    "cltv_prediction": lambda: lifetime_metrics(summary, today_date)}
+
+    print(f"rows: {n_rows}, customers: {summary.shape[0]}, summary kernel: {summary_time:.3f}s")
+    for name in lambda_funcs:
+        expected, lambda_time = timed(lambda_funcs[name])
+        result, derive_time = timed(kernel_funcs[name])
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_names=False)
+        kernel_time = summary_time + derive_time
+        print(f"{name:<18} lambda: {lambda_time:.3f}s  kernel: {kernel_time:.3f}s  speedup: {lambda_time / kernel_time:.1f}x")
+
+
+######################################
+# 4. Sharded Execution Scaling
+######################################
+
+def run_scaling_benchmark(n_rows=50_000_000, n_customers=1_000_000, jobs=(1, 2, 4, 8, 16)):
+    """
+        Times sharded_summary of every pipeline for each process count and reports the speedup over one process.
+    """
+
+    dataframe = generate_transactions(n_rows, n_customers)
+    print(f"rows: {n_rows}, customers: {n_customers}")
+    for pipeline in ["rfm", "cltv_calculation", "cltv_prediction"]:
+        base_time = None
+        for n_jobs in jobs:
+            _, elapsed = timed(sharded_summary, dataframe, pipeline, n_jobs)
+            base_time = base_time or elapsed
+            print(f"{pipeline:<18} n_jobs: {n_jobs:>2}  {elapsed:.3f}s  speedup: {base_time / elapsed:.1f}x")
+
+
+######################################
+# 5. Low-Memory Schema
+######################################
+
+def memory_mb(dataframe):
+    return dataframe.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def run_memory_benchmark(path="datasets/online_retail_II.xlsx", sheet_name="Year 2010-2011"):
+    """
+        Resident size of the transactions as object strings (pd.read_excel), with the typed cache
+        and with the low-memory schema (with and without float32 prices).
+    """
+
+    typed = load_transactions(path, sheet_name=sheet_name)
+    frames = {"object strings": typed.astype({col: "object" for col in TEXT_COLUMNS}),
+              "typed cache": typed,
+              "low_memory": load_transactions(path, sheet_name=sheet_name, low_memory=True),
+              "low_memory + float32": load_transactions(path, sheet_name=sheet_name, low_memory=True, float32_prices=True)}
+
+    base = memory_mb(frames["object strings"])
+    for name, dataframe in frames.items():
+        print(f"{name:<22} {memory_mb(dataframe):8.1f} MB  reduction: {base / memory_mb(dataframe):.1f}x")
+
+
+######################################
+# 6. Fused Cleaning Stage
+######################################
+
+def chained_cleaning(dataframe):
+    # the filter chain create_cltv_p used before the fused cleaning stage
+    dataframe = dataframe.copy()
+    dataframe.dropna(inplace=True)
+    dataframe = dataframe[~dataframe["Invoice"].str.contains("C", na=False)]
+    dataframe = dataframe[(dataframe["Quantity"] > 0)]
+    dataframe = dataframe[(dataframe["Price"] > 0)]
+    return dataframe
+
+
+def profiled(func, *args):
+    tracemalloc.start()
+    result, elapsed = timed(func, *args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 ** 2
+
+
+def run_cleaning_benchmark(n_rows=5_000_000, n_customers=100_000):
+    """
+        Wall time and peak traced memory of the filter chain and of the fused cleaning stage.
+    """
+
+    dataframe = generate_transactions(n_rows, n_customers)
+    expected, chain_time, chain_peak = profiled(chained_cleaning, dataframe)
+    result, fused_time, fused_peak = profiled(filter_cltv_p, dataframe)
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True))
+    print(f"rows: {n_rows}, surviving rows: {len(result)}")
+    print(f"filter chain   {chain_time:.3f}s  peak: {chain_peak:8.1f} MB")
+    print(f"fused stage    {fused_time:.3f}s  peak: {fused_peak:8.1f} MB")
+
+
+######################################
+# 7. BG-NBD Fit
+######################################
+
+def bgnbd_customers(n_customers, r=0.25, alpha=4.0, a=0.8, b=2.5, max_T=52, seed=42):
+    """
+        Simulates (frequency, recency, T) of customers following the BG-NBD model, all customers at once.
+    """
+
+    rng = np.random.default_rng(seed)
+    T = rng.uniform(1, max_T, n_customers)
+    rate = rng.gamma(r, 1 / alpha, n_customers)
+    dropout = rng.beta(a, b, n_customers)
+    frequency = np.zeros(n_customers)
+    recency = np.zeros(n_customers)
+    time_ = np.zeros(n_customers)
+    active = np.arange(n_customers)
+    while len(active):
+        time_[active] += rng.exponential(1 / rate[active])
+        active = active[time_[active] < T[active]]
+        frequency[active] += 1
+        recency[active] = time_[active]
+        # after each purchase the customer drops out with probability p
+        active = active[rng.random(len(active)) >= dropout[active]]
+    return pd.DataFrame({"frequency": frequency, "recency": recency, "T": T})
+
+
+def run_bgnbd_benchmark(n_customers=3_000_000, penalizer_coef=0.001):
+    """
+        Fit time of lifetimes.BetaGeoFitter and of BGNBDFitter (cold and warm-started) and the largest parameter gap.
+    """
+
+    from lifetimes import BetaGeoFitter
+
+    data = bgnbd_customers(n_customers)
+    data = data[data["frequency"] > 0]
+    args = (data["frequency"], data["recency"], data["T"])
+    reference, lifetimes_time = timed(BetaGeoFitter(penalizer_coef).fit, *args)
+    native, native_time = timed(BGNBDFitter(penalizer_coef).fit, *args)
+    previous = native.params_ * 1.05
+    warm, warm_time = timed(lambda *a: BGNBDFitter(penalizer_coef).fit(*a, initial_params=previous), *args)
+    gap = (native.params_ / reference.params_[native.params_.index] - 1).abs().max()
+    print(f"repeat customers: {len(data)}, largest relative parameter gap: {gap:.2e}")
+    print(f"lifetimes      {lifetimes_time:.3f}s")
+    print(f"native cold    {native_time:.3f}s  ({lifetimes_time / native_time:.1f}x, {native.n_iterations_} iterations)")
+    print(f"native warm    {warm_time:.3f}s  ({lifetimes_time / warm_time:.1f}x, {warm.n_iterations_} iterations)")
+
+
+######################################
+# 8. Pipeline Stage Suite
+######################################
+
+PIPELINE_FUNCTIONS = {"rfm": create_rfm,
+                      "cltv_calculation": create_cltv_calculation,
+                      "cltv_prediction": create_cltv_p}
+
+
+def max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # peak resident set size of the process so far (kilobytes on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_suite(sizes=(100_000, 1_000_000, 10_000_000), output="benchmark_results.json", seed=42):
+    """
+        Runs create_rfm, create_cltv_calculation and create_cltv_p on synthetic transactions of each size and writes
+        the stage records of the instrumentation hooks (wall and CPU time, peak RSS, rows in / out) to a JSON file.
+    """
+
+    results = []
+    for n_rows in sizes:
+        dataframe, elapsed = timed(generate_transactions, n_rows, None, seed)
+        print(f"rows: {n_rows}, generated in {elapsed:.3f}s")
+        for function in PIPELINE_FUNCTIONS.values():
+            records = []
+            data = dataframe.copy()
+            with instrumented(records.append):
+                function(data)
+            for record in records:
+                results.append({"n_rows": n_rows, **record})
+                print(f"{record['pipeline']:<18} {record['stage']:<14} {record['wall_seconds']:8.3f}s  "
+                      f"peak RSS: {record['peak_rss_mb']:8.1f} MB")
+
+    report = {"created_at": dt.datetime.now().isoformat(timespec="seconds"),
+              "commit": _git_commit(),
+              "python": platform.python_version(),
+              "pandas": pd.__version__,
+              "numpy": np.__version__,
+              "cpu_count": os.cpu_count(),
+              "seed": seed,
+              "max_rss_mb": max_rss_mb(),
+              "results": results}
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    return report
+
+
+def compare_suites(baseline, current):
+    """
+        Time and peak memory ratios (current / baseline) of every stage present in both suite JSON files.
+    """
+
+    frames = []
+    for path in (baseline, current):
+        with open(path) as file:
+            frames.append(pd.DataFrame(json.load(file)["results"]).set_index(["n_rows", "pipeline", "stage"]))
+    columns = ["wall_seconds", "peak_rss_mb"]
+    comparison = frames[0][columns].join(frames[1][columns], how="inner", lsuffix="_baseline", rsuffix="_current")
+    comparison["time_ratio"] = comparison["wall_seconds_current"] / comparison["wall_seconds_baseline"]
+    comparison["memory_ratio"] = comparison["peak_rss_mb_current"] / comparison["peak_rss_mb_baseline"]
+    return comparison
+
+
+######################################
+# 9. Shared Feature Build
+######################################
+
+def separate_frames(dataframe, rfm_date, lifetime_date):
+    # the metric frames as the three pipelines build them, each with its own cleaning and groupby
+    rfm = rfm_metrics(customer_summary(prepare_rfm(dataframe)), rfm_date)
+    return {"rfm": rfm[rfm["monetary"] > 0],
+            "cltv_calculation": cltv_metrics(customer_summary(prepare_cltv(dataframe))),
+            "lifetime": lifetime_data(customer_summary(OutlierCapper().fit_transform(filter_cltv_p(dataframe))),
+                                      lifetime_date)}
+
+
+def run_features_benchmark(n_rows=5_000_000, seed=42):
+    """
+        Wall time of the RFM, cltv_calculation and lifetime frames built by the three pipelines separately,
+        of the single customer_features scan, and of the RFM pipeline alone.
+    """
+
+    dataframe = generate_transactions(n_rows, seed=seed)
+    # the dates of create_rfm and create_cltv_p
+    rfm_date, lifetime_date = dt.datetime(2010, 12, 11), dt.datetime(2011, 12, 11)
+    expected, separate_time = timed(separate_frames, dataframe, rfm_date, lifetime_date)
+    result, shared_time = timed(customer_frames, dataframe, rfm_date, lifetime_date)
+    for name, frame in expected.items():
+        pd.testing.assert_frame_equal(result[name], frame)
+    _, rfm_time = timed(lambda data: customer_summary(prepare_rfm(data)), dataframe)
+    print(f"rows: {n_rows}, customers: {len(result['rfm'])}")
+    print(f"three pipelines  {separate_time:.3f}s")
+    print(f"shared features  {shared_time:.3f}s")
+    print(f"rfm only         {rfm_time:.3f}s")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["scaling"]:
+        run_scaling_benchmark()
+    elif sys.argv[1:] == ["memory"]:
+        run_memory_benchmark()
+    elif sys.argv[1:] == ["cleaning"]:
+        run_cleaning_benchmark()
+    elif sys.argv[1:] == ["bgnbd"]:
+        run_bgnbd_benchmark()
+    elif sys.argv[1:2] == ["suite"]:
+        run_suite(output=sys.argv[2] if len(sys.argv) > 2 else "benchmark_results.json")
+    elif sys.argv[1:2] == ["compare"]:
+        print(compare_suites(sys.argv[2], sys.argv[3]).to_string())
+    elif sys.argv[1:] == ["features"]:
+        run_features_benchmark()
+    else:
+        run_benchmark()
@@ -0,0 +1,121 @@
+######################################
+# Bootstrap Confidence Intervals of CLTV
+######################################
+# The clv column of create_cltv_p is a point estimate. Refitting BG-NBD & Gamma-Gamma on resampled customers
+# shows how much it (and the A/B/C/D segment) depends on the particular customers in the data.
+# The aggregated customer table (lifetime_data) is built once and reused by every replicate :
+# resampling customers with replacement only changes how often each customer counts, so a replicate is a weighted
+# fit on the distinct customer tuples with multinomial counts as weights, warm-started from the point estimate.
+# Replicates are fitted in a process pool, each worker receives the customer table once.
+# Every customer is then scored with every replicate model, chunk by chunk, giving percentile intervals and
+# a segment-stability score : the share of replicates that put the customer in its point estimate segment.
+
+# 1. Resampling
+# 2. Replicate Workers
+# 3. Bootstrap CLTV
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from lifetime_models import BGNBDFitter, GGFitter, ConvergenceError, unique_tuples
+from parallel import resolve_n_jobs
+from scoring import CLTVModel, FEATURES, clv_segment_scorer
+
+_WORKER_DATA = {}
+
+
+######################################
+# 1. Resampling
+######################################
+
+def bootstrap_counts(n_customers, rng):
+    """
+        How many times each customer is drawn when n_customers customers are drawn with replacement.
+    """
+
+    return np.bincount(rng.integers(0, n_customers, n_customers), minlength=n_customers).astype("float64")
+
+
+######################################
+# 2. Replicate Workers
+######################################
+
+def _init_worker(data):
+    _WORKER_DATA.update(data)
+
+
+def _refit(fitter, tuples, inverse, counts, initial_params):
+    weights = np.bincount(inverse, weights=counts, minlength=len(tuples[0]))
+    try:
+        return fitter.fit(*tuples, weights=weights, initial_params=initial_params)
+    except ConvergenceError:
+        # started at the optimum BFGS may stop on precision loss, the default starting point does not
+        return fitter.fit(*tuples, weights=weights)
+
+
+def _fit_replicate(seed):
+    data = _WORKER_DATA
+    state = data["state"]
+    counts = bootstrap_counts(len(data["bgnbd_inverse"]), np.random.default_rng(seed))
+
+    bgf = _refit(BGNBDFitter(penalizer_coef=state["bgf_penalizer"]),
+                 data["bgnbd_tuples"], data["bgnbd_inverse"], counts, state["bgf_params"])
+    ggf = _refit(GGFitter(penalizer_coef=state["ggf_penalizer"]),
+                 data["gg_tuples"], data["gg_inverse"], counts, state["ggf_params"])
+
+    # the replicate's segment boundaries are the quartiles of its CLTV over all customers
+    model = CLTVModel.from_dict({**state, "bgf_params": bgf.params_, "ggf_params": ggf.params_, "clv_edges": []})
+    model.scorer = clv_segment_scorer(model.predict(*data["features"])["clv"])
+    return model.to_dict()
+
+
+def _score_chunk(features, states, point_codes, interval):
+    clv = np.empty((len(states), len(point_codes)))
+    stable = np.zeros(len(point_codes))
+    for i, state in enumerate(states):
+        scores = CLTVModel.from_dict(state).predict(*features)
+        clv[i] = scores["clv"]
+        stable += scores["segment"].codes == point_codes
+    lower, median, upper = np.quantile(clv, [(1 - interval) / 2, 0.5, (1 + interval) / 2], axis=0)
+    return lower, median, upper, stable / len(states)
+
+
+######################################
+# 3. Bootstrap CLTV
+######################################
+
+def bootstrap_clv(cltv_df, model, n_replicates=200, n_jobs=-1, interval=0.95, seed=None):
+    """
+        Percentile intervals of the CLTV of each customer of a lifetime_data frame and the share of replicates
+        that keep the customer in the segment the fitted model gives (segment_stability).
+    """
+
+    n_jobs = resolve_n_jobs(n_jobs)
+    features = [cltv_df[col].to_numpy(dtype="float64") for col in FEATURES]
+    bgnbd_tuples, _, bgnbd_inverse = unique_tuples(*features[:3])
+    gg_tuples, _, gg_inverse = unique_tuples(features[0], features[3])
+    data = {"state": model.to_dict(), "features": features,
+            "bgnbd_tuples": bgnbd_tuples, "bgnbd_inverse": bgnbd_inverse,
+            "gg_tuples": gg_tuples, "gg_inverse": gg_inverse}
+    seeds = np.random.SeedSequence(seed).spawn(n_replicates)
+    point_codes = model.predict(*features)["segment"].codes
+
+    # customer chunks small enough to keep a (replicates x chunk) CLTV matrix in memory
+    chunks = np.array_split(np.arange(len(cltv_df)), max(n_jobs * 4, len(cltv_df) // 20_000, 1))
+    chunk_args = [([col[chunk] for col in features], point_codes[chunk]) for chunk in chunks]
+
+    if n_jobs == 1:
+        _init_worker(data)
+        states = [_fit_replicate(seed) for seed in seeds]
+        _WORKER_DATA.clear()
+        results = [_score_chunk(chunk_features, states, chunk_codes, interval) for chunk_features, chunk_codes in chunk_args]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(data,)) as executor:
+            states = list(executor.map(_fit_replicate, seeds))
+            futures = [executor.submit(_score_chunk, chunk_features, states, chunk_codes, interval)
+                       for chunk_features, chunk_codes in chunk_args]
+            results = [future.result() for future in futures]
+
+    lower, median, upper, stability = (np.concatenate(parts) for parts in zip(*results))
+    return pd.DataFrame({"clv_lower": lower, "clv_median": median, "clv_upper": upper,
+                         "segment_stability": stability}, index=cltv_df.index)
@@ -58,11 +58,13 @@
 
 import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
+from ingestion import load_transactions
+from ranking import top_k
 pd.set_option('display.max_columns', None)
 # pd.set_option('display.max_rows', None)
 pd.set_option('display.float_format', lambda x: '%.5f' % x)
 
-df_ = pd.read_excel("datasets/online_retail_II.xlsx", sheet_name = "Year 2009-2010")
+df_ = load_transactions("datasets/online_retail_II.xlsx", sheet_name = "Year 2009-2010")
 df = df_.copy()
 df.head()
 
@@ -114,7 +116,7 @@ cltv_calculation["customer_value"] = cltv_calculation["average_order_value"] * c
 ######################################
 cltv_calculation["cltv"] = ( cltv_calculation["customer_value"] / churn_rate ) * cltv_calculation["profit_margin"]
 
-cltv_calculation.sort_values(by = "cltv", ascending = False).head()
+top_k(cltv_calculation, 5, "cltv")
 
 ######################################
 # 8. Creating segments
@@ -123,7 +125,7 @@ cltv_calculation.sort_values(by = "cltv", ascending = False).tail()
 
 cltv_calculation["segment"] = pd.qcut(cltv_calculation["cltv"], 4, labels = ["D", "C", "B", "A"])
 
-cltv_calculation.sort_values(by = "cltv", ascending = False).head()
+top_k(cltv_calculation, 5, "cltv")
 cltv_calculation.groupby("segment").agg({"count", "mean", "sum"})
 
 cltv_calculation.to_csv("cltv_calculation.csv")
@@ -132,41 +134,8 @@ cltv_calculation.to_csv("cltv_calculation.csv")
 # 9. Functionalization of the entire process
 ######################################
 
-def create_cltv_calculation(dataframe, profit = 0.10):
-
-    # Data Preparation
-    dataframe = dataframe[~dataframe["Invoice"].str.contains("C", na=False)]
-    dataframe = dataframe[(dataframe["Quantity"] > 0)]
-    dataframe.dropna(inplace=True)
-    dataframe["TotalPrice"] = dataframe["Quantity"] * dataframe["Price"]
-    cltv_c = dataframe.groupby('Customer ID').agg({'Invoice': lambda x: x.nunique(),
-                                                   'Quantity': lambda x: x.sum(),
-                                                   'TotalPrice': lambda x: x.sum()})
-    cltv_c.columns = ["total_transaction", "total_unit", "total_price"]
-
-    # average_order_value
-    cltv_c["average_order_value"] = cltv_c["total_price"] / cltv_c["total_transaction"]
-
-    # purchase_frequency
-    cltv_c["purchase_frequency"] = cltv_c["total_transaction"] / cltv_c.shape[0]
-
-    # repeat_rate & churn_rate
-    repeat_rate_f = cltv_c[cltv_c["total_transaction"] > 1].shape[0] / cltv_c.shape[0]
-    churn_rate_f = 1 - repeat_rate_f
-
-    # profit_margin
-    cltv_c["profit_margin"] = cltv_c["total_price"] * 0.10
-
-    #customer_value
-    cltv_c["customer_value"] = cltv_c["average_order_value"] * cltv_c["purchase_frequency"]
-
-    # cltv
-    cltv_c["cltv"] = (cltv_c["customer_value"] / churn_rate_f) * cltv_c["profit_margin"]
-
-    # segment
-    cltv_c["segment"] = pd.qcut(cltv_c["cltv"], 4, labels=["D", "C", "B", "A"])
-
-    return cltv_c
+# the function lives in pipelines.py, so it can be imported without running this script
+from pipelines import create_cltv_calculation
 
 df = df_.copy()
 
@@ -43,6 +43,9 @@ from lifetimes import BetaGeoFitter
 from lifetimes import GammaGammaFitter
 from lifetimes.plotting import plot_period_transactions
 from sklearn.preprocessing import MinMaxScaler
+from ingestion import load_transactions
+from instrumentation import stage
+from ranking import top_k
 
 ## Display Configurations
 
@@ -75,12 +78,11 @@ def replace_with_thresholds(dataframe, variable):
     """
 
     low_limit, up_limit = outlier_thresholds(dataframe, variable)
-    dataframe.loc[(dataframe[variable] < low_limit), variable] = low_limit
-    dataframe.loc[(dataframe[variable] > up_limit), variable] = up_limit
+    dataframe[variable] = dataframe[variable].clip(low_limit, up_limit)
 
 ## Reading Data
 
-df_ = pd.read_excel("datasets/online_retail_II.xlsx", sheet_name = "Year 2010-2011")
+df_ = load_transactions("datasets/online_retail_II.xlsx", sheet_name = "Year 2010-2011")
 df = df_.copy()
 df.describe().T
 df.head()
@@ -141,10 +143,10 @@ bgf.fit(cltv_df['frequency'],
 
 ## Who are the 10 customers we expect to purchase the most from in 1 week?
 
-bgf.conditional_expected_number_of_purchases_up_to_time(1,
-                                                        cltv_df['frequency'],
-                                                        cltv_df['recency'],
-                                                        cltv_df['T']).sort_values(ascending = False).head(10)
+top_k(bgf.conditional_expected_number_of_purchases_up_to_time(1,
+                                                              cltv_df['frequency'],
+                                                              cltv_df['recency'],
+                                                              cltv_df['T']), 10)
 
 cltv_df['expected_purc_1_month'] = bgf.predict(4,
                                                cltv_df['frequency'],
@@ -186,13 +188,13 @@ ggf.fit(cltv_df['frequency'], cltv_df['monetary'])
 ggf.conditional_expected_average_profit(cltv_df['frequency'],
                                         cltv_df['monetary']).head(10)
 
-ggf.conditional_expected_average_profit(cltv_df['frequency'],
-                                        cltv_df['monetary']).sort_values(ascending = False).head(10)
+top_k(ggf.conditional_expected_average_profit(cltv_df['frequency'],
+                                              cltv_df['monetary']), 10)
 
 cltv_df['expected_average_profit'] = ggf.conditional_expected_average_profit(cltv_df['frequency'],
                                                                              cltv_df['monetary'])
 
-cltv_df.sort_values('expected_average_profit', ascending = False).head(10)
+top_k(cltv_df, 10, 'expected_average_profit')
 
 
 ######################################
@@ -214,7 +216,7 @@ cltv.head()
 cltv = cltv.reset_index()
 
 cltv_final = cltv_df.merge(cltv, on = 'Customer ID', how = 'left')
-cltv_final.sort_values(by = 'clv', ascending = False).head(10)
+top_k(cltv_final, 10, 'clv')
 
 
 ######################################
@@ -224,7 +226,7 @@ cltv_final.sort_values(by = 'clv', ascending = False).head(10)
 
 cltv_final['segment'] = pd.qcut(cltv_final['clv'], 4, labels = ['D', 'C', 'B', 'A'])
 
-cltv_final.sort_values(by = 'clv', ascending = False).head(50)
+top_k(cltv_final, 50, 'clv')
 
 cltv_final.groupby('segment').agg({'count',
                                    'mean',
@@ -236,75 +238,12 @@ cltv_final.groupby('segment').agg({'count',
 ######################################
 
 
-def create_cltv_p(dataframe, month = 3):
-
-    # Data Preprocessing
-    dataframe.dropna(inplace=True)
-    dataframe = dataframe[~dataframe["Invoice"].str.contains("C", na=False)]
-    dataframe = dataframe[(dataframe["Quantity"] > 0)]
-    dataframe = dataframe[(dataframe["Price"] > 0)]
-    replace_with_thresholds(dataframe, "Quantity")
-    replace_with_thresholds(dataframe, "Price")
-    dataframe["TotalPrice"] = dataframe["Quantity"] * dataframe["Price"]
-    today_date = dt.datetime(2011, 12, 11)
-
-    cltv_df = dataframe.groupby('Customer ID').agg({
-        'InvoiceDate': [lambda InvoiceDate: (InvoiceDate.max() - InvoiceDate.min()).days,
-                        lambda InvoiceDate: (today_date - InvoiceDate.min()).days],
-        'Invoice': lambda Invoice: Invoice.nunique(),
-        'TotalPrice': lambda TotalPrice: TotalPrice.sum()
-    })
-    cltv_df.columns = cltv_df.columns.droplevel(0)
-    cltv_df.columns = ['recency', 'T', 'frequency', 'monetary']
-    cltv_df['monetary'] = cltv_df['monetary'] / cltv_df['frequency']
-    cltv_df = cltv_df[(cltv_df['frequency'] > 1)]
-    cltv_df['recency'] = cltv_df['recency'] / 7
-    cltv_df['T'] = cltv_df['T'] / 7
-
-    # Establishment of BG-NBD Model
-    bgf = BetaGeoFitter(penalizer_coef=0.001)
-    bgf.fit(cltv_df['frequency'],
-            cltv_df['recency'],
-            cltv_df['T'])
-
-    cltv_df['expected_purc_1_week'] = bgf.predict(1,
-                                                   cltv_df['frequency'],
-                                                   cltv_df['recency'],
-                                                   cltv_df['T'])
-
-    cltv_df['expected_purc_1_month'] = bgf.predict(4,
-                                                   cltv_df['frequency'],
-                                                   cltv_df['recency'],
-                                                   cltv_df['T'])
-    cltv_df['expected_purc_3_month'] = bgf.predict(12,
-                                                   cltv_df['frequency'],
-                                                   cltv_df['recency'],
-                                                   cltv_df['T'])
-
-    # Establishment of Gamma-Gamma Model
-    ggf = GammaGammaFitter(penalizer_coef=0.01)
-    ggf.fit(cltv_df['frequency'], cltv_df['monetary'])
-    cltv_df['expected_average_profit'] = ggf.conditional_expected_average_profit(cltv_df['frequency'],
-                                                                                 cltv_df['monetary'])
-
-    # CLTV Calculation with BG-NBD & Gamma-Gamma Models
-    cltv = ggf.customer_lifetime_value(bgf,
-                                       cltv_df['frequency'],
-                                       cltv_df['recency'],
-                                       cltv_df['T'],
-                                       cltv_df['monetary'],
-                                       time=3,  # 3month
-                                       freq="W",  # T frequency
-                                       discount_rate=0.01)
-
-    cltv = cltv.reset_index()
-    cltv_final = cltv_df.merge(cltv, on='Customer ID', how='left')
-    cltv_final['segment'] = pd.qcut(cltv_final['clv'], 4, labels=['D', 'C', 'B', 'A'])
-
-    return cltv_final
+# the function lives in pipelines.py, so it can be imported without running this script
+from pipelines import create_cltv_p
 
 df = df_.copy()
 
 cltv_final2 = create_cltv_p(df)
 
-cltv_final2.to_csv('cltv_prediction.csv')
\ No newline at end of file
+with stage("cltv_prediction", "to_csv", rows_in=len(cltv_final2)):
+    cltv_final2.to_csv('cltv_prediction.csv')
\ No newline at end of file
@@ -0,0 +1,201 @@
+######################################
+# Cohort Analysis
+######################################
+# Customers are grouped into acquisition cohorts by the period (month, week or day) of their first purchase, and
+# every later purchase falls at a period offset from that cohort. Three cohort x offset matrices are built :
+#   retention     : share of the cohort's customers buying in the period
+#   revenue       : total TotalPrice of the cohort in the period
+#   average_order : revenue per distinct invoice
+# Transactions are cleaned like create_rfm (prepare_rfm). Periods are integer codes, and the rows of a chunk are reduced
+# to one row per (customer, period) with its distinct invoices and revenue, using factorized keys and np.bincount,
+# without nested groupbys or pivots. The rows of an invoice are consecutive in the file (see streaming.py), so only the
+# last invoice of a chunk can continue in the next one and is counted once. The per-chunk rows are kept as they are :
+# the cohort of a customer is only known at the end, when the matrices are built from all of them at once with
+# np.minimum.at / np.bincount.
+#   matrices = cohort_matrices(df, period="M")
+
+# 1. Period Codes
+# 2. Cohort Accumulator
+# 3. Cohort Matrices
+
+import numpy as np
+import pandas as pd
+from preprocessing import prepare_rfm
+from streaming import read_chunks, CHUNKSIZE
+
+# 1970-01-01 is a Thursday, weeks start on Monday
+_WEEK_SHIFT = 3
+
+
+######################################
+# 1. Period Codes
+######################################
+
+def period_codes(dates, period="M"):
+    """
+        Integer period of each date : months ("M"), weeks starting on Monday ("W") or days ("D") since 1970-01-01.
+    """
+
+    dates = np.asarray(dates, dtype="datetime64[ns]")
+    if period == "M":
+        return dates.astype("datetime64[M]").astype("int64")
+    days = dates.astype("datetime64[D]").astype("int64")
+    if period == "W":
+        return (days + _WEEK_SHIFT) // 7
+    if period == "D":
+        return days
+    raise ValueError(f"period must be 'M', 'W' or 'D', got {period!r}")
+
+
+def period_starts(codes, period="M"):
+    """
+        First day of each integer period, as a DatetimeIndex.
+    """
+
+    codes = np.asarray(codes, dtype="int64")
+    if period == "M":
+        return pd.DatetimeIndex(codes.astype("datetime64[M]").astype("datetime64[ns]"))
+    if period == "W":
+        codes = codes * 7 - _WEEK_SHIFT
+    return pd.DatetimeIndex(codes.astype("datetime64[D]").astype("datetime64[ns]"))
+
+
+######################################
+# 2. Cohort Accumulator
+######################################
+
+class CohortAccumulator:
+    """
+        Distinct invoices and TotalPrice of every (customer, period) of cleaned transactions.
+        Chunks are folded in with update in file order, partial accumulators are combined with merge (other holding
+        the rows that follow self's). Memory grows with the number of (customer, period) pairs, not with the number of
+        invoices or transaction rows.
+    """
+
+    def __init__(self, period="M", customer_col="Customer ID"):
+        self.period = period
+        self.customer_col = customer_col
+        # (customer, period, orders, revenue) frame of every chunk, grouped once by matrices
+        self.parts = []
+        # first and last (customer, period, invoice) folded in : the invoices that can span a chunk boundary
+        self.head = self.tail = None
+
+    def update(self, chunk):
+        if len(chunk) == 0:
+            return self
+        customers, customer_ids = pd.factorize(chunk[self.customer_col])
+        invoices, invoice_ids = pd.factorize(chunk["Invoice"])
+        periods = period_codes(chunk["InvoiceDate"], self.period)
+        first_period = periods.min()
+        n_periods = periods.max() - first_period + 1
+
+        pair_key = customers.astype("int64") * n_periods + (periods - first_period)
+        pairs, pair_keys = pd.factorize(pair_key)
+        triples, _ = pd.factorize(pair_key * len(invoice_ids) + invoices)
+        # (customer, period) pair of every distinct invoice, and a row of every pair
+        triple_pairs = np.empty(triples.max() + 1, dtype="int64")
+        triple_pairs[triples] = pairs
+        rows = np.empty(len(pair_keys), dtype="int64")
+        rows[pairs] = np.arange(len(pairs))
+
+        customer_ids = np.asarray(customer_ids)
+        invoice_ids = np.asarray(invoice_ids, dtype=object)
+        part = pd.DataFrame({"customer": customer_ids[customers[rows]],
+                             "period": periods[rows],
+                             "orders": np.bincount(triple_pairs, minlength=len(pair_keys)),
+                             "revenue": np.bincount(pairs, weights=chunk["TotalPrice"].to_numpy(dtype="float64"),
+                                                    minlength=len(pair_keys))})
+        head = (customer_ids[customers[0]], periods[0], invoice_ids[invoices[0]])
+        tail = (customer_ids[customers[-1]], periods[-1], invoice_ids[invoices[-1]])
+        self._fold([part], head, tail)
+        return self
+
+    def merge(self, other):
+        if other.parts:
+            self._fold(other.parts, other.head, other.tail)
+        return self
+
+    def _fold(self, parts, head, tail):
+        if head == self.tail:
+            # the invoice continues from the previous rows, it is already counted
+            first = parts[0].copy()
+            first.loc[(first["customer"] == head[0]) & (first["period"] == head[1]), "orders"] -= 1
+            parts = [first] + parts[1:]
+        self.head = self.head or head
+        self.tail = tail
+        self.parts.extend(parts)
+
+    def matrices(self):
+        """
+            retention, revenue and average_order cohort x offset matrices, plus the cohort sizes
+            (all empty if no transaction was folded in).
+        """
+
+        if not self.parts:
+            return _empty_matrices()
+        return _cohort_matrices(pd.concat(self.parts, ignore_index=True), self.period)
+
+
+######################################
+# 3. Cohort Matrices
+######################################
+
+def _empty_matrices():
+    index = pd.DatetimeIndex([], dtype="datetime64[ns]", name="cohort")
+    columns = pd.RangeIndex(0, name="offset")
+    matrices = {name: pd.DataFrame(index=index, columns=columns, dtype="float64")
+                for name in ("retention", "revenue", "average_order")}
+    return {"cohort_size": pd.Series(index=index, dtype="int64", name="cohort_size"), **matrices}
+
+
+def _cohort_matrices(pairs, period):
+    # a (customer, period) can have a row in several chunks, its orders and revenue are added up
+    customers, _ = pd.factorize(pairs["customer"])
+    periods = pairs["period"].to_numpy(dtype="int64")
+
+    # acquisition period of every customer
+    first_period = np.full(customers.max() + 1, np.iinfo("int64").max)
+    np.minimum.at(first_period, customers, periods)
+    cohort_labels, cohort_codes = np.unique(first_period, return_inverse=True)
+    offsets = periods - first_period[customers]
+    n_offsets = offsets.max() + 1
+    n_cells = len(cohort_labels) * n_offsets
+    cells = cohort_codes[customers] * n_offsets + offsets
+
+    # distinct invoices and revenue of every cell, every distinct (customer, period) is one active customer
+    orders = np.bincount(cells, weights=pairs["orders"].to_numpy(dtype="float64"), minlength=n_cells)
+    revenue = np.bincount(cells, weights=pairs["revenue"].to_numpy(), minlength=n_cells)
+    _, active_rows = np.unique(customers.astype("int64") * n_offsets + offsets, return_index=True)
+    active = np.bincount(cells[active_rows], minlength=n_cells)
+
+    shape = (len(cohort_labels), n_offsets)
+    orders, revenue, active = orders.reshape(shape), revenue.reshape(shape), active.reshape(shape)
+    sizes = active[:, 0]
+    index = period_starts(cohort_labels, period).rename("cohort")
+    columns = pd.RangeIndex(n_offsets, name="offset")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average_order = np.where(orders > 0, revenue / orders, np.nan)
+    return {"cohort_size": pd.Series(sizes, index=index, name="cohort_size"),
+            "retention": pd.DataFrame(active / sizes[:, None], index=index, columns=columns),
+            "revenue": pd.DataFrame(revenue, index=index, columns=columns),
+            "average_order": pd.DataFrame(average_order, index=index, columns=columns)}
+
+
+def cohort_matrices(dataframe, period="M", customer_col="Customer ID"):
+    """
+        Cohort size and the retention, revenue and average_order matrices (cohort x period offset)
+        of raw transactions, cleaned like create_rfm. Offsets a cohort has not reached yet are 0 (NaN for average_order).
+    """
+
+    return CohortAccumulator(period, customer_col).update(prepare_rfm(dataframe)).matrices()
+
+
+def stream_cohorts(path, period="M", chunksize=CHUNKSIZE, customer_col="Customer ID"):
+    """
+        cohort_matrices of a Parquet or CSV file, computed chunk by chunk.
+    """
+
+    accumulator = CohortAccumulator(period, customer_col)
+    for chunk in read_chunks(path, chunksize):
+        accumulator.update(prepare_rfm(chunk))
+    return accumulator.matrices()
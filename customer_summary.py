@@ -0,0 +1,104 @@
+######################################
+# Customer Summary Kernel
+######################################
+# RFM, CLTV and CLTV Prediction all start from the same per-customer facts:
+# first purchase date, last purchase date, number of invoices, total units and total price.
+# These facts are built here in a single groupby pass with pandas' built-in (cythonized) aggregations
+# instead of one Python lambda per customer and per column.
+
+# 1. Customer Summary
+# 2. RFM Metrics
+# 3. CLTV Metrics
+# 4. Lifetime Data Structure
+# 5. Lifetime Data for BG-NBD & Gamma-Gamma
+
+# dtypes of the customer_summary columns on the typed transactions (Customer ID is a float64 index)
+SUMMARY_DTYPES = {"first_date": "datetime64[ns]",
+                  "last_date": "datetime64[ns]",
+                  "n_invoices": "int64",
+                  "total_unit": "int64",
+                  "total_price": "float64"}
+
+
+######################################
+# 1. Customer Summary
+######################################
+
+def customer_summary(dataframe, customer_col="Customer ID"):
+    """
+        Builds the per-customer summary table in one vectorized pass.
+        Returns first_date, last_date, n_invoices, total_unit and total_price indexed by customer.
+        Expects a cleaned dataframe that already has the TotalPrice column.
+    """
+
+    return dataframe.groupby(customer_col).agg(first_date=("InvoiceDate", "min"),
+                                               last_date=("InvoiceDate", "max"),
+                                               n_invoices=("Invoice", "nunique"),
+                                               total_unit=("Quantity", "sum"),
+                                               total_price=("TotalPrice", "sum"))
+
+
+######################################
+# 2. RFM Metrics
+######################################
+
+def rfm_metrics(summary, today_date):
+    """
+        Derives recency, frequency and monetary from a customer summary.
+        Same values as the lambda based groupby in create_rfm.
+    """
+
+    rfm = summary[["n_invoices", "total_price"]].copy()
+    rfm.insert(0, "recency", (today_date - summary["last_date"]).dt.days)
+    rfm.columns = ["recency", "frequency", "monetary"]
+    return rfm
+
+
+######################################
+# 3. CLTV Metrics
+######################################
+
+def cltv_metrics(summary):
+    """
+        Derives total_transaction, total_unit and total_price from a customer summary.
+        Same values as the lambda based groupby in create_cltv_calculation.
+    """
+
+    cltv_c = summary[["n_invoices", "total_unit", "total_price"]].copy()
+    cltv_c.columns = ["total_transaction", "total_unit", "total_price"]
+    return cltv_c
+
+
+######################################
+# 4. Lifetime Data Structure
+######################################
+
+def lifetime_metrics(summary, today_date):
+    """
+        Derives recency, T, frequency and monetary (in days and totals) from a customer summary.
+        Same values as the lambda based groupby in create_cltv_p, before the weekly and per-purchase conversions.
+    """
+
+    cltv_df = summary[["n_invoices", "total_price"]].copy()
+    cltv_df.insert(0, "T", (today_date - summary["first_date"]).dt.days)
+    cltv_df.insert(0, "recency", (summary["last_date"] - summary["first_date"]).dt.days)
+    cltv_df.columns = ["recency", "T", "frequency", "monetary"]
+    return cltv_df
+
+
+######################################
+# 5. Lifetime Data for BG-NBD & Gamma-Gamma
+######################################
+
+def lifetime_data(summary, today_date):
+    """
+        Builds the weekly recency, T, frequency and average monetary frame that create_cltv_p fits the models on.
+        Only customers with more than one purchase are kept.
+    """
+
+    cltv_df = lifetime_metrics(summary, today_date)
+    cltv_df['monetary'] = cltv_df['monetary'] / cltv_df['frequency']
+    cltv_df = cltv_df[(cltv_df['frequency'] > 1)].copy()
+    cltv_df['recency'] = cltv_df['recency'] / 7
+    cltv_df['T'] = cltv_df['T'] / 7
+    return cltv_df
@@ -0,0 +1,231 @@
+######################################
+# Partitioned Segment Export
+######################################
+# The pipelines write their results with a single to_csv call (rfm.csv, cltv_prediction.csv, ...), which is slow and
+# large for millions of customers, and a consumer that only needs one segment has to parse the whole file.
+# Here a result frame is written as one directory per segment :
+#   <path>/<segment>/part-00000.parquet   (zstd compressed, row groups of chunk_rows rows)
+#   <path>/<segment>/part-00000.csv[.gz]  (csv mode, written chunk by chunk)
+#   <path>/__missing__/part-00000.*       (rows without a segment, if any)
+#   <path>/_manifest.json                 (format, columns, and the directory, files and rows of every segment
+#                                          and, under "missing", of the rows without a segment)
+# Segment names are made file system safe; names that end up on the same directory get a numbered suffix
+# (champions, champions-1, ...), the manifest records the directory of every segment.
+# Rows are grouped by segment with one stable argsort of the segment codes, large segments are split into several
+# part files, and the part files are written concurrently in a thread pool (Arrow releases the GIL while encoding).
+# The export is written to a temporary directory and moved into place, so readers never see a partial export.
+# An existing directory at the path is only replaced if it is a previous export (it holds a _manifest.json).
+# read_segment reads the files of one segment only.
+
+# 1. Partitioning
+# 2. Writing Part Files
+# 3. Export
+# 4. Reading Segments
+
+import datetime as dt
+import gzip
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 100_000
+ROWS_PER_FILE = 1_000_000
+MANIFEST = "_manifest.json"
+# directory of the rows without a segment (sanitized names never start with "_")
+MISSING_DIRECTORY = "__missing__"
+
+
+######################################
+# 1. Partitioning
+######################################
+
+def segment_directory(segment):
+    """
+        File system safe directory name of a segment.
+    """
+
+    return re.sub(r"[^0-9A-Za-z_-]+", "_", str(segment)).strip("_") or "_"
+
+
+def segment_directories(segments):
+    """
+        {segment: directory} with a distinct directory per segment : names that sanitize to the same directory
+        (also when only the case differs) get a numbered suffix.
+    """
+
+    directories, used = {}, set()
+    for segment in segments:
+        base = directory = segment_directory(segment)
+        i = 0
+        while directory.lower() in used:
+            i += 1
+            directory = f"{base}-{i}"
+        used.add(directory.lower())
+        directories[segment] = directory
+    return directories
+
+
+def segment_slices(frame, segment_col="segment"):
+    """
+        Rows of every segment as {segment: row positions}, from one stable argsort of the segment codes
+        (rows keep their order inside a segment, empty categories are skipped).
+        Rows without a segment are returned under the None key.
+    """
+
+    codes, segments = pd.factorize(frame[segment_col], sort=True)
+    order = np.argsort(codes, kind="stable")
+    # missing segments have code -1 and sort first
+    bounds = np.searchsorted(codes[order], np.arange(-1, len(segments) + 1))
+    slices = {segment: order[bounds[i + 1]:bounds[i + 2]] for i, segment in enumerate(segments)}
+    if bounds[1] > 0:
+        slices[None] = order[:bounds[1]]
+    return slices
+
+
+######################################
+# 2. Writing Part Files
+######################################
+
+def _write_part(write, frame, rows, path, chunk_rows, compression):
+    write(frame.take(rows), path, chunk_rows, compression)
+
+
+def _write_parquet(part, path, chunk_rows, compression):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(part, preserve_index=part.index.name is not None)
+    pq.write_table(table, path, row_group_size=chunk_rows, compression=compression)
+
+
+def _write_csv(part, path, chunk_rows, compression):
+    # chunk by chunk, so the whole part is never formatted as one string
+    opener = gzip.open if compression == "gzip" else open
+    with opener(path, "wt", newline="") as file:
+        for start in range(0, max(len(part), 1), chunk_rows):
+            part.iloc[start:start + chunk_rows].to_csv(file, header=start == 0, index=part.index.name is not None)
+
+
+WRITERS = {"parquet": (_write_parquet, ".parquet"),
+           "csv": (_write_csv, ".csv")}
+
+
+######################################
+# 3. Export
+######################################
+
+def export_segments(frame, path, segment_col="segment", format="parquet", compression=None, chunk_rows=CHUNK_ROWS,
+                    rows_per_file=ROWS_PER_FILE, max_workers=None):
+    """
+        Writes a result frame (create_rfm, create_cltv_calculation, create_cltv_p, ...) partitioned by segment and
+        returns the manifest. format is "parquet" (compression defaults to zstd) or "csv" (compression None or "gzip").
+        An unnamed index is dropped, a named one (e.g. Customer ID) is kept.
+        An existing directory at path is replaced only if it holds a previous export, FileExistsError otherwise.
+    """
+
+    if os.path.lexists(path) and not os.path.isfile(os.path.join(path, MANIFEST)):
+        raise FileExistsError(f"{path} exists and is not a segment export, not replacing it")
+
+    write, extension = WRITERS[format]
+    if format == "parquet":
+        compression = compression or "zstd"
+    elif compression == "gzip":
+        extension += ".gz"
+    if frame.index.name is None:
+        frame = frame.reset_index(drop=True)
+
+    tmp = f"{path.rstrip(os.sep)}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tasks, manifest = [], {"format": format, "compression": compression, "segment_col": segment_col,
+                           "index": frame.index.name, "columns": list(frame.columns),
+                           "created_at": dt.datetime.now().isoformat(timespec="seconds"), "segments": {},
+                           "missing": None}
+    slices = segment_slices(frame, segment_col)
+    directories = segment_directories(segment for segment in slices if segment is not None)
+    for segment, rows in slices.items():
+        directory = MISSING_DIRECTORY if segment is None else directories[segment]
+        os.makedirs(os.path.join(tmp, directory))
+        files = []
+        for i, start in enumerate(range(0, len(rows), rows_per_file)):
+            files.append(f"part-{i:05d}{extension}")
+            tasks.append((rows[start:start + rows_per_file], os.path.join(tmp, directory, files[-1])))
+        entry = {"directory": directory, "files": files, "rows": len(rows)}
+        if segment is None:
+            manifest["missing"] = entry
+        else:
+            manifest["segments"][str(segment)] = entry
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_write_part, write, frame, rows, file, chunk_rows, compression)
+                   for rows, file in tasks]
+        for future in futures:
+            future.result()
+
+    with open(os.path.join(tmp, MANIFEST), "w") as file:
+        json.dump(manifest, file, indent=2)
+    if os.path.lexists(path):
+        if not os.path.isfile(os.path.join(path, MANIFEST)):
+            shutil.rmtree(tmp)
+            raise FileExistsError(f"{path} exists and is not a segment export, not replacing it")
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    return manifest
+
+
+def write_csv_chunks(frame, path, chunk_rows=CHUNK_ROWS, compression=None):
+    """
+        Single file CSV export like to_csv, formatted and written chunk by chunk ("gzip" compression optional).
+    """
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    _write_csv(frame, tmp, chunk_rows, compression)
+    os.replace(tmp, path)
+    return path
+
+
+######################################
+# 4. Reading Segments
+######################################
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST)) as file:
+        return json.load(file)
+
+
+def _read_part(file, manifest, columns):
+    if manifest["format"] == "parquet":
+        return pd.read_parquet(file, columns=columns)
+    index = manifest["index"]
+    usecols = None if columns is None else ([index] if index else []) + list(columns)
+    part = pd.read_csv(file, usecols=usecols)
+    return part.set_index(index) if index else part
+
+
+def read_segment(path, segment, columns=None):
+    """
+        Rows of one segment of an export_segments directory; the files of the other segments are not opened.
+        segment=None reads the rows without a segment.
+    """
+
+    manifest = read_manifest(path)
+    entry = manifest.get("missing") if segment is None else manifest["segments"][str(segment)]
+    if entry is None:
+        raise KeyError(segment)
+    files = [os.path.join(path, entry["directory"], name) for name in entry["files"]]
+    parts = [_read_part(file, manifest, columns) for file in files]
+    return pd.concat(parts) if len(parts) > 1 else parts[0]
+
+
+def read_segments(path, segments=None, columns=None):
+    """
+        Rows of the given segments (all by default, with the rows without a segment) of an export_segments directory.
+    """
+
+    manifest = read_manifest(path)
+    if segments is None:
+        segments = list(manifest["segments"]) + ([None] if manifest.get("missing") else [])
+    return pd.concat([read_segment(path, segment, columns) for segment in segments])
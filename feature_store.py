@@ -0,0 +1,197 @@
+######################################
+# Memory-Mapped Customer Feature Store
+######################################
+# After a run, looking up one customer's RFM metrics, segment, expected purchases or clv means loading a whole
+# result CSV into pandas. Here the result frames of create_rfm / create_cltv_p are written as a column store :
+#   <path>/customer_id.npy      sorted int64 customer ids
+#   <path>/<column>.npy         one fixed-width NumPy array per column, in customer id order
+#                               (segments are stored as small integer codes, -1 for a customer without one)
+#   <path>/_store.json          columns, their dtypes and the segment categories
+# Columns are named <frame>_<column> after the frames they come from (rfm_segment, cltv_clv, ...).
+# Opening the store memory-maps the arrays (np.load(mmap_mode="r")) : nothing is read until a lookup touches it,
+# and processes opening the same store share the pages of the OS cache instead of holding copies.
+# A lookup is a binary search (searchsorted) in the sorted ids, a batch of ids is looked up with one vectorized search.
+#   write_feature_store("store", {"rfm": create_rfm(df), "cltv": create_cltv_p(df)})
+#   FeatureStore("store").lookup(12347)
+
+# 1. Writing the Store
+# 2. Reading the Store
+
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+IDS = "customer_id"
+META = "_store.json"
+
+
+######################################
+# 1. Writing the Store
+######################################
+
+def _customer_ids(frame, customer_col):
+    ids = frame.index if customer_col not in frame.columns else frame[customer_col]
+    ids = np.asarray(ids, dtype="float64")
+    if np.isnan(ids).any() or (ids != np.floor(ids)).any():
+        raise ValueError(f"{customer_col} must hold integer customer ids")
+    return ids.astype("int64")
+
+
+def _store_column(values, rows, n_rows):
+    # values of the frame's customers placed at their rows of the store, missing customers filled
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categories = [str(category) for category in values.cat.categories]
+        column = np.full(n_rows, -1, dtype=np.min_scalar_type(-len(categories)))
+        column[rows] = values.cat.codes.to_numpy()
+        return column, categories
+    if values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+        return _store_column(values.astype("category"), rows, n_rows)
+
+    values = values.to_numpy()
+    if len(rows) < n_rows and values.dtype.kind in "iub":
+        values = values.astype("float64")
+    column = np.empty(n_rows, dtype=values.dtype)
+    if values.dtype.kind in "fc":
+        column.fill(np.nan)
+    elif values.dtype.kind in "mM":
+        column.fill(np.datetime64("NaT"))
+    column[rows] = values
+    return column, None
+
+
+def _check_replaceable(path):
+    if os.path.lexists(path) and not os.path.isfile(os.path.join(path, META)):
+        raise FileExistsError(f"{path} exists and is not a feature store, not replacing it")
+
+
+def write_feature_store(path, frames, customer_col="Customer ID"):
+    """
+        Writes result frames ({"rfm": create_rfm(...), "cltv": create_cltv_p(...)}) as one memory-mapped store.
+        Customer ids are read from the customer_col column or, if there is none, the index.
+        Customers missing from a frame get NaN (its integer columns are stored as floats) or segment code -1.
+        An existing directory at path is replaced only if it holds a previous store, FileExistsError otherwise.
+    """
+
+    _check_replaceable(path)
+    ids = {name: _customer_ids(frame, customer_col) for name, frame in frames.items()}
+    customer_id = np.sort(pd.unique(np.concatenate(list(ids.values()))))
+    # hash lookups of the frames' (unsorted) ids, faster than a binary search per id when writing
+    store_index = pd.Index(customer_id)
+
+    tmp = f"{path.rstrip(os.sep)}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, IDS + ".npy"), customer_id)
+
+    columns = {}
+    for name, frame in frames.items():
+        if not pd.Index(ids[name]).is_unique:
+            raise ValueError(f"duplicate {customer_col} in frame {name!r}")
+        rows = store_index.get_indexer(ids[name])
+        for col in frame.columns.drop(customer_col, errors="ignore"):
+            column, categories = _store_column(frame[col], rows, len(customer_id))
+            key = f"{name}_{col}"
+            np.save(os.path.join(tmp, key + ".npy"), column)
+            columns[key] = {"dtype": column.dtype.str, "categories": categories}
+
+    with open(os.path.join(tmp, META), "w") as file:
+        json.dump({"rows": len(customer_id), "customer_col": customer_col, "columns": columns}, file, indent=2)
+    try:
+        _check_replaceable(path)
+    except FileExistsError:
+        shutil.rmtree(tmp)
+        raise
+    if os.path.lexists(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    return path
+
+
+######################################
+# 2. Reading the Store
+######################################
+
+class FeatureStore:
+    """
+        Read-only, memory-mapped view of a write_feature_store directory.
+        lookup(customer_id) returns one customer as a dict, lookup_many(customer_ids) a DataFrame.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, META)) as file:
+            meta = json.load(file)
+        self.path = path
+        self.customer_col = meta["customer_col"]
+        self.categories = {col: info["categories"] for col, info in meta["columns"].items() if info["categories"]}
+        self.customer_id = np.load(os.path.join(path, IDS + ".npy"), mmap_mode="r")
+        self.arrays = {col: np.load(os.path.join(path, col + ".npy"), mmap_mode="r") for col in meta["columns"]}
+
+    @property
+    def columns(self):
+        return list(self.arrays)
+
+    def __len__(self):
+        return len(self.customer_id)
+
+    def __contains__(self, customer_id):
+        return bool(self.positions([customer_id])[1][0])
+
+    def positions(self, customer_ids):
+        """
+            Rows of the given customer ids and whether each id is in the store (binary search in the sorted ids).
+        """
+
+        customer_ids = np.asarray(customer_ids, dtype="int64")
+        rows = np.searchsorted(self.customer_id, customer_ids)
+        found = rows < len(self.customer_id)
+        found[found] = self.customer_id[rows[found]] == customer_ids[found]
+        return rows, found
+
+    def _decode(self, col, values):
+        if col not in self.categories:
+            return values
+        return pd.Categorical.from_codes(values, self.categories[col])
+
+    def lookup(self, customer_id, columns=None):
+        """
+            Columns of one customer as a dict (segments as labels, None for a missing one, dates as pd.Timestamp);
+            KeyError if unknown.
+        """
+
+        rows, found = self.positions([customer_id])
+        if not found[0]:
+            raise KeyError(customer_id)
+        row = rows[0]
+        result = {self.customer_col: int(self.customer_id[row])}
+        for col in columns or self.arrays:
+            value = self.arrays[col][row]
+            if col in self.categories:
+                result[col] = self.categories[col][value] if value >= 0 else None
+            elif value.dtype.kind == "M":
+                result[col] = pd.Timestamp(value)
+            elif value.dtype.kind == "m":
+                result[col] = pd.Timedelta(value)
+            else:
+                result[col] = value.item()
+        return result
+
+    def lookup_many(self, customer_ids, columns=None):
+        """
+            Columns of a batch of customers as a DataFrame indexed by customer id, in the order given.
+            Ids that are not in the store are left out.
+        """
+
+        rows, found = self.positions(customer_ids)
+        rows = rows[found]
+        data = {col: self._decode(col, self.arrays[col][rows]) for col in columns or self.arrays}
+        return pd.DataFrame(data, index=pd.Index(self.customer_id[rows], name=self.customer_col))
+
+    def column(self, col):
+        """
+            Whole column in customer id order (segments decoded), indexed by customer id.
+        """
+
+        return pd.Series(self._decode(col, self.arrays[col]), index=pd.Index(self.customer_id, name=self.customer_col),
+                         name=col)
@@ -0,0 +1,151 @@
+######################################
+# Shared Customer Feature Table
+######################################
+# create_rfm, create_cltv_calculation and create_cltv_p each clean the raw transactions their own way and run
+# their own groupby, although they need almost the same per-customer facts.
+# Here the transactions are scanned once : the three cleanings are nested row masks
+# (kept rows -> purchases with Quantity > 0 -> priced purchases with Price > 0, outlier capped),
+# every fact is aggregated over a masked copy of its column, and a single groupby builds one feature table.
+# Distinct invoices are counted once per (customer, invoice) pair instead of one nunique per pipeline.
+# The summaries of the three pipelines are column selections of that table, so the RFM frame, the
+# cltv_calculation frame and the BG-NBD / Gamma-Gamma lifetime frame cost one scan instead of three.
+
+# 1. Feature Table
+# 2. Pipeline Views
+
+import datetime as dt
+import numpy as np
+import pandas as pd
+from customer_summary import rfm_metrics, cltv_metrics, lifetime_data
+from instrumentation import stage
+from preprocessing import clean_mask, OutlierCapper
+
+# feature columns behind the customer_summary columns each pipeline uses
+# (the first one counts the customer's invoices, customers without any are not part of the view)
+FEATURE_VIEWS = {"rfm": {"n_invoices": "n_invoices",
+                         "last_date": "last_date",
+                         "total_price": "total_price"},
+                 "cltv_calculation": {"purchase_invoices": "n_invoices",
+                                      "purchase_units": "total_unit",
+                                      "purchase_price": "total_price"},
+                 "cltv_prediction": {"priced_invoices": "n_invoices",
+                                     "priced_first_date": "first_date",
+                                     "priced_last_date": "last_date",
+                                     "priced_price": "total_price"}}
+
+FEATURE_DTYPES = {"n_invoices": "int64",
+                  "last_date": "datetime64[ns]",
+                  "total_price": "float64",
+                  "purchase_invoices": "int64",
+                  "purchase_units": "int64",
+                  "purchase_price": "float64",
+                  "priced_invoices": "int64",
+                  "priced_first_date": "datetime64[ns]",
+                  "priced_last_date": "datetime64[ns]",
+                  "priced_price": "float64"}
+
+
+######################################
+# 1. Feature Table
+######################################
+
+def customer_features(dataframe, capper=None, customer_col="Customer ID"):
+    """
+        Per-customer facts of the three pipelines from one scan of the raw transactions :
+        last_date, n_invoices, total_price of the kept rows (prepare_rfm),
+        purchase_invoices, purchase_units, purchase_price of the rows with Quantity > 0 (prepare_cltv),
+        priced_first_date, priced_last_date, priced_invoices, priced_price of the rows that also have Price > 0,
+        with Quantity and Price outlier capped (filter_cltv_p + OutlierCapper).
+        A fitted capper is reused, an unfitted one is fitted on the priced purchases in place.
+        Without any kept row the table is empty (and an unfitted capper stays unfitted).
+    """
+
+    kept = dataframe.take(np.flatnonzero(clean_mask(dataframe)))
+    if kept.empty:
+        features = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in FEATURE_DTYPES.items()})
+        features.index = pd.Index([], dtype=kept[customer_col].dtype, name=customer_col)
+        return features
+
+    purchase = (kept["Quantity"] > 0).to_numpy()
+    priced = purchase & (kept["Price"] > 0).to_numpy()
+
+    capper = capper if capper is not None else OutlierCapper()
+    if not capper.is_fitted:
+        capper.fit(kept.loc[priced, list(capper.columns)])
+    quantity_limits, price_limits = capper.limits_["Quantity"], capper.limits_["Price"]
+    # same operations as cap_outliers, on every kept row
+    capped_price = (np.clip(kept["Quantity"].to_numpy(dtype="float64"), *quantity_limits)
+                    * np.clip(kept["Price"].to_numpy(), *price_limits))
+
+    # distinct invoices : each (customer, invoice) pair is numbered once and counted for every mask it has a row in
+    customers, customer_ids = pd.factorize(kept[customer_col], sort=True)
+    invoices, _ = pd.factorize(kept["Invoice"])
+    pairs, _ = pd.factorize(customers.astype("int64") * (int(invoices.max()) + 1) + invoices)
+    pair_customer = np.empty(pairs.max() + 1, dtype="int64")
+    pair_customer[pairs] = customers
+
+    def invoice_count(mask):
+        has_row = np.zeros(len(pair_customer), dtype=bool)
+        has_row[pairs[mask]] = True
+        return np.bincount(pair_customer[has_row], minlength=customers.max() + 1)
+
+    # masked copies : a date outside the mask is missing, a unit or price is 0
+    total_price = kept["Quantity"] * kept["Price"]
+    facts = pd.DataFrame({"date": kept["InvoiceDate"],
+                          "total_price": total_price,
+                          "purchase_unit": kept["Quantity"].where(purchase, 0),
+                          "purchase_price": total_price.where(purchase, 0.0),
+                          "priced_date": kept["InvoiceDate"].where(priced),
+                          "priced_price": np.where(priced, capped_price, 0.0)})
+
+    # grouped by the customer codes, which are already factorized (sorted like the customer ids)
+    features = facts.groupby(customers).agg(last_date=("date", "max"),
+                                            total_price=("total_price", "sum"),
+                                            purchase_units=("purchase_unit", "sum"),
+                                            purchase_price=("purchase_price", "sum"),
+                                            priced_first_date=("priced_date", "min"),
+                                            priced_last_date=("priced_date", "max"),
+                                            priced_price=("priced_price", "sum"))
+    features.index = pd.Index(customer_ids, name=customer_col)
+    features.insert(0, "n_invoices", invoice_count(np.ones(len(kept), dtype=bool)))
+    features.insert(3, "purchase_invoices", invoice_count(purchase))
+    features.insert(6, "priced_invoices", invoice_count(priced))
+    return features
+
+
+######################################
+# 2. Pipeline Views
+######################################
+
+def feature_summary(features, pipeline):
+    """
+        The customer_summary columns of the given pipeline ("rfm", "cltv_calculation" or "cltv_prediction"),
+        selected from a customer_features table.
+    """
+
+    columns = FEATURE_VIEWS[pipeline]
+    invoices = next(iter(columns))
+    summary = features.loc[(features[invoices] > 0).to_numpy(), list(columns)]
+    return summary.rename(columns=columns)
+
+
+def customer_frames(dataframe, rfm_date=dt.datetime(2010, 12, 11), lifetime_date=dt.datetime(2011, 12, 11),
+                    capper=None, customer_col="Customer ID"):
+    """
+        The metric frames of the three pipelines from one customer_features scan :
+        "rfm" (recency, frequency, monetary of create_rfm as of rfm_date, customers with positive monetary),
+        "cltv_calculation" (total_transaction, total_unit, total_price of create_cltv_calculation) and
+        "lifetime" (weekly recency, T, frequency, monetary as of lifetime_date that create_cltv_p fits the models on).
+        The default dates are the ones create_rfm and create_cltv_p use.
+    """
+
+    with stage("features", "customer_features", rows_in=len(dataframe)) as step:
+        features = customer_features(dataframe, capper, customer_col)
+        step.rows_out = len(features)
+
+    with stage("features", "views", rows_in=len(features)):
+        rfm = rfm_metrics(feature_summary(features, "rfm"), rfm_date)
+        frames = {"rfm": rfm[rfm["monetary"] > 0],
+                  "cltv_calculation": cltv_metrics(feature_summary(features, "cltv_calculation")),
+                  "lifetime": lifetime_data(feature_summary(features, "cltv_prediction"), lifetime_date)}
+    return frames
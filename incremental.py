@@ -0,0 +1,152 @@
+######################################
+# Incremental RFM with Daily Delta Updates
+######################################
+# The RFM analysis should be repeated periodically and the changes in the segments reported.
+# Instead of recomputing create_rfm over the whole history, a per-customer RFM state is persisted
+# and only the new day's transactions are folded into it. Recency is re-derived from the stored last purchase date,
+# customers are re-scored & re-segmented and a from-segment -> to-segment migration matrix is produced.
+# A daily run costs one aggregation over the delta plus a pass over the customer table.
+# Top-k rankings of the state (e.g. the 10 largest monetary values) can be tracked and are updated from the delta's
+# customers only (ranking.TopK).
+
+# 1. Delta Preparation
+# 2. RFM State
+# 3. Segment Migration
+
+import pandas as pd
+from customer_summary import customer_summary
+from preprocessing import prepare_rfm
+from ranking import TopK
+from segmentation import rfm_scores, rfm_segments
+
+STATE_DTYPES = {"first_date": "datetime64[ns]",
+                "last_date": "datetime64[ns]",
+                "frequency": "int64",
+                "monetary": "float64",
+                "segment": "object"}
+
+
+######################################
+# 1. Delta Preparation
+######################################
+
+def _delta_summary(dataframe):
+    summary = customer_summary(prepare_rfm(dataframe))
+    summary = summary[["first_date", "last_date", "n_invoices", "total_price"]]
+    summary.columns = ["first_date", "last_date", "frequency", "monetary"]
+    return summary
+
+
+######################################
+# 2. RFM State
+######################################
+
+class RFMState:
+    """
+        Persisted per-customer RFM state: first & last purchase date, number of invoices, total price and current segment.
+        Invoices of a daily delta are assumed to be new, complete invoices (an invoice is issued at a single timestamp).
+    """
+
+    def __init__(self, customers=None):
+        if customers is None:
+            customers = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in STATE_DTYPES.items()})
+            customers.index.name = "Customer ID"
+        self.customers = customers
+        self.top = {}
+
+    @classmethod
+    def from_transactions(cls, dataframe, today_date):
+        state = cls()
+        state.update(dataframe, today_date)
+        return state
+
+    @classmethod
+    def load(cls, path):
+        return cls(pd.read_parquet(path))
+
+    def save(self, path):
+        customers = self.customers.copy()
+        customers["segment"] = customers["segment"].astype("string")
+        customers.to_parquet(path)
+
+    def update(self, delta, today_date, csv=None):
+        """
+            Folds the delta transactions into the state, re-scores all customers as of today_date
+            and returns the segment migration matrix of this update (also written to csv if a path is given).
+        """
+
+        summary = _delta_summary(delta)
+        changed = summary.index
+        previous = self.customers["segment"]
+        customers = self.customers.reindex(self.customers.index.union(summary.index))
+        summary = summary.reindex(customers.index)
+
+        customers["first_date"] = pd.concat([customers["first_date"], summary["first_date"]], axis=1).min(axis=1)
+        customers["last_date"] = pd.concat([customers["last_date"], summary["last_date"]], axis=1).max(axis=1)
+        customers["frequency"] = customers["frequency"].fillna(0).add(summary["frequency"], fill_value=0).astype("int64")
+        customers["monetary"] = customers["monetary"].fillna(0).add(summary["monetary"], fill_value=0).astype("float64")
+
+        rfm = self.rfm_metrics(customers, today_date)
+        rfm = rfm[rfm["monetary"] > 0].copy()
+        rfm = rfm_scores(rfm)
+        customers["segment"] = rfm_segments(rfm).reindex(customers.index)
+
+        self.customers = customers
+        for column, ranking in self.top.items():
+            ranking.update(customers.loc[changed, column], customers[column])
+        return segment_migration(previous, customers["segment"], csv=csv)
+
+    def track_top(self, column, k=10, largest=True):
+        """
+            Starts tracking the top k customers of a state column (frequency, monetary, last_date, ...),
+            available as state.top[column].members and kept up to date by update.
+            Frequency and monetary only grow, so an update never needs more than the delta's customers.
+        """
+
+        self.top[column] = TopK(k, largest).fit(self.customers[column])
+        return self.top[column]
+
+    @staticmethod
+    def rfm_metrics(customers, today_date):
+        rfm = customers[["frequency", "monetary"]].copy()
+        rfm.insert(0, "recency", (today_date - customers["last_date"]).dt.days)
+        return rfm
+
+    def rfm(self, today_date):
+        """
+            Current recency, frequency, monetary and segment, in the shape create_rfm returns.
+        """
+
+        rfm = self.rfm_metrics(self.customers, today_date)
+        rfm["segment"] = self.customers["segment"]
+        rfm = rfm[rfm["segment"].notna()]
+        rfm.index = rfm.index.astype(int)
+        return rfm
+
+
+######################################
+# 3. Segment Migration
+######################################
+
+def _migration_labels(segments, customers, missing):
+    labels = segments.reindex(customers).astype("object")
+    labels[customers.isin(segments.index) & labels.isna()] = "unsegmented"
+    return labels.fillna(missing)
+
+
+def segment_migration(previous, current, csv=None):
+    """
+        Cross table of customer counts moving from one segment to another.
+        Customers missing from the previous state come from 'new', customers missing from the current one go to
+        'dropped'. Customers of a state without a segment there (monetary <= 0) are 'unsegmented'.
+    """
+
+    customers = previous.index.union(current.index)
+    from_segment = _migration_labels(previous, customers, "new").rename("from_segment")
+    to_segment = _migration_labels(current, customers, "dropped").rename("to_segment")
+    migration = pd.crosstab(from_segment, to_segment)
+
+    if csv:
+        migration.to_csv(csv)
+
+    return migration
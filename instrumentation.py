@@ -0,0 +1,230 @@
+######################################
+# Pipeline Stage Instrumentation
+######################################
+# The pipelines wrap their steps (loading, cleaning, aggregation, scoring, model fitting, export) in named stages.
+# For every stage a record with wall time, CPU time, peak RSS and rows in / out is passed to the registered callbacks.
+# With no callback registered a stage is a shared no-op context manager, so instrumentation costs next to nothing
+# when it is off.
+# The peak RSS of a stage is sampled without changing process state : when the stage raised the process high-water
+# mark (VmHWM) the new mark is its exact peak, otherwise the larger of the RSS at its start and end (and of its inner
+# stages' peaks) is reported, a lower bound. Where /proc is missing it is the peak of the whole process so far.
+# reset_peak_per_stage() opts in to exact per-stage peaks on Linux by resetting the high-water mark at every stage,
+# at the price of the process-wide peak (VmHWM, ru_maxrss) only covering the time since the last stage started.
+#
+#   from instrumentation import add_callback, JSONLinesSink
+#   add_callback(JSONLinesSink("stages.jsonl"))   # or add_callback(log_sink) / add_callback(print)
+
+# 1. Callbacks & Sinks
+# 2. Peak RSS
+# 3. Stages
+
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+_CALLBACKS = []
+
+logger = logging.getLogger("crm_analytics.stages")
+
+
+######################################
+# 1. Callbacks & Sinks
+######################################
+
+def add_callback(callback):
+    """
+        Registers a callable that receives the record (a dict) of every finished stage.
+    """
+
+    _CALLBACKS.append(callback)
+    return callback
+
+
+def remove_callback(callback):
+    _CALLBACKS.remove(callback)
+
+
+@contextmanager
+def instrumented(*callbacks):
+    """
+        Registers the callbacks for the duration of a with block.
+    """
+
+    for callback in callbacks:
+        add_callback(callback)
+    try:
+        yield
+    finally:
+        for callback in callbacks:
+            remove_callback(callback)
+
+
+def log_sink(record):
+    """
+        Logs the record as JSON through the crm_analytics.stages logger; the record is also attached as record.stage.
+    """
+
+    logger.info(json.dumps(record), extra={"stage": record})
+
+
+class JSONLinesSink:
+    """
+        Appends one JSON line per stage record to a file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, record):
+        with open(self.path, "a") as file:
+            file.write(json.dumps(record) + "\n")
+
+
+######################################
+# 2. Peak RSS
+######################################
+
+_PROC_STATUS = "/proc/self/status"
+_PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+# high-water mark resets at every stage, off unless reset_peak_per_stage() is called
+_RESET_PEAK = False
+
+
+def reset_peak_per_stage(enabled=True):
+    """
+        Opt-in exact per-stage peak RSS on Linux : every stage resets the process high-water mark
+        (/proc/self/clear_refs). Side effect : VmHWM and ru_maxrss, and every peak RSS measured outside the stages
+        (e.g. benchmark.max_rss_mb), then only cover the time since the last stage started.
+    """
+
+    global _RESET_PEAK
+    _RESET_PEAK = enabled
+
+
+def _reset_peak_rss():
+    try:
+        with open(_PROC_CLEAR_REFS, "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _proc_status_mb(field):
+    if os.path.exists(_PROC_STATUS):
+        with open(_PROC_STATUS) as file:
+            for line in file:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    return None
+
+
+def rss_mb():
+    """
+        Current resident set size in MB (None where /proc is missing).
+    """
+
+    return _proc_status_mb("VmRSS")
+
+
+def peak_rss_mb():
+    """
+        High-water mark of the resident set size in MB (since the last reset, see reset_peak_per_stage).
+    """
+
+    peak = _proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        return None
+    # kilobytes on Linux, bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+######################################
+# 3. Stages
+######################################
+
+class _NullStage:
+    """
+        Stand-in for a stage when nothing listens : accepts rows_out and does nothing.
+    """
+
+    rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+# peak RSS seen by each open stage, innermost last
+_OPEN_PEAKS = []
+
+
+class _Stage:
+    def __init__(self, pipeline, name, rows_in):
+        self.pipeline = pipeline
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+
+    def __enter__(self):
+        if _RESET_PEAK:
+            # the peak of the enclosing stage so far is kept before the high-water mark is reset
+            if _OPEN_PEAKS:
+                _OPEN_PEAKS[-1] = max(_OPEN_PEAKS[-1], peak_rss_mb() or 0.0)
+            _reset_peak_rss()
+        self._peak = peak_rss_mb()
+        self._rss = rss_mb()
+        _OPEN_PEAKS.append(0.0)
+        self._started_at = time.time()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        peak = max(_OPEN_PEAKS.pop(), self._measured_peak())
+        if _OPEN_PEAKS:
+            _OPEN_PEAKS[-1] = max(_OPEN_PEAKS[-1], peak)
+        record = {"pipeline": self.pipeline, "stage": self.name, "started_at": self._started_at,
+                  "wall_seconds": wall, "cpu_seconds": cpu, "peak_rss_mb": peak,
+                  "rows_in": self.rows_in, "rows_out": self.rows_out,
+                  "error": exc_type.__name__ if exc_type else None}
+        for callback in list(_CALLBACKS):
+            callback(record)
+        return False
+
+    def _measured_peak(self):
+        peak, rss = peak_rss_mb(), rss_mb()
+        if _RESET_PEAK or rss is None or peak is None:
+            return peak or 0.0
+        if peak > self._peak:
+            return peak
+        return max(self._rss, rss)
+
+
+def stage(pipeline, name, rows_in=None):
+    """
+        Context manager around one step of a pipeline; set .rows_out on the returned object inside the block.
+            with stage("rfm", "summary", rows_in=len(dataframe)) as step:
+                summary = customer_summary(dataframe)
+                step.rows_out = len(summary)
+    """
+
+    if not _CALLBACKS:
+        return _NULL_STAGE
+    return _Stage(pipeline, name, rows_in)
@@ -0,0 +1,358 @@
+######################################
+# BG-NBD Model with Analytic Gradients
+######################################
+# lifetimes.BetaGeoFitter differentiates its log-likelihood with autograd, which dominates runtime
+# once there are hundreds of thousands of repeat customers. The same model is fitted here with a vectorized
+# NumPy/SciPy log-likelihood, its analytic gradient and log-space numerics (log-sum-exp of the two likelihood terms).
+# Parameters, penalizer, time scaling and optimizer follow lifetimes, so the estimates agree within tolerance,
+# and predict / conditional_expected_number_of_purchases_up_to_time have the same signature.
+# A fit can be warm-started from the parameters of the previous run.
+# Predictions for several horizons are made in one batch : a customers x horizons matrix in which the terms
+# that only depend on the customer are computed once. The Gamma-Gamma model computes CLTV from that same matrix
+# instead of re-evaluating the BG-NBD model twice per month.
+# Both models only depend on (frequency, recency, T) and (frequency, monetary), so customers can be compressed
+# into the distinct tuples, fitted with the tuple counts as weights and the per tuple results broadcast back.
+
+# 1. Log-Likelihood & Gradient
+# 2. BG-NBD Fitter
+# 3. Gamma-Gamma Fitter
+# 4. Batched Predictions & CLTV
+# 5. Distinct Customer Tuples
+
+import json
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+from scipy.special import gammaln, digamma, hyp2f1
+
+BGNBD_PARAMS = ["r", "alpha", "a", "b"]
+
+GAMMA_GAMMA_PARAMS = ["p", "q", "v"]
+
+# number of T units in a month
+FREQ_FACTORS = {"W": 4.345, "M": 1.0, "D": 30, "H": 30 * 24}
+
+# below this many customers grouping identical tuples costs more than it saves
+MIN_ROWS_TO_GROUP = 10_000
+
+
+class ConvergenceError(ValueError):
+    pass
+
+
+######################################
+# 1. Log-Likelihood & Gradient
+######################################
+
+def frequency_groups(frequency, weights):
+    """
+        Distinct frequencies, the position of each customer's frequency among them and their summed weights.
+    """
+
+    unique_x, inverse = np.unique(frequency, return_inverse=True)
+    return unique_x, inverse, np.bincount(inverse, weights=weights)
+
+
+def bgnbd_negative_log_likelihood(log_params, frequency, recency, T, weights, penalizer_coef, groups=None):
+    """
+        Penalized mean negative log-likelihood of the BG-NBD model and its gradient w.r.t. the log parameters.
+        The gamma function terms only depend on the integer frequency, so they are evaluated once per distinct
+        frequency and weighted by the number of customers having it; only the recency / T terms are per customer.
+    """
+
+    params = np.exp(log_params)
+    r, alpha, a, b = params
+    unique_x, inverse, unique_weights = groups or frequency_groups(frequency, weights)
+    b_x_1 = b + np.maximum(unique_x, 1) - 1
+
+    # terms of the integer frequency
+    A_12 = (gammaln(r + unique_x) - gammaln(r) + r * np.log(alpha)
+            + gammaln(a + b) + gammaln(b + unique_x) - gammaln(b) - gammaln(a + b + unique_x))
+    d_r = digamma(r + unique_x) - digamma(r) + np.log(alpha)
+    d_a = digamma(a + b) - digamma(a + b + unique_x)
+    d_b = d_a + digamma(b + unique_x) - digamma(b)
+    log_a_b_x_1 = np.where(unique_x > 0, np.log(a) - np.log(b_x_1), -np.inf)
+
+    # per customer terms : log(exp(A_3) + exp(A_4)) = A_3 + log(1 + exp(A_4 - A_3)), evaluated stably
+    r_x = r + frequency
+    alpha_T = alpha + T
+    alpha_rec = alpha + recency
+    log_alpha_T = np.log(alpha_T)
+    log_ratio = log_alpha_T - np.log(alpha_rec)
+    diff = r_x * log_ratio + log_a_b_x_1[inverse]
+    exp_neg = np.exp(-np.abs(diff))
+    log_sum = np.maximum(diff, 0) + np.log1p(exp_neg) - r_x * log_alpha_T
+
+    # share of the A_4 term in the likelihood (sigmoid of the difference)
+    weighted_w_4 = weights * np.where(diff > 0, 1.0, exp_neg) / (1 + exp_neg)
+
+    total = weights.sum()
+    ll = np.dot(unique_weights, A_12) + np.dot(weights, log_sum)
+    gradient = np.array([
+        np.dot(unique_weights, d_r) - np.dot(weights, log_alpha_T) + np.dot(weighted_w_4, log_ratio),
+        total * r / alpha - np.dot(weights * r_x, 1 / alpha_T) - np.dot(weighted_w_4 * r_x, 1 / alpha_rec - 1 / alpha_T),
+        np.dot(unique_weights, d_a) + weighted_w_4.sum() / a,
+        np.dot(unique_weights, d_b) - np.dot(np.bincount(inverse, weights=weighted_w_4, minlength=len(unique_x)), 1 / b_x_1),
+    ])
+
+    value = -ll / total + penalizer_coef * np.sum(params ** 2)
+    # chain rule through params = exp(log_params)
+    gradient = params * (-gradient / total + 2 * penalizer_coef * params)
+    return value, gradient
+
+
+######################################
+# 2. BG-NBD Fitter
+######################################
+
+class BGNBDFitter:
+    """
+        Drop-in replacement for lifetimes.BetaGeoFitter fit / predict.
+        initial_params is either a log-space starting point (as in lifetimes) or the params_ of a previous fit.
+        With warm_start=True a refit starts from the current params_ instead of the default starting point.
+    """
+
+    def __init__(self, penalizer_coef=0.0, warm_start=False):
+        self.penalizer_coef = penalizer_coef
+        self.warm_start = warm_start
+
+    def fit(self, frequency, recency, T, weights=None, initial_params=None, tol=1e-7, **kwargs):
+        frequency = np.asarray(frequency).astype(int).astype("float64")
+        recency = np.asarray(recency, dtype="float64")
+        T = np.asarray(T, dtype="float64")
+        weights = np.ones(len(frequency)) if weights is None else np.asarray(weights, dtype="float64")
+
+        # same time scaling as lifetimes: the oldest customer has age 1
+        scale = 1.0 / T.max()
+        if initial_params is None and self.warm_start and hasattr(self, "params_"):
+            initial_params = self.params_
+        if initial_params is None:
+            x0 = 0.1 * np.ones(4)
+        elif isinstance(initial_params, (pd.Series, dict)):
+            # fitted parameters of a previous run
+            params = pd.Series(initial_params, dtype="float64")[BGNBD_PARAMS]
+            params["alpha"] *= scale
+            x0 = np.log(params.to_numpy())
+        else:
+            # log-space starting point, as in lifetimes
+            x0 = np.asarray(initial_params, dtype="float64")
+
+        output = minimize(bgnbd_negative_log_likelihood, x0, jac=True, tol=tol,
+                          args=(frequency, recency * scale, T * scale, weights, self.penalizer_coef,
+                                frequency_groups(frequency, weights)),
+                          options=kwargs)
+        if not output.success:
+            raise ConvergenceError("The model did not converge. Try adding a larger penalizer to see if that helps convergence.")
+
+        self.params_ = pd.Series(np.exp(output.x), index=BGNBD_PARAMS)
+        self.params_["alpha"] /= scale
+        self._negative_log_likelihood_ = output.fun
+        self.n_iterations_ = output.nit
+        return self
+
+    def predict_horizons(self, horizons, frequency, recency, T):
+        """
+            Expected number of purchases of every customer (rows) within every horizon (columns).
+            The terms that only depend on the customer are computed once and broadcast over the horizons.
+            The hypergeometric term only depends on frequency, T and the horizon, so it is evaluated once per
+            distinct (frequency, T) pair; T is a whole number of days in the pipelines, so there are few of them.
+        """
+
+        r, alpha, a, b = self.params_.to_numpy()
+        frequency = np.asarray(frequency, dtype="float64")
+        recency = np.asarray(recency, dtype="float64")
+        T = np.asarray(T, dtype="float64")
+        t = np.asarray(horizons, dtype="float64")[None, :]
+
+        # per customer terms
+        first_term = (a + b + frequency - 1) / (a - 1)
+        denominator = 1 + (frequency > 0) * (a / (b + frequency - 1)) * ((alpha + T) / (alpha + recency)) ** (r + frequency)
+
+        # per (frequency, T) pair and horizon terms
+        if len(frequency) >= MIN_ROWS_TO_GROUP:
+            (x, alpha_T), _, pairs = unique_tuples(frequency, alpha + T)
+        else:
+            x, alpha_T, pairs = frequency, alpha + T, slice(None)
+        x = x[:, None]
+        alpha_T = alpha_T[:, None]
+        _a = r + x
+        _b = b + x
+        _c = a + b + x - 1
+        _z = t / (alpha_T + t)
+        ln_hyp_term = np.log(hyp2f1(_a, _b, _c, _z))
+        overflow = np.isinf(ln_hyp_term)
+        if overflow.any():
+            # where the value is inf, a different but equivalent formula is used
+            _a, _b, _c, _z = (np.broadcast_to(term, _z.shape)[overflow] for term in (_a, _b, _c, _z))
+            ln_hyp_term[overflow] = np.log(hyp2f1(_c - _a, _c - _b, _c, _z)) + (_c - _a - _b) * np.log(1 - _z)
+        second_term = 1 - np.exp(ln_hyp_term + (r + x) * (np.log(alpha_T) - np.log(alpha_T + t)))
+        return (first_term / denominator)[:, None] * second_term[pairs]
+
+    def conditional_expected_number_of_purchases_up_to_time(self, t, frequency, recency, T):
+        """
+            Expected number of purchases in the next t periods for customers with the given history.
+        """
+
+        expected = self.predict_horizons([t], frequency, recency, T)[:, 0]
+        if isinstance(frequency, pd.Series):
+            return pd.Series(expected, index=frequency.index)
+        return expected
+
+    predict = conditional_expected_number_of_purchases_up_to_time
+
+    def save_params(self, path):
+        with open(path, "w") as file:
+            json.dump({"penalizer_coef": self.penalizer_coef, "params": self.params_.to_dict()}, file)
+
+    @classmethod
+    def load_params(cls, path, warm_start=True):
+        with open(path) as file:
+            state = json.load(file)
+        fitter = cls(state["penalizer_coef"], warm_start=warm_start)
+        fitter.params_ = pd.Series(state["params"])[BGNBD_PARAMS]
+        return fitter
+
+
+######################################
+# 3. Gamma-Gamma Fitter
+######################################
+
+def gamma_gamma_negative_log_likelihood(log_params, frequency, monetary_value, weights, penalizer_coef):
+    """
+        Penalized mean negative log-likelihood of the Gamma-Gamma model and its gradient w.r.t. the log parameters.
+    """
+
+    params = np.exp(log_params)
+    p, q, v = params
+    x = frequency
+    m = monetary_value
+    px = p * x
+    log_xm_v = np.log(x * m + v)
+    digamma_px_q = digamma(px + q)
+
+    ll = (gammaln(px + q) - gammaln(px) - gammaln(q) + q * np.log(v)
+          + (px - 1) * np.log(m) + px * np.log(x) - (px + q) * log_xm_v)
+    gradient = np.array([
+        np.dot(weights, x * (digamma_px_q - digamma(px) + np.log(m) + np.log(x) - log_xm_v)),
+        np.dot(weights, digamma_px_q - log_xm_v) + weights.sum() * (np.log(v) - digamma(q)),
+        np.dot(weights, q / v - (px + q) / (x * m + v)),
+    ])
+
+    total = weights.sum()
+    value = -np.dot(weights, ll) / total + penalizer_coef * np.sum(params ** 2)
+    # chain rule through params = exp(log_params)
+    gradient = params * (-gradient / total + 2 * penalizer_coef * params)
+    return value, gradient
+
+
+class GGFitter:
+    """
+        Drop-in replacement for lifetimes.GammaGammaFitter fit / conditional_expected_average_profit /
+        customer_lifetime_value, fitted with an analytic gradient.
+    """
+
+    def __init__(self, penalizer_coef=0.0):
+        self.penalizer_coef = penalizer_coef
+
+    def fit(self, frequency, monetary_value, weights=None, initial_params=None, tol=1e-7, **kwargs):
+        frequency = np.asarray(frequency, dtype="float64")
+        monetary_value = np.asarray(monetary_value, dtype="float64")
+        weights = np.ones(len(frequency)) if weights is None else np.asarray(weights, dtype="float64")
+        if initial_params is None:
+            x0 = 0.1 * np.ones(3)
+        elif isinstance(initial_params, (pd.Series, dict)):
+            x0 = np.log(pd.Series(initial_params, dtype="float64")[GAMMA_GAMMA_PARAMS].to_numpy())
+        else:
+            x0 = np.asarray(initial_params, dtype="float64")
+
+        output = minimize(gamma_gamma_negative_log_likelihood, x0, jac=True, tol=tol,
+                          args=(frequency, monetary_value, weights, self.penalizer_coef), options=kwargs)
+        if not output.success:
+            raise ConvergenceError("The model did not converge. Try adding a larger penalizer to see if that helps convergence.")
+
+        self.params_ = pd.Series(np.exp(output.x), index=GAMMA_GAMMA_PARAMS)
+        self._negative_log_likelihood_ = output.fun
+        self.n_iterations_ = output.nit
+        return self
+
+    def conditional_expected_average_profit(self, frequency, monetary_value):
+        """
+            Expected average profit per transaction : a weighted average of the customer's own monetary value
+            and the population mean.
+        """
+
+        p, q, v = self.params_.to_numpy()
+        individual_weight = p * frequency / (p * frequency + q - 1)
+        population_mean = v * p / (q - 1)
+        return (1 - individual_weight) * population_mean + individual_weight * monetary_value
+
+    def customer_lifetime_value(self, transaction_prediction_model, frequency, recency, T, monetary_value,
+                                time=12, discount_rate=0.01, freq="D", expected=None):
+        """
+            Discounted CLTV over the next time months, as lifetimes.GammaGammaFitter.customer_lifetime_value.
+            expected may hold the already predicted purchases at clv_horizons(time, freq), otherwise they are
+            predicted here in one batch.
+        """
+
+        if expected is None:
+            expected = expected_purchases(transaction_prediction_model, clv_horizons(time, freq), frequency, recency, T)
+        adjusted_monetary_value = self.conditional_expected_average_profit(frequency, monetary_value)
+        clv = discounted_clv(expected, adjusted_monetary_value, discount_rate)
+        index = frequency.index if isinstance(frequency, pd.Series) else None
+        return pd.Series(clv, index=index, name="clv")
+
+
+######################################
+# 4. Batched Predictions & CLTV
+######################################
+
+def clv_horizons(time=12, freq="D"):
+    """
+        Horizons (in units of T) at the end of each of the next time months, starting with 0.
+    """
+
+    return np.arange(time + 1) * FREQ_FACTORS[freq]
+
+
+def expected_purchases(model, horizons, frequency, recency, T):
+    """
+        Customers x horizons matrix of expected purchases.
+        Models without a batched predict_horizons (e.g. lifetimes fitters) are called once per horizon.
+    """
+
+    if hasattr(model, "predict_horizons"):
+        return model.predict_horizons(horizons, frequency, recency, T)
+    return np.column_stack([np.asarray(model.predict(t, frequency, recency, T), dtype="float64") for t in horizons])
+
+
+def discounted_clv(expected, monetary_value, discount_rate=0.01):
+    """
+        Sums the monthly purchases (differences of the cumulative expected purchases at clv_horizons)
+        times the monetary value, discounted per month.
+    """
+
+    monthly = np.diff(expected, axis=1)
+    discount = (1 + discount_rate) ** -np.arange(1, monthly.shape[1] + 1)
+    return np.asarray(monetary_value, dtype="float64") * (monthly @ discount)
+
+
+######################################
+# 5. Distinct Customer Tuples
+######################################
+
+def unique_tuples(*columns):
+    """
+        Compresses customers into the distinct tuples of the given columns.
+        Returns the tuples (one array per column), the number of customers sharing each tuple (the fit weights)
+        and the position of each customer's tuple, which broadcasts per tuple results back to the customers.
+    """
+
+    columns = [np.asarray(col, dtype="float64") for col in columns]
+    inverse = pd.DataFrame(dict(enumerate(columns))).groupby(list(range(len(columns))), sort=False).ngroup().to_numpy()
+    counts = np.bincount(inverse)
+    tuples = []
+    for col in columns:
+        values = np.empty(len(counts))
+        values[inverse] = col
+        tuples.append(values)
+    return tuples, counts.astype("float64"), inverse
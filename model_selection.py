@@ -0,0 +1,155 @@
+######################################
+# Penalizer Selection on a Calibration / Holdout Split
+######################################
+# create_cltv_p hard-codes penalizer_coef (0.001 for BG-NBD, 0.01 for Gamma-Gamma).
+# Here the transactions are split by InvoiceDate into a calibration period, on which the models are fitted,
+# and a holdout period, against which their predictions are checked.
+# Both periods are aggregated in one groupby : the calibration and holdout columns are masked copies
+# of the same columns, so each customer gets its calibration lifetime data and its holdout purchases in one scan.
+# Outlier thresholds come from the calibration period only, nothing of the holdout period leaks into the fit.
+# BG-NBD only affects the purchase predictions and Gamma-Gamma only the average profit, so a grid of
+# B x G penalizer pairs needs B + G fits. The fits run in a process pool, each worker receives the
+# calibration table once, and every pair is then evaluated on the cached predictions.
+
+# 1. Calibration & Holdout Data
+# 2. Fit Workers
+# 3. Penalizer Grid
+
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+import numpy as np
+import pandas as pd
+from customer_summary import lifetime_data
+from lifetime_models import BGNBDFitter, GGFitter, ConvergenceError, unique_tuples
+from parallel import resolve_n_jobs
+from preprocessing import filter_cltv_p, OutlierCapper
+
+PENALIZERS = (0.0, 0.001, 0.01, 0.1)
+
+_WORKER_DATA = {}
+
+
+######################################
+# 1. Calibration & Holdout Data
+######################################
+
+def calibration_holdout_data(dataframe, calibration_end, observation_end=None, customer_col="Customer ID"):
+    """
+        lifetime_data of the calibration period (InvoiceDate <= calibration_end, T measured at calibration_end)
+        with the holdout purchases (frequency_holdout), revenue (monetary_holdout) and length in weeks
+        (duration_holdout) of each customer. Customers whose first purchase is in the holdout period are dropped.
+    """
+
+    dataframe = filter_cltv_p(dataframe)
+    if observation_end is None:
+        observation_end = dataframe["InvoiceDate"].max()
+    dataframe = dataframe[(dataframe["InvoiceDate"] <= observation_end).to_numpy()]
+    in_calibration = (dataframe["InvoiceDate"] <= calibration_end).to_numpy()
+
+    dataframe = OutlierCapper().fit(dataframe[in_calibration]).transform(dataframe)
+
+    periods = pd.DataFrame({customer_col: dataframe[customer_col],
+                            "date": dataframe["InvoiceDate"].where(in_calibration),
+                            "invoice": dataframe["Invoice"].where(in_calibration),
+                            "price": dataframe["TotalPrice"].where(in_calibration, 0.0),
+                            "invoice_holdout": dataframe["Invoice"].where(~in_calibration),
+                            "price_holdout": dataframe["TotalPrice"].where(~in_calibration, 0.0)})
+    summary = periods.groupby(customer_col).agg(first_date=("date", "min"),
+                                                 last_date=("date", "max"),
+                                                 n_invoices=("invoice", "nunique"),
+                                                 total_price=("price", "sum"),
+                                                 frequency_holdout=("invoice_holdout", "nunique"),
+                                                 monetary_holdout=("price_holdout", "sum"))
+    summary = summary[summary["first_date"].notna()]
+
+    cltv_df = lifetime_data(summary, calibration_end)
+    cltv_df["frequency_holdout"] = summary.loc[cltv_df.index, "frequency_holdout"]
+    cltv_df["monetary_holdout"] = summary.loc[cltv_df.index, "monetary_holdout"]
+    cltv_df["duration_holdout"] = (observation_end - calibration_end) / dt.timedelta(days=7)
+    return cltv_df
+
+
+######################################
+# 2. Fit Workers
+######################################
+
+def _init_worker(data):
+    _WORKER_DATA.update(data)
+
+
+def _fit_model(task):
+    model, penalizer = task
+    data = _WORKER_DATA
+    try:
+        if model == "bgnbd":
+            return BGNBDFitter(penalizer_coef=penalizer).fit(*data["bgnbd_tuples"], weights=data["bgnbd_weights"]).params_
+        return GGFitter(penalizer_coef=penalizer).fit(*data["gg_tuples"], weights=data["gg_weights"]).params_
+    except ConvergenceError:
+        return None
+
+
+######################################
+# 3. Penalizer Grid
+######################################
+
+def select_penalizers(cal_holdout, bgf_penalizers=PENALIZERS, ggf_penalizers=PENALIZERS, n_jobs=-1):
+    """
+        Fits both models on the calibration period of a calibration_holdout_data frame for every penalizer and
+        reports the holdout error of every (bgf_penalizer, ggf_penalizer) pair, best revenue error first :
+        purchases_mae / purchases_rmse / purchases_bias (relative error of the total) of the holdout purchases,
+        monetary_mae of the average profit of customers buying in the holdout period and revenue_mae.
+        Pairs whose fit does not converge get NaN errors.
+    """
+
+    n_jobs = resolve_n_jobs(n_jobs)
+    frequency, recency, T, monetary = (cal_holdout[col].to_numpy(dtype="float64")
+                                       for col in ["frequency", "recency", "T", "monetary"])
+    bgnbd_tuples, bgnbd_weights, _ = unique_tuples(frequency, recency, T)
+    gg_tuples, gg_weights, _ = unique_tuples(frequency, monetary)
+    data = {"bgnbd_tuples": bgnbd_tuples, "bgnbd_weights": bgnbd_weights,
+            "gg_tuples": gg_tuples, "gg_weights": gg_weights}
+    tasks = [("bgnbd", penalizer) for penalizer in bgf_penalizers] + [("gamma_gamma", penalizer) for penalizer in ggf_penalizers]
+
+    if n_jobs == 1:
+        _init_worker(data)
+        params = [_fit_model(task) for task in tasks]
+        _WORKER_DATA.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(data,)) as executor:
+            params = list(executor.map(_fit_model, tasks))
+
+    # predictions of each fitted model, shared by all the pairs it is part of
+    actual_purchases = cal_holdout["frequency_holdout"].to_numpy(dtype="float64")
+    actual_revenue = cal_holdout["monetary_holdout"].to_numpy(dtype="float64")
+    buyers = actual_purchases > 0
+    duration = cal_holdout["duration_holdout"].iloc[0]
+    purchases, profits = {}, {}
+    for (model, penalizer), model_params in zip(tasks, params):
+        if model_params is None:
+            continue
+        if model == "bgnbd":
+            bgf = BGNBDFitter(penalizer_coef=penalizer)
+            bgf.params_ = model_params
+            purchases[penalizer] = bgf.predict_horizons([duration], frequency, recency, T)[:, 0]
+        else:
+            ggf = GGFitter(penalizer_coef=penalizer)
+            ggf.params_ = model_params
+            profits[penalizer] = ggf.conditional_expected_average_profit(frequency, monetary)
+
+    rows = []
+    for bgf_penalizer, ggf_penalizer in product(bgf_penalizers, ggf_penalizers):
+        row = {"bgf_penalizer": bgf_penalizer, "ggf_penalizer": ggf_penalizer}
+        if bgf_penalizer in purchases and ggf_penalizer in profits:
+            predicted = purchases[bgf_penalizer]
+            profit = profits[ggf_penalizer]
+            row["purchases_mae"] = np.abs(predicted - actual_purchases).mean()
+            row["purchases_rmse"] = np.sqrt(((predicted - actual_purchases) ** 2).mean())
+            row["purchases_bias"] = predicted.sum() / actual_purchases.sum() - 1
+            row["monetary_mae"] = np.abs(profit[buyers] - actual_revenue[buyers] / actual_purchases[buyers]).mean()
+            row["revenue_mae"] = np.abs(predicted * profit - actual_revenue).mean()
+        rows.append(row)
+
+    errors = pd.DataFrame(rows, columns=["bgf_penalizer", "ggf_penalizer", "purchases_mae", "purchases_rmse",
+                                         "purchases_bias", "monetary_mae", "revenue_mae"])
+    return errors.sort_values("revenue_mae", kind="stable").reset_index(drop=True)
@@ -0,0 +1,145 @@
+######################################
+# Multi-Core Sharded Execution
+######################################
+# Transactions are hash-partitioned by Customer ID, so every customer lives in exactly one shard.
+# Data preparation and the per-customer aggregation then run shard by shard in a process pool,
+# and the shard summaries are concatenated before the global steps (qcut scoring, churn rate, model fitting).
+# The outlier thresholds of create_cltv_p are global too: shards first return partially fitted OutlierCappers
+# (mergeable value counts), the thresholds are taken from the merged counts, then the shards are capped and aggregated.
+# A capper that is already fitted skips the counting pass.
+# Shards are not pickled to the workers : where processes are forked (Linux), the workers inherit the transactions
+# and the row positions of every shard, and a task only sends the shard number (the shard is taken in the worker).
+# Elsewhere every shard is pickled once per pass. Only the small shard summaries and value counts travel back.
+# With a single job (n_jobs=1, or -1 / None on a one-core machine) there is nothing to run in parallel : the summary is
+# computed in the calling process, without partitioning or a process pool.
+
+# 1. Partitioning
+# 2. Shard Workers
+# 3. Sharded Customer Summary
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from customer_summary import customer_summary
+from preprocessing import prepare_rfm, prepare_cltv, filter_cltv_p, OutlierCapper
+
+# transactions and shard row positions inherited by forked workers during a sharded_summary call
+_SHARED = {}
+
+
+######################################
+# 1. Partitioning
+######################################
+
+def resolve_n_jobs(n_jobs):
+    """
+        n_jobs=-1 uses every core, like scikit-learn.
+    """
+
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    return n_jobs
+
+
+def shard_positions(dataframe, n_shards, customer_col="Customer ID"):
+    """
+        Row positions of each of the n_shards shards, by the hash of the customer id (rows keep their order).
+    """
+
+    shard_ids = pd.util.hash_pandas_object(dataframe[customer_col], index=False).to_numpy() % np.uint64(n_shards)
+    order = np.argsort(shard_ids, kind="stable")
+    bounds = np.searchsorted(shard_ids[order], np.arange(n_shards + 1, dtype="uint64"))
+    return [order[bounds[i]:bounds[i + 1]] for i in range(n_shards)]
+
+
+def hash_partition(dataframe, n_shards, customer_col="Customer ID"):
+    """
+        Splits the transactions into n_shards frames by the hash of the customer id.
+    """
+
+    return [dataframe.take(rows) for rows in shard_positions(dataframe, n_shards, customer_col)]
+
+
+######################################
+# 2. Shard Workers
+######################################
+
+def _shard(shard):
+    # a shard number refers to the transactions the forked worker inherited, otherwise the shard itself was sent
+    if isinstance(shard, int):
+        return _SHARED["dataframe"].take(_SHARED["positions"][shard])
+    return shard
+
+
+def _rfm_shard(shard):
+    return customer_summary(prepare_rfm(_shard(shard)))
+
+
+def _cltv_shard(shard):
+    return customer_summary(prepare_cltv(_shard(shard)))
+
+
+def _cltv_p_counts(shard):
+    return OutlierCapper().partial_fit(filter_cltv_p(_shard(shard)))
+
+
+def _cltv_p_shard(shard, capper):
+    return customer_summary(capper.transform(filter_cltv_p(_shard(shard))))
+
+
+SHARD_WORKERS = {"rfm": _rfm_shard,
+                 "cltv_calculation": _cltv_shard}
+
+
+######################################
+# 3. Sharded Customer Summary
+######################################
+
+def _serial_summary(dataframe, pipeline, capper):
+    if pipeline == "cltv_prediction":
+        capper = capper if capper is not None else OutlierCapper()
+        dataframe = filter_cltv_p(dataframe)
+        if not capper.is_fitted:
+            capper.fit(dataframe)
+        return customer_summary(capper.transform(dataframe))
+    return SHARD_WORKERS[pipeline](dataframe)
+
+
+def sharded_summary(dataframe, pipeline, n_jobs=-1, capper=None):
+    """
+        customer_summary of the prepared transactions of the given pipeline
+        ("rfm", "cltv_calculation" or "cltv_prediction"), computed on customer shards in a process pool.
+        For "cltv_prediction" an unfitted OutlierCapper passed as capper is fitted on the whole data in place.
+    """
+
+    n_jobs = resolve_n_jobs(n_jobs)
+    if n_jobs == 1:
+        return _serial_summary(dataframe, pipeline, capper)
+
+    positions = shard_positions(dataframe, n_jobs)
+    if "fork" in multiprocessing.get_all_start_methods():
+        context, shards = multiprocessing.get_context("fork"), list(range(n_jobs))
+        _SHARED.update(dataframe=dataframe, positions=positions)
+    else:
+        context, shards = None, [dataframe.take(rows) for rows in positions]
+
+    try:
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context) as executor:
+            if pipeline == "cltv_prediction":
+                capper = capper if capper is not None else OutlierCapper()
+                if not capper.is_fitted:
+                    for shard_capper in executor.map(_cltv_p_counts, shards):
+                        capper.merge(shard_capper)
+                # only the fitted limits are sent to the workers, not the value counts
+                limits = OutlierCapper(capper.limits_)
+                summaries = list(executor.map(_cltv_p_shard, shards, [limits] * len(shards)))
+            else:
+                summaries = list(executor.map(SHARD_WORKERS[pipeline], shards))
+    finally:
+        _SHARED.clear()
+
+    return pd.concat(summaries).sort_index()
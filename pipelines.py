@@ -0,0 +1,210 @@
+######################################
+# Pipeline Functions
+######################################
+# create_rfm, create_cltv_calculation and create_cltv_p, the functionalized versions of the rfm.py, cltv.py and
+# cltv_prediction.py tutorials. The tutorial scripts run the whole analysis when they are executed (and need the
+# Online Retail II workbook, matplotlib and scikit-learn), so the functions live here : the tutorials, benchmark.py
+# and the tests import them from this module.
+#   rfm = create_rfm(df)
+#   cltv_c = create_cltv_calculation(df)
+#   cltv_final = create_cltv_p(df)
+
+# 1. RFM
+# 2. CLTV Calculation
+# 3. CLTV Prediction
+
+import datetime as dt
+import pandas as pd
+from customer_summary import customer_summary, rfm_metrics, cltv_metrics, lifetime_data
+from segmentation import rfm_scores, rfm_segments
+from parallel import sharded_summary, resolve_n_jobs
+from sql_backend import file_summary
+from preprocessing import prepare_rfm, prepare_cltv, filter_cltv_p, OutlierCapper
+from scoring import CLTVModel, save_model
+from bootstrap import bootstrap_clv
+from instrumentation import stage
+from export import export_segments
+
+
+######################################
+# 1. RFM
+######################################
+
+def create_rfm(dataframe, csv = False, n_jobs = 1, backend = "pandas", export = None, backend_options = None):
+
+    # Data Preparation
+    # (every step is an instrumentation stage, see instrumentation.py)
+    if backend != "pandas":
+        # SQL cleaning & per-customer aggregation over a Parquet / CSV file (dataframe is its path), see sql_backend.py
+        # (backend_options e.g. {"memory_limit": "2GB", "temp_directory": "spill"} let DuckDB spill to disk)
+        with stage("rfm", "sql_summary") as step:
+            summary = file_summary(dataframe, "rfm", backend, **(backend_options or {}))
+            step.rows_out = len(summary)
+    elif resolve_n_jobs(n_jobs) == 1:
+        with stage("rfm", "prepare", rows_in=len(dataframe)) as step:
+            dataframe = prepare_rfm(dataframe)
+            step.rows_out = len(dataframe)
+        with stage("rfm", "summary", rows_in=len(dataframe)) as step:
+            summary = customer_summary(dataframe)
+            step.rows_out = len(summary)
+    else:
+        # preparation & per-customer aggregation on customer shards in a process pool
+        with stage("rfm", "sharded_summary", rows_in=len(dataframe)) as step:
+            summary = sharded_summary(dataframe, "rfm", n_jobs)
+            step.rows_out = len(summary)
+
+    # Calculation RFM Metrics
+    today_date = dt.datetime(2010, 12, 11)
+
+    with stage("rfm", "metrics", rows_in=len(summary)) as step:
+        rfm = rfm_metrics(summary, today_date)
+        rfm = rfm[rfm["monetary"] > 0]
+        step.rows_out = len(rfm)
+
+    # Calculation RFM Scores
+    with stage("rfm", "scores", rows_in=len(rfm)):
+        rfm = rfm_scores(rfm)
+
+    # RFM categorization
+    with stage("rfm", "segments", rows_in=len(rfm)):
+        rfm['segment'] = rfm_segments(rfm)
+        rfm = rfm[["recency", "frequency", "monetary", "segment"]]
+        rfm.index = rfm.index.astype(int)
+
+    if csv:
+        with stage("rfm", "to_csv", rows_in=len(rfm)):
+            rfm.to_csv("rfm_with_func.csv")
+
+    # compressed export partitioned by segment (e.g. read_segment(export, "new_customers")), see export.py
+    if export is not None:
+        with stage("rfm", "export", rows_in=len(rfm)):
+            export_segments(rfm, export)
+
+    return rfm
+
+
+######################################
+# 2. CLTV Calculation
+######################################
+
+def create_cltv_calculation(dataframe, profit = 0.10, n_jobs = 1, backend = "pandas", export = None,
+                            backend_options = None):
+
+    # Data Preparation
+    # (every step is an instrumentation stage, see instrumentation.py)
+    if backend != "pandas":
+        # SQL cleaning & per-customer aggregation over a Parquet / CSV file (dataframe is its path), see sql_backend.py
+        # (backend_options e.g. {"memory_limit": "2GB", "temp_directory": "spill"} let DuckDB spill to disk)
+        with stage("cltv_calculation", "sql_summary") as step:
+            summary = file_summary(dataframe, "cltv_calculation", backend, **(backend_options or {}))
+            step.rows_out = len(summary)
+    elif resolve_n_jobs(n_jobs) == 1:
+        with stage("cltv_calculation", "prepare", rows_in=len(dataframe)) as step:
+            dataframe = prepare_cltv(dataframe)
+            step.rows_out = len(dataframe)
+        with stage("cltv_calculation", "summary", rows_in=len(dataframe)) as step:
+            summary = customer_summary(dataframe)
+            step.rows_out = len(summary)
+    else:
+        # preparation & per-customer aggregation on customer shards in a process pool
+        with stage("cltv_calculation", "sharded_summary", rows_in=len(dataframe)) as step:
+            summary = sharded_summary(dataframe, "cltv_calculation", n_jobs)
+            step.rows_out = len(summary)
+    cltv_c = cltv_metrics(summary)
+
+    with stage("cltv_calculation", "cltv", rows_in=len(cltv_c)):
+        # average_order_value
+        cltv_c["average_order_value"] = cltv_c["total_price"] / cltv_c["total_transaction"]
+
+        # purchase_frequency
+        cltv_c["purchase_frequency"] = cltv_c["total_transaction"] / cltv_c.shape[0]
+
+        # repeat_rate & churn_rate
+        repeat_rate_f = cltv_c[cltv_c["total_transaction"] > 1].shape[0] / cltv_c.shape[0]
+        churn_rate_f = 1 - repeat_rate_f
+
+        # profit_margin
+        cltv_c["profit_margin"] = cltv_c["total_price"] * 0.10
+
+        #customer_value
+        cltv_c["customer_value"] = cltv_c["average_order_value"] * cltv_c["purchase_frequency"]
+
+        # cltv
+        cltv_c["cltv"] = (cltv_c["customer_value"] / churn_rate_f) * cltv_c["profit_margin"]
+
+        # segment
+        cltv_c["segment"] = pd.qcut(cltv_c["cltv"], 4, labels=["D", "C", "B", "A"])
+
+    # compressed export partitioned by segment, see export.py
+    if export is not None:
+        with stage("cltv_calculation", "export", rows_in=len(cltv_c)):
+            export_segments(cltv_c, export)
+
+    return cltv_c
+
+
+######################################
+# 3. CLTV Prediction
+######################################
+
+def create_cltv_p(dataframe, month = 3, n_jobs = 1, bgf_params = None, model = None, model_dir = None, n_bootstrap = 0,
+                  backend = "pandas", export = None, backend_options = None):
+
+    # Data Preprocessing
+    # (every step is an instrumentation stage, see instrumentation.py)
+    # The outlier limits of a given model are reused, otherwise they are fitted on the data and stored with the model.
+    capper = model.capper if model is not None and model.capper.is_fitted else OutlierCapper()
+    if backend != "pandas":
+        # SQL cleaning & per-customer aggregation over a Parquet / CSV file (dataframe is its path), see sql_backend.py
+        # (backend_options e.g. {"memory_limit": "2GB", "temp_directory": "spill"} let DuckDB spill to disk)
+        with stage("cltv_prediction", "sql_summary") as step:
+            summary = file_summary(dataframe, "cltv_prediction", backend, capper=capper, **(backend_options or {}))
+            step.rows_out = len(summary)
+    elif resolve_n_jobs(n_jobs) == 1:
+        with stage("cltv_prediction", "prepare", rows_in=len(dataframe)) as step:
+            dataframe = filter_cltv_p(dataframe)
+            step.rows_out = len(dataframe)
+        with stage("cltv_prediction", "outliers", rows_in=len(dataframe)):
+            if not capper.is_fitted:
+                capper.fit(dataframe)
+            dataframe = capper.transform(dataframe)
+        with stage("cltv_prediction", "summary", rows_in=len(dataframe)) as step:
+            summary = customer_summary(dataframe)
+            step.rows_out = len(summary)
+    else:
+        # preprocessing & per-customer aggregation on customer shards in a process pool
+        with stage("cltv_prediction", "sharded_summary", rows_in=len(dataframe)) as step:
+            summary = sharded_summary(dataframe, "cltv_prediction", n_jobs, capper=capper)
+            step.rows_out = len(summary)
+    today_date = dt.datetime(2011, 12, 11)
+
+    with stage("cltv_prediction", "lifetime_data", rows_in=len(summary)) as step:
+        cltv_df = lifetime_data(summary, today_date)
+        step.rows_out = len(cltv_df)
+
+    # Establishment of BG-NBD & Gamma-Gamma Models
+    # (fitted on the distinct customer tuples, BG-NBD warm-started from bgf_params of a previous run if given)
+    # A fitted model (see scoring.load_model) scores the customers with its stored parameters & segment boundaries.
+    if model is None:
+        with stage("cltv_prediction", "fit", rows_in=len(cltv_df)):
+            model = CLTVModel.fit(cltv_df, bgf_params=bgf_params, outlier_limits=capper.limits_)
+        if model_dir is not None:
+            save_model(model, model_dir)
+
+    # Expected purchases (1 week, 1 month, 3 months), expected average profit, 3 month CLTV & segments
+    with stage("cltv_prediction", "score", rows_in=len(cltv_df)) as step:
+        cltv_final = model.score_frame(cltv_df)
+        step.rows_out = len(cltv_final)
+
+    # CLTV intervals & segment stability from refits on resampled customers (n_jobs worker processes)
+    if n_bootstrap:
+        with stage("cltv_prediction", "bootstrap", rows_in=len(cltv_df)):
+            intervals = bootstrap_clv(cltv_df, model, n_replicates=n_bootstrap, n_jobs=n_jobs)
+            cltv_final = cltv_final.merge(intervals.reset_index(), on='Customer ID', how='left')
+
+    # compressed export partitioned by segment, see export.py
+    if export is not None:
+        with stage("cltv_prediction", "export", rows_in=len(cltv_final)):
+            export_segments(cltv_final, export)
+
+    return cltv_final
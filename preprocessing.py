@@ -0,0 +1,231 @@
+######################################
+# Data Preparation of the Pipelines
+######################################
+# The data preparation steps of create_rfm, create_cltv_calculation and create_cltv_p,
+# written so that they never modify the caller's frame. They are shared by the pipelines and by the streaming,
+# incremental and sharded execution paths. They run on the default and on the compact (low_memory) schema.
+# Instead of a chain of filters (dropna, cancellations, Quantity > 0, Price > 0) that copies the frame at every step,
+# one boolean mask is combined in place and applied once; derived columns are computed on the surviving rows only.
+# The outlier limits of create_cltv_p are fitted once by an OutlierCapper and can be stored and reused.
+
+# 1. Cancellations
+# 2. Fused Cleaning Stage
+# 3. RFM
+# 4. CLTV Calculation
+# 5. CLTV Prediction
+# 6. Outlier Thresholds
+
+import numpy as np
+import pandas as pd
+
+
+######################################
+# 1. Cancellations
+######################################
+
+def cancelled_mask(dataframe):
+    """
+        True for cancelled invoices (invoice number contains 'C').
+        Uses the precomputed is_cancelled flag of the compact schema when it is there.
+    """
+
+    if "is_cancelled" in dataframe.columns:
+        return dataframe["is_cancelled"]
+    return dataframe["Invoice"].str.contains("C", na=False)
+
+
+######################################
+# 2. Fused Cleaning Stage
+######################################
+
+def clean_mask(dataframe, positive_quantity=False, positive_price=False):
+    """
+        Boolean array of the rows without missing values that are not cancelled
+        (and optionally have Quantity > 0 and Price > 0), combined in place.
+    """
+
+    mask = ~np.asarray(cancelled_mask(dataframe), dtype=bool)
+    for col in dataframe.columns:
+        np.logical_and(mask, dataframe[col].notna().to_numpy(), out=mask)
+    if positive_quantity:
+        np.logical_and(mask, (dataframe["Quantity"] > 0).to_numpy(), out=mask)
+    if positive_price:
+        np.logical_and(mask, (dataframe["Price"] > 0).to_numpy(), out=mask)
+    return mask
+
+
+def clean_transactions(dataframe, positive_quantity=False, positive_price=False, total_price=True):
+    """
+        Keeps rows without missing values that are not cancelled (and optionally have Quantity > 0 and Price > 0).
+        All conditions are combined into a single mask, the rows are taken once and TotalPrice is added to them.
+    """
+
+    mask = clean_mask(dataframe, positive_quantity, positive_price)
+
+    # take returns a new frame, so adding columns does not write into a slice of the caller's frame
+    dataframe = dataframe.take(np.flatnonzero(mask))
+    if total_price:
+        dataframe["TotalPrice"] = dataframe["Quantity"] * dataframe["Price"]
+    return dataframe
+
+
+######################################
+# 3. RFM
+######################################
+
+def prepare_rfm(dataframe):
+    """
+        Drops missing values and cancelled invoices, adds TotalPrice.
+    """
+
+    return clean_transactions(dataframe)
+
+
+######################################
+# 4. CLTV Calculation
+######################################
+
+def prepare_cltv(dataframe):
+    """
+        Drops cancelled invoices, non-positive quantities and missing values, adds TotalPrice.
+    """
+
+    return clean_transactions(dataframe, positive_quantity=True)
+
+
+######################################
+# 5. CLTV Prediction
+######################################
+
+def filter_cltv_p(dataframe):
+    """
+        Drops missing values, cancelled invoices, non-positive quantities and prices.
+        The outlier thresholds depend on the whole filtered column, so capping is a separate step (cap_outliers).
+    """
+
+    return clean_transactions(dataframe, positive_quantity=True, positive_price=True, total_price=False)
+
+
+def cap_outliers(dataframe, quantity_limits, price_limits):
+    """
+        Returns a frame with Quantity and Price capped at the given (low_limit, up_limit) thresholds and TotalPrice.
+        Each column is clipped in one pass over its NumPy array (Price keeps its dtype).
+    """
+
+    quantity = np.clip(dataframe["Quantity"].to_numpy(dtype="float64"), *map(float, quantity_limits))
+    price = np.clip(dataframe["Price"].to_numpy(), *map(float, price_limits))
+    # assign builds a new frame, the other columns are shared with the caller's frame until written to
+    return dataframe.assign(Quantity=quantity, Price=price, TotalPrice=quantity * price)
+
+
+######################################
+# 6. Outlier Thresholds
+######################################
+
+class ValueCounter:
+    """
+        Mergeable value counts of a numeric column.
+        Quantity and Price have few distinct values, so exact quantiles can be taken without keeping every row.
+    """
+
+    def __init__(self):
+        self.counts = pd.Series(dtype="int64")
+
+    def update(self, values):
+        self.counts = self.counts.add(values.value_counts(), fill_value=0).astype("int64")
+        return self
+
+    def merge(self, other):
+        self.counts = self.counts.add(other.counts, fill_value=0).astype("int64")
+        return self
+
+    def quantile(self, q):
+        """
+            Linear interpolation between the closest ranks, same result as Series.quantile on the raw values.
+        """
+
+        counts = self.counts.sort_index()
+        values = counts.index.to_numpy(dtype="float64")
+        cum = np.cumsum(counts.to_numpy())
+        pos = (cum[-1] - 1) * q
+        lo = np.floor(pos)
+        a = values[np.searchsorted(cum, lo, side="right")]
+        b = values[np.searchsorted(cum, np.ceil(pos), side="right")]
+        t = pos - lo
+        diff = b - a
+        return b - diff * (1 - t) if t >= 0.5 else a + diff * t
+
+
+def iqr_limits(quartile1, quartile3):
+    """
+        (low_limit, up_limit) of outlier_thresholds from its 1% and 99% quantiles.
+    """
+
+    interquantile_range = quartile3 - quartile1
+    up_limit = quartile3 + 1.5 * interquantile_range
+    low_limit = quartile1 - 1.5 * interquantile_range
+    return float(low_limit), float(up_limit)
+
+
+def thresholds_from_counts(counter):
+    """
+        Same limits as outlier_thresholds, computed from a ValueCounter.
+    """
+
+    return iqr_limits(counter.quantile(0.01), counter.quantile(0.99))
+
+
+class OutlierCapper:
+    """
+        Outlier capping of Quantity and Price with the limits of outlier_thresholds, fitted once and reused.
+        fit takes the exact quantiles of an in-memory frame; for chunked input partial_fit folds every chunk into
+        mergeable value counts, which give the same limits as fit on the concatenated chunks.
+        The fitted limits (limits_) are plain floats, saved with the CLTV model artifact (see scoring.py), so that
+        rescoring new transactions reuses them instead of rescanning the history.
+    """
+
+    columns = ("Quantity", "Price")
+
+    def __init__(self, limits=None):
+        self.limits_ = {col: tuple(map(float, limits[col])) for col in self.columns} if limits else None
+        self._counters = {}
+
+    @property
+    def is_fitted(self):
+        return self.limits_ is not None
+
+    def fit(self, dataframe):
+        # both quantiles of a column in one call, so each column is partitioned once
+        self.limits_ = {col: iqr_limits(*dataframe[col].quantile([0.01, 0.99]).to_numpy()) for col in self.columns}
+        return self
+
+    def partial_fit(self, chunk):
+        for col in self.columns:
+            self._counters.setdefault(col, ValueCounter()).update(chunk[col])
+        return self._update_limits()
+
+    def merge(self, other):
+        for col, counter in other._counters.items():
+            self._counters.setdefault(col, ValueCounter()).merge(counter)
+        return self._update_limits()
+
+    def _update_limits(self):
+        self.limits_ = {col: thresholds_from_counts(self._counters[col]) for col in self.columns}
+        return self
+
+    def transform(self, dataframe):
+        """
+            cap_outliers with the fitted limits.
+        """
+
+        return cap_outliers(dataframe, self.limits_["Quantity"], self.limits_["Price"])
+
+    def fit_transform(self, dataframe):
+        return self.fit(dataframe).transform(dataframe)
+
+    def to_dict(self):
+        return {col: list(limits) for col, limits in self.limits_.items()}
+
+    @classmethod
+    def from_dict(cls, limits):
+        return cls(limits)
@@ -0,0 +1,161 @@
+######################################
+# Top-K & Per-Segment Rankings
+######################################
+# Questions like "the 10 customers expected to purchase the most in 1 week" or "the top CLV customers" were answered
+# with sort_values(...).head(n), which sorts every customer for every question.
+# Here the k best rows are found by partial selection : np.argpartition splits the values at the k-th best in O(n),
+# and only the k selected rows are sorted. The order is the one of a stable sort_values(...).head(k) (nlargest /
+# nsmallest with keep="first") : best values first, ties in row order, missing values never ranked.
+# Ranking caches the grouping of a result table by segment, so a dashboard firing many per-segment queries on the
+# same table groups it once and then does one partial selection per question.
+# TopK keeps the top k of one metric up to date from the customers whose value changed (see RFMState.track_top).
+#   top_k(cltv_final, 10, "clv")
+#   Ranking(rfm).top_by_segment("monetary", 5)
+
+# 1. Partial Selection
+# 2. Rankings by Segment
+# 3. Maintained Top-K
+
+import numpy as np
+import pandas as pd
+
+
+######################################
+# 1. Partial Selection
+######################################
+
+def top_positions(values, k, largest=True):
+    """
+        Positions of the k largest (or smallest) values, best first, ties in position order, missing values skipped.
+        k <= 0 selects nothing.
+    """
+
+    if k <= 0:
+        return np.array([], dtype="int64")
+    values = np.asarray(values)
+    valid = np.flatnonzero(pd.notna(values))
+    keys = values[valid]
+    if k < len(keys):
+        # argpartition puts the k-th best value at kth, the rows better than it before (smallest) or after (largest)
+        kth = len(keys) - k if largest else k - 1
+        boundary = keys[np.argpartition(keys, kth)[kth]]
+        better = np.flatnonzero(keys > boundary if largest else keys < boundary)
+        ties = np.flatnonzero(keys == boundary)[:k - len(better)]
+        selected = np.sort(np.concatenate([better, ties]))
+    else:
+        selected = np.arange(len(keys))
+
+    if largest:
+        # a stable ascending sort of the reversed rows, reversed, is descending with ties in row order
+        selected = selected[::-1]
+        selected = selected[np.argsort(keys[selected], kind="stable")[::-1]]
+    else:
+        selected = selected[np.argsort(keys[selected], kind="stable")]
+    return valid[selected]
+
+
+def top_k(data, k=10, column=None, largest=True):
+    """
+        The k rows of a frame (or values of a Series) with the largest column values, like
+        data.sort_values(column, ascending=False).head(k) without sorting all rows. largest=False gives the bottom k.
+    """
+
+    values = data if column is None else data[column]
+    return data.take(top_positions(values.to_numpy(), k, largest))
+
+
+######################################
+# 2. Rankings by Segment
+######################################
+
+class Ranking:
+    """
+        Top / bottom k queries on one result table (create_rfm, create_cltv_calculation, create_cltv_p, ...),
+        overall or per segment. The rows are grouped by segment once, with one stable argsort of the segment codes.
+    """
+
+    def __init__(self, frame, segment_col="segment"):
+        self.frame = frame
+        self.segment_col = segment_col
+        codes, self.segments = pd.factorize(frame[segment_col], sort=True)
+        self.order = np.argsort(codes, kind="stable")
+        self.bounds = np.searchsorted(codes[self.order], np.arange(len(self.segments) + 1))
+        self._values = {}
+
+    def values(self, column):
+        if column not in self._values:
+            self._values[column] = self.frame[column].to_numpy()
+        return self._values[column]
+
+    def segment_rows(self, segment):
+        i = self.segments.get_loc(segment)
+        return self.order[self.bounds[i]:self.bounds[i + 1]]
+
+    def top(self, column, k=10, segment=None, largest=True):
+        """
+            The k rows with the largest (or smallest) column values, of the whole table or of one segment.
+        """
+
+        if segment is None:
+            return self.frame.take(top_positions(self.values(column), k, largest))
+        rows = self.segment_rows(segment)
+        return self.frame.take(rows[top_positions(self.values(column)[rows], k, largest)])
+
+    def top_by_segment(self, column, k=10, largest=True):
+        """
+            The top k rows of every segment, segment by segment, like a stable sort_values followed by
+            groupby(segment).head(k) with the rows grouped.
+        """
+
+        values = self.values(column)
+        positions = [rows[top_positions(values[rows], k, largest)]
+                     for rows in (self.order[start:end] for start, end in zip(self.bounds[:-1], self.bounds[1:]))]
+        return self.frame.take(np.concatenate(positions) if positions else np.array([], dtype="int64"))
+
+
+def top_k_by_segment(frame, column, k=10, segment_col="segment", largest=True):
+    """
+        The top (or bottom) k rows of every segment by the given column.
+    """
+
+    return Ranking(frame, segment_col).top_by_segment(column, k, largest)
+
+
+######################################
+# 3. Maintained Top-K
+######################################
+
+class TopK:
+    """
+        Top k customers of one metric (a Series indexed by customer id), kept up to date by update with the new values
+        of the customers that changed. Ties are broken by customer id.
+        Only a member whose value got worse can let an outsider in : the top k is then recomputed from all values.
+    """
+
+    def __init__(self, k=10, largest=True):
+        self.k = k
+        self.largest = largest
+        self.members = pd.Series(dtype="float64")
+
+    def fit(self, values):
+        self.members = top_k(values.sort_index(), self.k, largest=self.largest)
+        return self
+
+    def update(self, changed, values=None):
+        """
+            Folds in the new values of the changed customers. values (all customers) is only needed
+            when a member got worse; without it a ValueError is raised in that case.
+        """
+
+        members = self.members
+        common = members.index.intersection(changed.index)
+        old, new = members[common], changed[common]
+        worse = new.isna() | ((new < old) if self.largest else (new > old))
+        if worse.any():
+            if values is None:
+                raise ValueError("a top-k member got worse, the top k needs all values to be recomputed")
+            return self.fit(values)
+
+        candidates = pd.concat([members.drop(common), changed.dropna()])
+        self.members = top_k(candidates.sort_index(), self.k, largest=self.largest)
+        return self
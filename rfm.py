@@ -39,11 +39,12 @@
 # 2. Data Understanding
 ######################################
 import pandas as pd
+from ingestion import load_transactions
 pd.set_option('display.max_columns', None)
 # pd.set_option('display.max_rows', None)
 pd.set_option('display.float_format', lambda x: '%.3f' % x)
 
-df_ = pd.read_excel("datasets/online_retail_II.xlsx")
+df_ = load_transactions("datasets/online_retail_II.xlsx")
 df = df_.copy()
 
 df.head()
@@ -169,51 +170,8 @@ rfm.to_csv("rfm.csv")
 # 7. Functionalization of the entire process
 ######################################
 
-def create_rfm(dataframe, csv = False):
-
-    # Data Preparation
-    dataframe["TotalPrice"] = dataframe["Quantity"] * dataframe["Price"]
-    dataframe.dropna(inplace=True)
-    dataframe = dataframe[~dataframe["Invoice"].str.contains("C", na=False)]
-
-    # Calculation RFM Metrics
-    today_date = dt.datetime(2010, 12, 11)
-
-    rfm = dataframe.groupby('Customer ID').agg({'InvoiceDate': lambda InvoiceDate: (today_date - InvoiceDate.max()).days,
-                                         'Invoice': lambda Invoice: Invoice.nunique(),
-                                         'TotalPrice': lambda TotalPrice: TotalPrice.sum()})
-
-    rfm.columns = ["recency", "frequency", "monetary"]
-    rfm = rfm[rfm["monetary"] > 0]
-
-    # Calculation RFM Scores
-    rfm["recency_score"] = pd.qcut(rfm["recency"], 5, labels=[5, 4, 3, 2, 1])
-    rfm["frequency_score"] = pd.qcut(rfm["frequency"].rank(method="first"), 5, labels=[1, 2, 3, 4, 5])
-    rfm["monetary_score"] = pd.qcut(rfm["monetary"], 5, labels=[1, 2, 3, 4, 5])
-
-    rfm["RFM_SCORE"] = (rfm["recency_score"].astype(str) + rfm["frequency_score"].astype(str))
-
-    # RFM categorization
-    seg_map = {
-        r'[1-2][1-2]': 'hibernating',
-        r'[1-2][3-4]': 'at_risk',
-        r'[1-2]5': 'cant_loose',
-        r'3[1-2]': 'about_to_sleep',
-        r'33': 'need_attention',
-        r'[3-4][4-5]': 'loyal_customers',
-        r'41': 'promising',
-        r'51': 'new_customers',
-        r'[4-5][2-3]': 'potential_loyalist',
-        r'5[4-5]': 'champions'
-    }
-    rfm['segment'] = rfm['RFM_SCORE'].replace(seg_map, regex=True)
-    rfm = rfm[["recency", "frequency", "monetary", "segment"]]
-    rfm.index = rfm.index.astype(int)
-
-    if csv:
-        rfm.to_csv("rfm_with_func.csv")
-
-    return rfm
+# the function lives in pipelines.py, so it can be imported without running this script
+from pipelines import create_rfm
 
 df = df_.copy()
 
@@ -225,3 +183,5 @@ rfm_new = create_rfm(df, csv = True)
 # this data may change at certain periods. Therefore, it is very critical to observe the changes here.
 # After re-running the analysis, it should be possible to report the changes in the segments
 # formed & it should be sent to the specific department for action.
+# incremental.py keeps a persisted RFM state that is updated with each day's transactions
+# and reports the segment migration (from-segment -> to-segment) of every update.
@@ -0,0 +1,295 @@
+######################################
+# CLTV Model Artifacts & Scoring Service
+######################################
+# create_cltv_p refits the BG-NBD and Gamma-Gamma models on every call and only writes cltv_prediction.csv.
+# A CLTVModel holds what scoring needs : the fitted parameters of both models, the CLTV horizon settings,
+# the qcut boundaries of the CLTV segments and the outlier limits of Quantity and Price the model was fitted with.
+# It is fitted once, saved as a versioned JSON artifact (models/cltv_model_v<N>.json) and reloaded to score single
+# customers or small batches. Scoring takes customer features, not transactions : the outlier limits are applied
+# when the features are built (create_cltv_p(model=...) caps the transactions with model.capper).
+# Scoring works on plain lists and NumPy arrays, no model is refitted and no DataFrame is built per request.
+# The same model is served over a local HTTP endpoint built on asyncio streams :
+#   GET  /health -> {"version": ...}
+#   POST /score  -> body is one customer or a list of customers :
+#                   {"Customer ID": 12347.0, "frequency": 7, "recency": 52.1, "T": 52.6, "monetary": 615.7}
+# Usage : python scoring.py [model_dir] [port]
+
+# 1. CLTV Model
+# 2. Versioned Artifacts
+# 3. HTTP Endpoint
+
+import asyncio
+import datetime as dt
+import json
+import os
+import re
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+from lifetime_models import (BGNBDFitter, GGFitter, BGNBD_PARAMS, GAMMA_GAMMA_PARAMS, MIN_ROWS_TO_GROUP,
+                             clv_horizons, discounted_clv, unique_tuples)
+from preprocessing import OutlierCapper
+from quantile_sketch import QuantileScorer, CLTV_LABELS
+
+MODEL_DIR = "models"
+
+# expected purchase columns of create_cltv_p and their horizon in weeks
+PURCHASE_HORIZONS = {"expected_purc_1_week": 1,
+                     "expected_purc_1_month": 4,
+                     "expected_purc_3_month": 12}
+
+FEATURES = ["frequency", "recency", "T", "monetary"]
+
+
+######################################
+# 1. CLTV Model
+######################################
+
+def clv_segment_scorer(clv):
+    """
+        Scorer of the CLTV segments (D, C, B, A) with the qcut quartile boundaries of the given CLTV values.
+    """
+
+    _, bins = pd.qcut(clv, len(CLTV_LABELS["clv"]), retbins=True)
+    return QuantileScorer({"clv": bins[1:-1]}, CLTV_LABELS)
+
+
+class CLTVModel:
+    """
+        Fitted BG-NBD & Gamma-Gamma parameters, CLTV settings and CLTV segment boundaries.
+        Customers are described by the columns of lifetime_data : frequency, recency and T in weeks, monetary.
+        capper holds the outlier limits of the transactions the model was fitted on (unfitted if none were given),
+        so that new transactions are capped like the training ones. predict / score_frame / score do not cap :
+        the features they get must come from transactions capped with capper (as create_cltv_p(model=...) does).
+    """
+
+    def __init__(self, bgf_params, ggf_params, clv_edges, time=3, freq="W", discount_rate=0.01,
+                 purchase_horizons=PURCHASE_HORIZONS, bgf_penalizer=0.001, ggf_penalizer=0.01,
+                 outlier_limits=None, version=None, created_at=None):
+        self.bgf = BGNBDFitter()
+        self.bgf.params_ = pd.Series(bgf_params, dtype="float64")[BGNBD_PARAMS]
+        self.ggf = GGFitter()
+        self.ggf.params_ = pd.Series(ggf_params, dtype="float64")[GAMMA_GAMMA_PARAMS]
+        self.scorer = QuantileScorer({"clv": clv_edges}, CLTV_LABELS)
+        self.time = time
+        self.freq = freq
+        self.discount_rate = discount_rate
+        self.purchase_horizons = dict(purchase_horizons)
+        self.bgf_penalizer = bgf_penalizer
+        self.ggf_penalizer = ggf_penalizer
+        self.capper = OutlierCapper(outlier_limits)
+        self.version = version
+        self.created_at = created_at
+        # all horizons are predicted in one batch : the reported ones, then the CLTV months
+        self._horizons = list(self.purchase_horizons.values()) + list(clv_horizons(time, freq))
+
+    @classmethod
+    def fit(cls, cltv_df, bgf_params=None, bgf_penalizer=0.001, ggf_penalizer=0.01, **kwargs):
+        """
+            Fits both models on the distinct customer tuples of a lifetime_data frame
+            and takes the CLTV segment boundaries from its qcut quartiles.
+        """
+
+        bgnbd_tuples, bgnbd_weights, _ = unique_tuples(cltv_df["frequency"], cltv_df["recency"], cltv_df["T"])
+        bgf = BGNBDFitter(penalizer_coef=bgf_penalizer)
+        bgf.fit(*bgnbd_tuples, weights=bgnbd_weights, initial_params=bgf_params)
+
+        gg_tuples, gg_weights, _ = unique_tuples(cltv_df["frequency"], cltv_df["monetary"])
+        ggf = GGFitter(penalizer_coef=ggf_penalizer)
+        ggf.fit(*gg_tuples, weights=gg_weights)
+
+        model = cls(bgf.params_, ggf.params_, [], bgf_penalizer=bgf_penalizer, ggf_penalizer=ggf_penalizer, **kwargs)
+        model.scorer = clv_segment_scorer(model.predict(*(cltv_df[col] for col in FEATURES))["clv"])
+        return model
+
+    def _predict(self, frequency, recency, T, monetary):
+        frequency = np.asarray(frequency, dtype="float64")
+        recency = np.asarray(recency, dtype="float64")
+        T = np.asarray(T, dtype="float64")
+        monetary = np.asarray(monetary, dtype="float64")
+
+        if len(frequency) >= MIN_ROWS_TO_GROUP:
+            bgnbd_tuples, _, inverse = unique_tuples(frequency, recency, T)
+            expected = self.bgf.predict_horizons(self._horizons, *bgnbd_tuples)[inverse]
+        else:
+            expected = self.bgf.predict_horizons(self._horizons, frequency, recency, T)
+
+        n_purchase = len(self.purchase_horizons)
+        scores = {col: expected[:, i] for i, col in enumerate(self.purchase_horizons)}
+        scores["expected_average_profit"] = self.ggf.conditional_expected_average_profit(frequency, monetary)
+        scores["clv"] = discounted_clv(expected[:, n_purchase:], scores["expected_average_profit"], self.discount_rate)
+        return scores, self.scorer.codes(scores["clv"], "clv")
+
+    def predict(self, frequency, recency, T, monetary):
+        """
+            Expected purchases, expected average profit, CLTV and segment of the given customers as NumPy arrays.
+        """
+
+        scores, codes = self._predict(frequency, recency, T, monetary)
+        scores["segment"] = pd.Categorical.from_codes(codes, categories=self.scorer.labels["clv"], ordered=True)
+        return scores
+
+    def score_frame(self, cltv_df):
+        """
+            Scores a lifetime_data frame, with the columns create_cltv_p returns.
+        """
+
+        scores = self.predict(*(cltv_df[col] for col in FEATURES))
+        cltv_final = cltv_df.reset_index()
+        for col, values in scores.items():
+            cltv_final[col] = values
+        return cltv_final
+
+    def score(self, customers):
+        """
+            Scores one customer (a dict) or a small batch (a list of dicts) and returns dicts of the same shape.
+            Keys other than the model features (e.g. Customer ID) are passed through.
+        """
+
+        batch = [customers] if isinstance(customers, dict) else list(customers)
+        scores, codes = self._predict(*([customer[col] for customer in batch] for col in FEATURES))
+        columns = {col: values.tolist() for col, values in scores.items()}
+        labels = self.scorer.labels["clv"]
+        results = []
+        for i, (customer, code) in enumerate(zip(batch, codes.tolist())):
+            result = dict(customer)
+            result.update({col: values[i] for col, values in columns.items()})
+            result["segment"] = labels[code]
+            results.append(result)
+        return results[0] if isinstance(customers, dict) else results
+
+    def to_dict(self):
+        return {"version": self.version,
+                "created_at": self.created_at,
+                "bgf_params": self.bgf.params_.to_dict(),
+                "ggf_params": self.ggf.params_.to_dict(),
+                "clv_edges": self.scorer.edges["clv"].tolist(),
+                "time": self.time,
+                "freq": self.freq,
+                "discount_rate": self.discount_rate,
+                "purchase_horizons": self.purchase_horizons,
+                "bgf_penalizer": self.bgf_penalizer,
+                "ggf_penalizer": self.ggf_penalizer,
+                "outlier_limits": self.capper.to_dict() if self.capper.is_fitted else None}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(**state)
+
+
+######################################
+# 2. Versioned Artifacts
+######################################
+
+def _versions(directory):
+    if not os.path.isdir(directory):
+        return []
+    matches = (re.fullmatch(r"cltv_model_v(\d+)\.json", name) for name in os.listdir(directory))
+    return sorted(int(match.group(1)) for match in matches if match)
+
+
+def save_model(model, directory=MODEL_DIR):
+    """
+        Saves the model as the next version in the directory and returns the artifact path.
+        The artifact is written to a temporary file first, so a loading service never reads a partial file,
+        and hard linked to its final name, which fails if another process took that version first (then the next
+        free version is tried) : concurrent saves never overwrite each other.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    model.created_at = dt.datetime.now().isoformat(timespec="seconds")
+    handle, tmp = tempfile.mkstemp(prefix=".cltv_model_", suffix=".tmp", dir=directory)
+    os.close(handle)
+    try:
+        version = (_versions(directory) or [0])[-1] + 1
+        while True:
+            model.version = version
+            with open(tmp, "w") as file:
+                json.dump(model.to_dict(), file, indent=2)
+            path = os.path.join(directory, f"cltv_model_v{version}.json")
+            try:
+                os.link(tmp, path)
+                return path
+            except FileExistsError:
+                version = max((_versions(directory) or [0])[-1], version) + 1
+    finally:
+        os.remove(tmp)
+
+
+def load_model(directory=MODEL_DIR, version=None):
+    """
+        Loads the given version of the model, the latest one by default.
+    """
+
+    versions = _versions(directory)
+    if not versions:
+        raise FileNotFoundError(f"No CLTV model artifact in {directory}")
+    version = versions[-1] if version is None else version
+    with open(os.path.join(directory, f"cltv_model_v{version}.json")) as file:
+        return CLTVModel.from_dict(json.load(file))
+
+
+######################################
+# 3. HTTP Endpoint
+######################################
+
+def _route(model, method, target, body):
+    if method == "GET" and target == "/health":
+        return "200 OK", {"version": model.version}
+    if method == "POST" and target == "/score":
+        try:
+            return "200 OK", model.score(json.loads(body))
+        except (ValueError, KeyError, TypeError) as error:
+            return "400 Bad Request", {"error": f"{type(error).__name__}: {error}"}
+    return "404 Not Found", {"error": f"{method} {target}"}
+
+
+async def _handle(reader, writer, model):
+    # HTTP/1.1 with persistent connections, so a client pays the connection setup only once
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+            status, payload = _route(model, method, target, body)
+            data = json.dumps(payload).encode("utf-8")
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+            await writer.drain()
+            if headers.get("connection", "").lower() == "close":
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_scoring_server(model, host="127.0.0.1", port=8080):
+    """
+        Starts serving the preloaded model and returns the asyncio server.
+    """
+
+    return await asyncio.start_server(lambda reader, writer: _handle(reader, writer, model), host, port)
+
+
+async def serve(model, host="127.0.0.1", port=8080):
+    server = await start_scoring_server(model, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    model_dir = sys.argv[1] if len(sys.argv) > 1 else MODEL_DIR
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080
+    asyncio.run(serve(load_model(model_dir), port=port))
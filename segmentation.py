@@ -0,0 +1,89 @@
+######################################
+# RFM Scores & Segments
+######################################
+# Scoring and segmentation steps of create_rfm, shared with the incremental RFM state.
+# Segments are assigned through a 5x5 lookup table indexed by (recency_score, frequency_score).
+# The regex segment map is compiled into that table once, so segmentation is an integer lookup per customer.
+
+# 1. RFM Scores
+# 2. RFM Segments
+
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+
+######################################
+# 1. RFM Scores
+######################################
+
+def rfm_scores(rfm):
+    """
+        Adds recency_score, frequency_score and monetary_score to an RFM metrics frame.
+        Scores are quintiles (1-5); frequency is ranked first because it has many ties.
+    """
+
+    rfm["recency_score"] = pd.qcut(rfm["recency"], 5, labels=[5, 4, 3, 2, 1])
+    rfm["frequency_score"] = pd.qcut(rfm["frequency"].rank(method="first"), 5, labels=[1, 2, 3, 4, 5])
+    rfm["monetary_score"] = pd.qcut(rfm["monetary"], 5, labels=[1, 2, 3, 4, 5])
+    return rfm
+
+
+######################################
+# 2. RFM Segments
+######################################
+
+# RFM categorization
+SEG_MAP = {
+    r'[1-2][1-2]': 'hibernating',
+    r'[1-2][3-4]': 'at_risk',
+    r'[1-2]5': 'cant_loose',
+    r'3[1-2]': 'about_to_sleep',
+    r'33': 'need_attention',
+    r'[3-4][4-5]': 'loyal_customers',
+    r'41': 'promising',
+    r'51': 'new_customers',
+    r'[4-5][2-3]': 'potential_loyalist',
+    r'5[4-5]': 'champions'
+}
+
+
+@lru_cache(maxsize=None)
+def _compile(seg_items):
+    categories = []
+    table = np.empty((5, 5), dtype=np.int8)
+    for recency in range(1, 6):
+        for frequency in range(1, 6):
+            # same substitution as Series.replace(seg_map, regex=True) on an RFM_SCORE string : the patterns are
+            # applied in order, but only the ones that match the original score, not an earlier pattern's output
+            score = segment = f"{recency}{frequency}"
+            for pattern, name in seg_items:
+                if re.search(pattern, score):
+                    segment = re.sub(pattern, name, segment)
+            if segment not in categories:
+                categories.append(segment)
+            table[recency - 1, frequency - 1] = categories.index(segment)
+    table.setflags(write=False)
+    return table, tuple(categories)
+
+
+def compile_seg_map(seg_map=SEG_MAP):
+    """
+        Compiles a regex segment map into a 5x5 table of segment codes and the list of segment names.
+        Compiled tables are cached, so a user supplied map is only compiled once.
+    """
+
+    return _compile(tuple(seg_map.items()))
+
+
+def rfm_segments(rfm, seg_map=SEG_MAP):
+    """
+        Looks up the segment of each (recency_score, frequency_score) pair and returns it as a Categorical Series.
+    """
+
+    table, categories = compile_seg_map(seg_map)
+    recency = rfm["recency_score"].cat.categories.to_numpy(dtype=np.int8)[rfm["recency_score"].cat.codes.to_numpy()]
+    frequency = rfm["frequency_score"].cat.categories.to_numpy(dtype=np.int8)[rfm["frequency_score"].cat.codes.to_numpy()]
+    codes = table[recency - 1, frequency - 1]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=rfm.index, name="segment")
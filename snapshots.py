@@ -0,0 +1,134 @@
+######################################
+# Point-in-Time RFM Snapshots
+######################################
+# create_rfm computes recency, frequency and monetary as of a single today_date. Backtesting campaigns needs the RFM
+# segments as of many dates (e.g. every month over two years), which would be one full recomputation per date.
+# Here the prepared transactions are sorted once by (customer, date) and turned into cumulative per-customer arrays:
+# running TotalPrice, the dates, and the first date of every distinct invoice.
+# The state of every customer as of a date is then a binary search (searchsorted) into these arrays, so each
+# snapshot costs O(customers x log(rows)) plus the qcut scoring, instead of a cleaning pass and a groupby.
+# An as-of date plays the role of create_rfm's today_date : transactions before it count, recency is measured to it.
+#   snapshots = rfm_snapshots(df, pd.date_range("2010-01-01", "2011-12-01", freq="MS"))
+
+# 1. Cumulative Customer Arrays
+# 2. Snapshots
+
+import warnings
+import numpy as np
+import pandas as pd
+from instrumentation import stage
+from preprocessing import prepare_rfm
+from segmentation import rfm_scores, rfm_segments
+
+
+######################################
+# 1. Cumulative Customer Arrays
+######################################
+
+class CustomerHistory:
+    """
+        Prepared transactions sorted once by (customer, date), with running totals per customer.
+        Rows are addressed by key = customer code * (number of distinct dates + 1) + date rank,
+        so "rows of customer c before date d" is a single searchsorted for all customers at once.
+        Transactions without any kept row give a history without customers.
+    """
+
+    def __init__(self, dataframe, customer_col="Customer ID"):
+        dataframe = prepare_rfm(dataframe)
+        customers, self.customer_ids = pd.factorize(dataframe[customer_col], sort=True)
+        date_ranks, self.dates = pd.factorize(dataframe["InvoiceDate"], sort=True)
+        self.customer_col = customer_col
+        self.n_keys = len(self.dates) + 1
+
+        keys = customers.astype("int64") * self.n_keys + date_ranks
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.row_dates = self.dates.to_numpy()[date_ranks[order]]
+        # running TotalPrice restarted for every customer, so rounding does not carry over between customers
+        self.cum_price = (pd.Series(dataframe["TotalPrice"].to_numpy()[order])
+                          .groupby(customers[order]).cumsum().to_numpy())
+
+        # an invoice counts from the first date one of its rows appears on
+        # (sized by the distinct invoices, so transactions without any kept row give empty arrays)
+        invoices, invoice_ids = pd.factorize(dataframe["Invoice"])
+        pairs = customers.astype("int64")[order] * (len(invoice_ids) + 1) + invoices[order]
+        self.invoice_keys = self.keys[~pd.Series(pairs).duplicated().to_numpy()]
+
+        first_keys = np.arange(len(self.customer_ids), dtype="int64") * self.n_keys
+        self.row_start = np.searchsorted(self.keys, first_keys)
+        self.invoice_start = np.searchsorted(self.invoice_keys, first_keys)
+
+    def rfm(self, as_of_date):
+        """
+            recency, frequency and monetary as of the date, for the customers with a transaction before it.
+            Same values as rfm_metrics on the transactions before the date.
+        """
+
+        as_of_date = pd.Timestamp(as_of_date)
+        rank = np.searchsorted(self.dates, as_of_date, side="left")
+        query = np.arange(len(self.customer_ids), dtype="int64") * self.n_keys + rank
+        end = np.searchsorted(self.keys, query)
+        active = end > self.row_start
+
+        last = end[active] - 1
+        recency = (as_of_date.to_datetime64() - self.row_dates[last]) // np.timedelta64(1, "D")
+        frequency = np.searchsorted(self.invoice_keys, query[active]) - self.invoice_start[active]
+        index = pd.Index(self.customer_ids[active], name=self.customer_col)
+        return pd.DataFrame({"recency": recency.astype("int64"),
+                             "frequency": frequency.astype("int64"),
+                             "monetary": self.cum_price[last]}, index=index)
+
+
+######################################
+# 2. Snapshots
+######################################
+
+def rfm_snapshot(history, as_of_date):
+    """
+        RFM metrics, scores and segment of one as-of date, like create_rfm with today_date = as_of_date.
+        Raises a ValueError when the customers as of the date cannot be put in 5 quantile bins
+        (e.g. a date before the data, or too few distinct values).
+    """
+
+    rfm = history.rfm(as_of_date)
+    rfm = rfm[rfm["monetary"] > 0].copy()
+    if len(rfm) == 0:
+        raise ValueError(f"no customer with a purchase before {pd.Timestamp(as_of_date).date()}")
+    rfm = rfm_scores(rfm)
+    rfm["segment"] = rfm_segments(rfm)
+    rfm.index = rfm.index.astype(int)
+    return rfm
+
+
+def rfm_snapshots(dataframe, as_of_dates, customer_col="Customer ID"):
+    """
+        Long table of the RFM snapshots as of every date, indexed by (as_of, customer) :
+        recency, frequency, monetary, their scores and the segment.
+        The transactions are prepared and sorted once; every date only adds a search and the scoring.
+        Dates whose customers cannot be scored (see rfm_snapshot) are skipped with a warning.
+    """
+
+    with stage("rfm_snapshots", "history", rows_in=len(dataframe)) as step:
+        history = CustomerHistory(dataframe, customer_col)
+        step.rows_out = len(history.keys)
+
+    with stage("rfm_snapshots", "snapshots", rows_in=len(history.customer_ids)) as step:
+        snapshots = {}
+        for date in pd.DatetimeIndex(as_of_dates):
+            try:
+                snapshots[date] = rfm_snapshot(history, date)
+            except ValueError as error:
+                warnings.warn(f"no RFM snapshot as of {date.date()}: {error}", stacklevel=2)
+        if not snapshots:
+            raise ValueError("none of the as-of dates could be scored")
+        snapshots = pd.concat(snapshots, names=["as_of"])
+        step.rows_out = len(snapshots)
+    return snapshots
+
+
+def snapshot_panel(snapshots, column="segment"):
+    """
+        Wide customer x as_of table of one column of rfm_snapshots (missing before a customer's first purchase).
+    """
+
+    return snapshots[column].unstack("as_of")
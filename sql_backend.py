@@ -0,0 +1,264 @@
+######################################
+# Embedded SQL Aggregation Backend
+######################################
+# The pandas pipelines hold the whole transaction table in memory for the cleaning filters and the
+# groupby('Customer ID') stage. Here the same filters and per-customer aggregates run as SQL in an embedded engine
+# directly over a Parquet or CSV file, and only the customer summary comes back as a DataFrame :
+#   duckdb : reads the file in place, spills to temp_directory when the aggregation exceeds memory_limit
+#   sqlite : standard library fallback, the file is loaded chunk by chunk into an on-disk database first
+# Both return the table customer_summary returns on the prepared transactions of the pipeline, so the rest of
+# create_rfm / create_cltv_calculation / create_cltv_p runs unchanged (see their backend parameter; their
+# backend_options are passed on to the backend function, e.g. DuckDB's memory_limit, temp_directory and threads).
+# The create_cltv_p outlier limits are taken from exact value counts computed in SQL, like OutlierCapper.partial_fit.
+# check_parity compares the SQL backends with the pandas path on a file.
+# Usage : python sql_backend.py <transactions.parquet | transactions.csv> [duckdb | sqlite]
+
+# 1. Sources
+# 2. Cleaning & Aggregation SQL
+# 3. Backends
+# 4. Parity Check
+
+import os
+import sqlite3
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+from customer_summary import customer_summary
+from ingestion import TEXT_COLUMNS
+from preprocessing import prepare_rfm, prepare_cltv, filter_cltv_p, OutlierCapper, ValueCounter, thresholds_from_counts
+from streaming import read_chunks, CHUNKSIZE
+
+COLUMN_TYPES = {"Invoice": "VARCHAR",
+                "StockCode": "VARCHAR",
+                "Description": "VARCHAR",
+                "Quantity": "BIGINT",
+                "InvoiceDate": "TIMESTAMP",
+                "Price": "DOUBLE",
+                "Customer ID": "DOUBLE",
+                "Country": "VARCHAR"}
+
+# strings pd.read_csv reads as missing values by default
+CSV_NULLS = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN", "<NA>",
+             "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"]
+
+# filters of prepare_rfm, prepare_cltv and filter_cltv_p on top of "not cancelled & no missing value"
+PIPELINE_FILTERS = {"rfm": [],
+                    "cltv_calculation": ["Quantity > 0"],
+                    "cltv_prediction": ["Quantity > 0", "Price > 0"]}
+
+# dtypes of customer_summary (capped quantities are floats, like the Quantity column after cap_outliers)
+SUMMARY_DTYPES = {"first_date": "datetime64[ns]",
+                  "last_date": "datetime64[ns]",
+                  "n_invoices": "int64",
+                  "total_unit": "int64",
+                  "total_price": "float64"}
+
+
+######################################
+# 1. Sources
+######################################
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _duckdb_source(connection, path):
+    # the file is scanned in place, CSV columns are typed like ingestion.typed_transactions
+    if os.path.splitext(path)[1].lower() == ".parquet":
+        connection.execute(f"CREATE TEMP VIEW transactions AS SELECT * FROM read_parquet({_literal(path)})")
+    else:
+        header = pd.read_csv(path, nrows=0).columns
+        types = ", ".join(f"{_literal(col)}: {_literal(COLUMN_TYPES.get(col, 'VARCHAR'))}" for col in header)
+        nulls = ", ".join(_literal(value) for value in CSV_NULLS)
+        connection.execute(f"CREATE TEMP VIEW transactions AS SELECT * FROM read_csv({_literal(path)}, header = true, "
+                           f"types = {{{types}}}, nullstr = [{nulls}])")
+    return [row[0] for row in connection.execute("DESCRIBE transactions").fetchall()]
+
+
+def _sqlite_source(connection, path, chunksize=CHUNKSIZE):
+    # SQLite cannot read Parquet or typed CSV, the file is copied into the database chunk by chunk
+    columns = None
+    for chunk in read_chunks(path, chunksize):
+        if columns is None:
+            columns = list(chunk.columns)
+            connection.execute(f"CREATE TABLE transactions ({', '.join(_quote(col) for col in columns)})")
+        chunk = chunk.astype({col: "object" for col in TEXT_COLUMNS if col in chunk.columns})
+        chunk["InvoiceDate"] = chunk["InvoiceDate"].dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+        rows = chunk.astype("object").where(chunk.notna(), None).itertuples(index=False, name=None)
+        connection.executemany(f"INSERT INTO transactions VALUES ({', '.join('?' * len(columns))})", rows)
+    connection.commit()
+    return columns
+
+
+######################################
+# 2. Cleaning & Aggregation SQL
+######################################
+
+def cleaned_rows_sql(columns, pipeline):
+    """
+        SELECT of the rows the pipeline keeps : no missing value, not cancelled ('C' in the invoice number,
+        case sensitive like str.contains) and the pipeline's Quantity / Price filters.
+    """
+
+    conditions = [f"{_quote(col)} IS NOT NULL" for col in columns]
+    conditions.append("instr(Invoice, 'C') = 0")
+    conditions += PIPELINE_FILTERS[pipeline]
+    return f"SELECT * FROM transactions WHERE {' AND '.join(conditions)}"
+
+
+def value_counts_sql(cleaned, column):
+    return f"SELECT {_quote(column)} AS value, COUNT(*) AS count FROM ({cleaned}) GROUP BY 1"
+
+
+def summary_sql(cleaned, customer_col="Customer ID", limits=None, dialect="duckdb"):
+    """
+        The customer_summary aggregates of the cleaned rows, Quantity and Price capped at the given limits.
+    """
+
+    quantity, price = "Quantity", "Price"
+    if limits is not None:
+        # SQLite has scalar min / max, DuckDB least / greatest
+        low, high = ("max", "min") if dialect == "sqlite" else ("greatest", "least")
+        quantity = f"{high}({low}(CAST(Quantity AS DOUBLE), {limits['Quantity'][0]!r}), {limits['Quantity'][1]!r})"
+        price = f"{high}({low}(Price, {limits['Price'][0]!r}), {limits['Price'][1]!r})"
+    customer = _quote(customer_col)
+    return (f"SELECT {customer} AS customer, MIN(InvoiceDate) AS first_date, MAX(InvoiceDate) AS last_date, "
+            f"COUNT(DISTINCT Invoice) AS n_invoices, SUM({quantity}) AS total_unit, "
+            f"SUM({quantity} * {price}) AS total_price "
+            f"FROM ({cleaned}) GROUP BY {customer} ORDER BY {customer}")
+
+
+######################################
+# 3. Backends
+######################################
+
+def _run_summary(query, columns, pipeline, capper, customer_col, dialect):
+    # query(sql) -> DataFrame on a connection whose transactions table / view is the file
+    cleaned = cleaned_rows_sql(columns, pipeline)
+    limits = None
+    if pipeline == "cltv_prediction":
+        capper = capper if capper is not None else OutlierCapper()
+        if not capper.is_fitted:
+            counters = {}
+            for col in capper.columns:
+                counts = query(value_counts_sql(cleaned, col)).set_index("value")["count"]
+                counters[col] = ValueCounter()
+                counters[col].counts = counts.astype("int64")
+            capper.limits_ = {col: thresholds_from_counts(counter) for col, counter in counters.items()}
+        limits = capper.limits_
+
+    summary = query(summary_sql(cleaned, customer_col, limits, dialect))
+    # SQLite returns the dates as text
+    summary["first_date"] = pd.to_datetime(summary["first_date"])
+    summary["last_date"] = pd.to_datetime(summary["last_date"])
+    dtypes = {**SUMMARY_DTYPES, "total_unit": "int64" if limits is None else "float64"}
+    summary = summary.astype({"customer": "float64", **dtypes})
+    return summary.set_index("customer").rename_axis(customer_col)
+
+
+def duckdb_summary(path, pipeline, capper=None, customer_col="Customer ID", memory_limit=None, temp_directory=None,
+                   threads=None):
+    """
+        customer_summary of the pipeline's prepared transactions, computed by DuckDB over a Parquet or CSV file.
+        Aggregations larger than memory_limit (e.g. "2GB") spill to temp_directory.
+    """
+
+    import duckdb
+
+    connection = duckdb.connect()
+    try:
+        if memory_limit is not None:
+            connection.execute(f"SET memory_limit = {_literal(memory_limit)}")
+        if temp_directory is not None:
+            connection.execute(f"SET temp_directory = {_literal(temp_directory)}")
+        if threads is not None:
+            connection.execute(f"SET threads = {int(threads)}")
+
+        columns = _duckdb_source(connection, path)
+        return _run_summary(lambda sql: connection.execute(sql).df(), columns, pipeline, capper, customer_col, "duckdb")
+    finally:
+        connection.close()
+
+
+def sqlite_summary(path, pipeline, capper=None, customer_col="Customer ID", temp_directory=None, chunksize=CHUNKSIZE):
+    """
+        customer_summary of the pipeline's prepared transactions, computed by SQLite.
+        The file is loaded into a temporary on-disk database in temp_directory, which is removed afterwards.
+    """
+
+    handle, database = tempfile.mkstemp(suffix=".sqlite", dir=temp_directory)
+    os.close(handle)
+    connection = sqlite3.connect(database)
+    try:
+        columns = _sqlite_source(connection, path, chunksize)
+        return _run_summary(lambda sql: pd.read_sql_query(sql, connection), columns, pipeline, capper, customer_col,
+                            "sqlite")
+    finally:
+        connection.close()
+        os.remove(database)
+
+
+def pandas_summary(path, pipeline, capper=None, customer_col="Customer ID"):
+    """
+        The default in-memory path : the whole file is read, prepared and aggregated with pandas.
+    """
+
+    dataframe = pd.concat(read_chunks(path), ignore_index=True)
+    if pipeline == "rfm":
+        dataframe = prepare_rfm(dataframe)
+    elif pipeline == "cltv_calculation":
+        dataframe = prepare_cltv(dataframe)
+    else:
+        dataframe = filter_cltv_p(dataframe)
+        capper = capper if capper is not None else OutlierCapper()
+        if not capper.is_fitted:
+            capper.fit(dataframe)
+        dataframe = capper.transform(dataframe)
+    return customer_summary(dataframe, customer_col)
+
+
+BACKENDS = {"pandas": pandas_summary,
+            "duckdb": duckdb_summary,
+            "sqlite": sqlite_summary}
+
+
+def file_summary(path, pipeline, backend="pandas", **kwargs):
+    """
+        customer_summary of the given pipeline ("rfm", "cltv_calculation" or "cltv_prediction")
+        for the transactions of a Parquet or CSV file, computed by the given backend.
+        kwargs go to the backend function (duckdb_summary : memory_limit, temp_directory, threads, ...).
+    """
+
+    return BACKENDS[backend](path, pipeline, **kwargs)
+
+
+######################################
+# 4. Parity Check
+######################################
+
+def check_parity(path, backend="duckdb", pipelines=tuple(PIPELINE_FILTERS), rtol=1e-9):
+    """
+        Compares the summaries of a SQL backend with the pandas path for every pipeline and raises an
+        AssertionError on any difference (sums may differ in the last digits : SQL engines add in another order).
+        Returns the largest absolute difference of total_price per pipeline.
+    """
+
+    differences = {}
+    for pipeline in pipelines:
+        expected = pandas_summary(path, pipeline)
+        result = file_summary(path, pipeline, backend)
+        # pd.read_csv parses the dates at microsecond resolution, the SQL backends return nanoseconds like the cache
+        expected = expected.astype({"first_date": result["first_date"].dtype, "last_date": result["last_date"].dtype})
+        pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=rtol)
+        difference = np.abs(result["total_price"].to_numpy() - expected["total_price"].to_numpy())
+        differences[pipeline] = float(difference.max(initial=0.0))
+    return differences
+
+
+if __name__ == "__main__":
+    print(check_parity(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "duckdb"))
@@ -0,0 +1,163 @@
+######################################
+# Out-of-Core Streaming RFM & CLTV Aggregation
+######################################
+# create_rfm and create_cltv_p need the whole transaction table in memory.
+# Here transactions are read in chunks (CSV chunks or Parquet record batches), each chunk is cleaned on its own
+# and folded into mergeable per-customer accumulators. Memory grows with the number of customers, not with the number
+# of transaction rows or invoices : the rows of an invoice are consecutive in the file (as in the Online Retail export
+# and synthetic.py), so invoices are counted per customer inside each chunk and only the last invoice of a chunk,
+# which can continue in the next one, is carried over to be counted once.
+
+# 1. Reading Chunks
+# 2. Mergeable Accumulators
+# 3. Streaming RFM
+# 4. Streaming Lifetime Data
+
+import datetime as dt
+import os
+import pandas as pd
+from customer_summary import rfm_metrics, lifetime_data, SUMMARY_DTYPES
+from ingestion import typed_transactions, TEXT_COLUMNS
+from preprocessing import prepare_rfm, filter_cltv_p, OutlierCapper
+
+CHUNKSIZE = 1_000_000
+
+
+######################################
+# 1. Reading Chunks
+######################################
+
+def read_chunks(path, chunksize=CHUNKSIZE):
+    """
+        Yields typed transaction chunks from a CSV file or from the record batches of a Parquet file.
+    """
+
+    if os.path.splitext(path)[1].lower() == ".parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield typed_transactions(batch.to_pandas())
+    else:
+        dtypes = {col: "string" for col in TEXT_COLUMNS}
+        for chunk in pd.read_csv(path, chunksize=chunksize, dtype=dtypes, parse_dates=["InvoiceDate"]):
+            yield typed_transactions(chunk)
+
+
+######################################
+# 2. Mergeable Accumulators
+######################################
+
+class CustomerAccumulator:
+    """
+        Per-customer first/last date, invoice count, unit and price totals.
+        Chunks are folded in with update in file order, partial accumulators are combined with merge (other holding
+        the rows that follow self's). The rows of an invoice must be consecutive, ValueError otherwise.
+    """
+
+    def __init__(self, customer_col="Customer ID"):
+        self.customer_col = customer_col
+        self.totals = None
+        # per-chunk totals not combined yet, combined once they outgrow the totals (linear in the number of chunks)
+        self.pending = []
+        self.pending_rows = 0
+        # first and last (customer, invoice) pair folded in : the invoices that can span a chunk boundary
+        self.head = self.tail = None
+
+    def update(self, chunk):
+        if len(chunk) == 0:
+            return self
+        # an invoice is counted at its first row, its rows must follow each other
+        invoices = chunk["Invoice"]
+        starts = invoices.ne(invoices.shift()).fillna(True).to_numpy(dtype=bool)
+        if not invoices[starts].is_unique:
+            raise ValueError("the rows of an invoice must be consecutive to be streamed")
+        totals = chunk.assign(n_invoices=starts).groupby(self.customer_col).agg(first_date=("InvoiceDate", "min"),
+                                                                                last_date=("InvoiceDate", "max"),
+                                                                                n_invoices=("n_invoices", "sum"),
+                                                                                total_unit=("Quantity", "sum"),
+                                                                                total_price=("TotalPrice", "sum"))
+        customers = chunk[self.customer_col]
+        self._fold(totals, (customers.iat[0], invoices.iat[0]), (customers.iat[-1], invoices.iat[-1]))
+        return self
+
+    def merge(self, other):
+        if other.totals is not None:
+            other._combine()
+            self._fold(other.totals, other.head, other.tail)
+        return self
+
+    def _fold(self, totals, head, tail):
+        if head == self.tail:
+            # the invoice continues from the previous rows, it is already counted
+            totals = totals.copy()
+            totals.loc[head[0], "n_invoices"] -= 1
+        self.head = self.head or head
+        self.tail = tail
+        self.pending.append(totals)
+        self.pending_rows += len(totals)
+        if self.totals is None or self.pending_rows >= len(self.totals):
+            self._combine()
+
+    def _combine(self):
+        if not self.pending:
+            return
+        parts = self.pending if self.totals is None else [self.totals] + self.pending
+        self.totals = pd.concat(parts).groupby(level=0).agg({"first_date": "min",
+                                                             "last_date": "max",
+                                                             "n_invoices": "sum",
+                                                             "total_unit": "sum",
+                                                             "total_price": "sum"})
+        self.pending, self.pending_rows = [], 0
+
+    def summary(self):
+        """
+            Returns the same table as customer_summary would on the concatenated chunks
+            (an empty table with the same columns and dtypes if no chunk was folded in).
+        """
+
+        if self.totals is None:
+            index = pd.Index([], dtype="float64", name=self.customer_col)
+            return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in SUMMARY_DTYPES.items()}, index=index)
+        self._combine()
+        return self.totals.copy()
+
+
+######################################
+# 3. Streaming RFM
+######################################
+
+def stream_rfm(path, today_date=dt.datetime(2010, 12, 11), chunksize=CHUNKSIZE):
+    """
+        recency, frequency and monetary of create_rfm, computed chunk by chunk.
+    """
+
+    accumulator = CustomerAccumulator()
+    for chunk in read_chunks(path, chunksize):
+        accumulator.update(prepare_rfm(chunk))
+
+    rfm = rfm_metrics(accumulator.summary(), today_date)
+    return rfm[rfm["monetary"] > 0]
+
+
+######################################
+# 4. Streaming Lifetime Data
+######################################
+
+def stream_lifetime(path, today_date=dt.datetime(2011, 12, 11), chunksize=CHUNKSIZE, capper=None):
+    """
+        recency, T, frequency and monetary of create_cltv_p, computed chunk by chunk.
+        The outlier thresholds need the whole column, so without a fitted OutlierCapper the file is read twice:
+        the first pass only fits the capper on the Quantity and Price value counts, the second one caps and aggregates.
+        A fitted capper (e.g. the one of a saved CLTV model) is reused and the file is read once.
+    """
+
+    if capper is None or not capper.is_fitted:
+        capper = capper or OutlierCapper()
+        for chunk in read_chunks(path, chunksize):
+            capper.partial_fit(filter_cltv_p(chunk))
+
+    accumulator = CustomerAccumulator()
+    for chunk in read_chunks(path, chunksize):
+        accumulator.update(capper.transform(filter_cltv_p(chunk)))
+
+    return lifetime_data(accumulator.summary(), today_date)
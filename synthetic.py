@@ -0,0 +1,144 @@
+######################################
+# Synthetic Online Retail Transactions
+######################################
+# Reproducible transactions with the columns and dtypes of the Online Retail II workbook (after ingestion) :
+# Invoice, StockCode, Description, Quantity, InvoiceDate, Price, Customer ID, Country.
+# Like the workbook they contain multi-line invoices, cancelled invoices ("C" prefix, negative quantities),
+# guest invoices without Customer ID, missing descriptions, zero prices and a few quantity outliers.
+# A few customers buy often and most rarely, and customers keep being acquired over the whole period.
+# Transactions are generated chunk by chunk (each chunk covers the next slice of the period with its own seed),
+# so 1e8 rows can be written to Parquet or CSV without holding them in memory.
+# The same n_rows, n_customers, seed and chunk_rows always give the same transactions.
+# Usage : python synthetic.py <n_rows> <path.parquet | path.csv>
+
+# 1. Catalog
+# 2. Transaction Chunks
+# 3. Writing Files
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+START_DATE = np.datetime64("2009-12-01T07:00")
+N_DAYS = 739
+
+CHUNK_ROWS = 1_000_000
+
+COUNTRIES = ["United Kingdom", "Germany", "France", "EIRE", "Spain", "Netherlands", "Belgium", "Switzerland",
+             "Portugal", "Australia"]
+COUNTRY_WEIGHTS = [0.9, 0.02, 0.02, 0.02, 0.01, 0.01, 0.005, 0.005, 0.005, 0.005]
+
+
+######################################
+# 1. Catalog
+######################################
+
+def product_catalog(n_products=4000, seed=0):
+    """
+        StockCode, Description and unit price of the products, independent of the transaction seed.
+    """
+
+    rng = np.random.default_rng(seed)
+    codes = np.arange(20000, 20000 + n_products)
+    return pd.DataFrame({"StockCode": pd.array(codes.astype(str), dtype="string"),
+                         "Description": pd.array([f"PRODUCT {code}" for code in codes], dtype="string"),
+                         "Price": np.round(rng.lognormal(0.8, 0.9, n_products), 2)})
+
+
+######################################
+# 2. Transaction Chunks
+######################################
+
+def _chunk(rng, n_rows, n_customers, catalog, first_invoice, day_from, day_to):
+    # invoices of about 20 lines each, sorted by date inside the chunk's slice of the period
+    n_invoices = max(n_rows // 20, 1)
+    lines = rng.multinomial(n_rows - n_invoices, np.full(n_invoices, 1 / n_invoices)) + 1
+    minutes = np.sort(rng.uniform(day_from, day_to, n_invoices) * 24 * 60).astype("int64")
+    dates = (START_DATE + minutes.astype("timedelta64[m]")).astype("datetime64[ns]")
+
+    # customers acquired up to the end of the slice, early customers buy more often
+    acquired = max(int(n_customers * min(0.2 + day_to / N_DAYS, 1.0)), 1)
+    customers = 12346 + np.floor(acquired * rng.random(n_invoices) ** 2).astype("float64")
+    customers[rng.random(n_invoices) < 0.2] = np.nan
+    cancelled = rng.random(n_invoices) < 0.02
+    numbers = pd.array(np.arange(first_invoice, first_invoice + n_invoices).astype(str), dtype="string")
+    invoices = pd.array(np.where(cancelled, "C", ""), dtype="string") + numbers
+    countries = rng.choice(len(COUNTRIES), n_invoices, p=COUNTRY_WEIGHTS)
+
+    # invoice lines
+    invoice = np.repeat(np.arange(n_invoices), lines)
+    product = np.minimum((len(catalog) * rng.random(n_rows) ** 3).astype("int64"), len(catalog) - 1)
+    quantity = rng.geometric(0.15, n_rows)
+    quantity[rng.random(n_rows) < 0.0005] *= 100
+    quantity = np.where(cancelled[invoice], -quantity, quantity)
+    price = catalog["Price"].to_numpy()[product]
+    price[rng.random(n_rows) < 0.005] = 0.0
+    description = catalog["Description"].array.take(product)
+    description[rng.random(n_rows) < 0.004] = pd.NA
+
+    return pd.DataFrame({"Invoice": invoices.take(invoice),
+                         "StockCode": catalog["StockCode"].array.take(product),
+                         "Description": description,
+                         "Quantity": quantity,
+                         "InvoiceDate": dates[invoice],
+                         "Price": price,
+                         "Customer ID": customers[invoice],
+                         "Country": pd.array(COUNTRIES, dtype="string").take(countries[invoice])})
+
+
+def iter_transactions(n_rows, n_customers=None, seed=42, chunk_rows=CHUNK_ROWS):
+    """
+        Yields the transactions in chunks of chunk_rows rows, in InvoiceDate order.
+        n_customers defaults to one customer per 200 rows, about the ratio of the workbook.
+    """
+
+    n_customers = n_customers or max(n_rows // 200, 1)
+    n_chunks = max(-(-n_rows // chunk_rows), 1)
+    catalog = product_catalog()
+    first_invoice = 489434
+    for i, child in enumerate(np.random.SeedSequence(seed).spawn(n_chunks)):
+        rows = min(chunk_rows, n_rows - i * chunk_rows)
+        chunk = _chunk(np.random.default_rng(child), rows, n_customers, catalog, first_invoice,
+                       N_DAYS * i / n_chunks, N_DAYS * (i + 1) / n_chunks)
+        first_invoice += rows
+        yield chunk
+
+
+def generate_transactions(n_rows, n_customers=None, seed=42, chunk_rows=CHUNK_ROWS):
+    """
+        All the transactions of iter_transactions in one DataFrame.
+    """
+
+    return pd.concat(iter_transactions(n_rows, n_customers, seed, chunk_rows), ignore_index=True)
+
+
+######################################
+# 3. Writing Files
+######################################
+
+def write_transactions(path, n_rows, n_customers=None, seed=42, chunk_rows=CHUNK_ROWS):
+    """
+        Writes the transactions chunk by chunk to a Parquet (.parquet) or CSV file and returns the path.
+    """
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        for chunk in iter_transactions(n_rows, n_customers, seed, chunk_rows):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            writer = writer or pq.ParquetWriter(tmp, table.schema)
+            writer.write_table(table)
+        writer.close()
+    else:
+        for i, chunk in enumerate(iter_transactions(n_rows, n_customers, seed, chunk_rows)):
+            chunk.to_csv(tmp, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+if __name__ == "__main__":
+    write_transactions(sys.argv[2], int(float(sys.argv[1])))
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+from cohort import CohortAccumulator, cohort_matrices, stream_cohorts
+from preprocessing import prepare_rfm
+from synthetic import generate_transactions, write_transactions
+
+
+@pytest.fixture(scope="module")
+def transactions():
+    return generate_transactions(30_000, seed=3)
+
+
+def _reference(transactions):
+    # cohort, offset, customers, invoices and revenue with plain groupbys
+    clean = prepare_rfm(transactions)
+    month = clean["InvoiceDate"].dt.year * 12 + clean["InvoiceDate"].dt.month - 1
+    cohort = month.groupby(clean["Customer ID"]).transform("min")
+    cells = clean.assign(cohort=cohort, offset=month - cohort).groupby(["cohort", "offset"])
+    active = cells["Customer ID"].nunique().unstack(fill_value=0)
+    orders = cells["Invoice"].nunique().unstack()
+    revenue = cells["TotalPrice"].sum().unstack(fill_value=0.0)
+    return active, orders, revenue
+
+
+def test_matrices_match_groupby_reference(transactions):
+    matrices = cohort_matrices(transactions)
+    active, orders, revenue = _reference(transactions)
+
+    assert matrices["cohort_size"].to_numpy().tolist() == active[0].tolist()
+    np.testing.assert_allclose(matrices["retention"].to_numpy(), active.div(active[0], axis=0).to_numpy())
+    np.testing.assert_allclose(matrices["revenue"].to_numpy(), revenue.to_numpy())
+    np.testing.assert_allclose(matrices["average_order"].to_numpy(), (revenue / orders).to_numpy())
+    assert matrices["retention"].index[0] == prepare_rfm(transactions)["InvoiceDate"].min().to_period("M").start_time
+
+
+@pytest.mark.parametrize("chunksize", [7_000, 250])
+def test_stream_cohorts_equals_cohort_matrices(transactions, tmp_path, chunksize):
+    path = write_transactions(str(tmp_path / "transactions.parquet"), 30_000, seed=3)
+    streamed = stream_cohorts(path, chunksize=chunksize)
+    expected = cohort_matrices(transactions)
+
+    for name in ("retention", "revenue", "average_order"):
+        pd.testing.assert_frame_equal(streamed[name], expected[name])
+    pd.testing.assert_series_equal(streamed["cohort_size"], expected["cohort_size"])
+
+
+def test_merge_of_consecutive_parts(transactions):
+    clean = prepare_rfm(transactions)
+    head, tail = CohortAccumulator(), CohortAccumulator()
+    head.update(clean.iloc[:10_001])
+    tail.update(clean.iloc[10_001:])
+
+    merged = head.merge(tail).matrices()
+    pd.testing.assert_frame_equal(merged["average_order"], cohort_matrices(transactions)["average_order"])
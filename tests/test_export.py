@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from export import MISSING_DIRECTORY, export_segments, read_segment, read_segments
+
+
+def _frame():
+    return pd.DataFrame({"monetary": [1.0, 2.0, 3.0, 4.0, 5.0],
+                         "segment": ["at risk", "at_risk", np.nan, "champions", "at risk"]},
+                        index=pd.Index([11, 12, 13, 14, 15], name="Customer ID"))
+
+
+def test_colliding_and_missing_segments(tmp_path):
+    frame = _frame()
+    manifest = export_segments(frame, str(tmp_path / "export"))
+
+    assert manifest["segments"]["at risk"]["directory"] == "at_risk"
+    assert manifest["segments"]["at_risk"]["directory"] == "at_risk-1"
+    assert manifest["missing"] == {"directory": MISSING_DIRECTORY, "files": ["part-00000.parquet"], "rows": 1}
+    assert read_segment(str(tmp_path / "export"), "at_risk").index.tolist() == [12]
+    assert read_segment(str(tmp_path / "export"), None).index.tolist() == [13]
+    assert read_segments(str(tmp_path / "export")).sort_index().equals(frame)
+
+
+def test_replaces_only_a_previous_export(tmp_path):
+    frame = _frame()
+    export_segments(frame, str(tmp_path / "export"))
+    export_segments(frame.head(2), str(tmp_path / "export"))
+    assert len(read_segments(str(tmp_path / "export"))) == 2
+
+    other = tmp_path / "other"
+    other.mkdir()
+    (other / "important.txt").write_text("keep")
+    with pytest.raises(FileExistsError):
+        export_segments(frame, str(other))
+    assert os.listdir(other) == ["important.txt"]
@@ -0,0 +1,38 @@
+import os
+
+import pandas as pd
+import pytest
+
+from feature_store import FeatureStore, write_feature_store
+
+
+def _frames():
+    snapshot = pd.DataFrame({"last_date": pd.to_datetime(["2011-12-01", "2011-11-20"]),
+                             "segment": ["champions", "at_risk"]},
+                            index=pd.Index([12347, 12348], name="Customer ID"))
+    cltv = pd.DataFrame({"Customer ID": [12347, 12349], "clv": [10.5, 3.0]})
+    return {"rfm": snapshot, "cltv": cltv}
+
+
+def test_lookup_returns_timestamps(tmp_path):
+    store = FeatureStore(write_feature_store(str(tmp_path / "store"), _frames()))
+
+    row = store.lookup(12347)
+    assert row["rfm_last_date"] == pd.Timestamp("2011-12-01")
+    assert isinstance(row["rfm_last_date"], pd.Timestamp)
+    assert row["rfm_segment"] == "champions"
+    assert store.lookup(12349)["rfm_last_date"] is pd.NaT
+
+
+def test_replaces_only_a_previous_store(tmp_path):
+    path = str(tmp_path / "store")
+    write_feature_store(path, _frames())
+    write_feature_store(path, {"cltv": _frames()["cltv"]})
+    assert FeatureStore(path).columns == ["cltv_clv"]
+
+    other = tmp_path / "other"
+    other.mkdir()
+    (other / "important.txt").write_text("keep")
+    with pytest.raises(FileExistsError):
+        write_feature_store(str(other), _frames())
+    assert os.listdir(other) == ["important.txt"]
@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+from customer_summary import customer_summary
+from features import FEATURE_DTYPES, customer_features, customer_frames, feature_summary
+from preprocessing import prepare_rfm
+from synthetic import generate_transactions
+
+
+@pytest.fixture(scope="module")
+def transactions():
+    return generate_transactions(20_000, seed=9)
+
+
+def test_rfm_view_equals_customer_summary(transactions):
+    expected = customer_summary(prepare_rfm(transactions))[["n_invoices", "last_date", "total_price"]]
+    summary = feature_summary(customer_features(transactions), "rfm")
+    pd.testing.assert_frame_equal(summary, expected, check_exact=False)
+
+
+@pytest.mark.parametrize("rows", ["none", "cancelled"])
+def test_nothing_kept_gives_empty_frames(transactions, rows):
+    if rows == "none":
+        dataframe = transactions.iloc[:0]
+    else:
+        dataframe = transactions[transactions["Invoice"].astype(str).str.startswith("C")]
+
+    features = customer_features(dataframe)
+    assert features.empty
+    assert features.dtypes.astype(str).to_dict() == FEATURE_DTYPES
+    assert features.index.name == "Customer ID"
+
+    frames = customer_frames(dataframe)
+    assert list(frames["rfm"].columns) == ["recency", "frequency", "monetary"]
+    assert list(frames["cltv_calculation"].columns) == ["total_transaction", "total_unit", "total_price"]
+    assert list(frames["lifetime"].columns) == ["recency", "T", "frequency", "monetary"]
+    assert all(frame.empty for frame in frames.values())
@@ -0,0 +1,74 @@
+import datetime as dt
+
+import pandas as pd
+import pytest
+from incremental import RFMState, segment_migration
+from pipelines import create_rfm
+from ranking import top_k
+from synthetic import generate_transactions
+
+TODAY = dt.datetime(2010, 12, 11)
+
+
+@pytest.fixture(scope="module")
+def transactions():
+    dataframe = generate_transactions(60_000, seed=4)
+    return dataframe[dataframe["InvoiceDate"] < TODAY]
+
+
+def split(transactions, cutoff=dt.datetime(2010, 12, 1)):
+    return transactions[transactions["InvoiceDate"] < cutoff], transactions[transactions["InvoiceDate"] >= cutoff]
+
+
+def test_state_plus_delta_equals_create_rfm(transactions):
+    history, delta = split(transactions)
+    state = RFMState.from_transactions(history, dt.datetime(2010, 12, 1))
+    state.update(delta, TODAY)
+
+    expected = create_rfm(transactions.copy())
+    result = state.rfm(TODAY)
+    pd.testing.assert_frame_equal(result[["recency", "frequency", "monetary"]],
+                                  expected[["recency", "frequency", "monetary"]], check_exact=False)
+    pd.testing.assert_series_equal(result["segment"].astype(str), expected["segment"].astype(str))
+
+
+def test_save_load_round_trip(transactions, tmp_path):
+    state = RFMState.from_transactions(transactions, TODAY)
+    state.save(tmp_path / "state.parquet")
+    loaded = RFMState.load(tmp_path / "state.parquet")
+    pd.testing.assert_frame_equal(loaded.rfm(TODAY).astype({"segment": str}), state.rfm(TODAY).astype({"segment": str}))
+
+
+def test_migration_labels():
+    previous = pd.Series(["champions", None, "at_Risk"], index=[1, 2, 3], dtype="object")
+    current = pd.Series(["loyal_customers", "champions", None], index=[1, 2, 4], dtype="object")
+    migration = segment_migration(previous, current)
+
+    assert migration.loc["champions", "loyal_customers"] == 1
+    assert migration.loc["unsegmented", "champions"] == 1
+    assert migration.loc["at_Risk", "dropped"] == 1
+    assert migration.loc["new", "unsegmented"] == 1
+    assert migration.to_numpy().sum() == 4
+
+
+def test_update_migration_counts_every_customer(transactions):
+    history, delta = split(transactions)
+    state = RFMState.from_transactions(history, dt.datetime(2010, 12, 1))
+    n_before = len(state.customers)
+    migration = state.update(delta, TODAY)
+
+    assert migration.to_numpy().sum() == len(state.customers)
+    assert migration.loc["new"].sum() == len(state.customers) - n_before
+    assert "dropped" not in migration.columns
+
+
+@pytest.mark.parametrize("column, largest", [("monetary", True), ("frequency", True), ("last_date", False)])
+def test_tracked_top_equals_recomputed_top(transactions, column, largest):
+    history, delta = split(transactions)
+    state = RFMState.from_transactions(history, dt.datetime(2010, 12, 1))
+    ranking = state.track_top(column, 10, largest)
+    state.update(delta, TODAY)
+
+    expected = top_k(state.customers[column], 10, largest=largest)
+    assert list(state.top[column].members.index) == list(ranking.members.index)
+    assert set(ranking.members.index) == set(expected.index)
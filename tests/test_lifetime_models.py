@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+from lifetimes import BetaGeoFitter, GammaGammaFitter
+from scipy.optimize import approx_fprime
+from customer_summary import customer_summary, lifetime_data
+from lifetime_models import (BGNBDFitter, GGFitter, bgnbd_negative_log_likelihood, clv_horizons, frequency_groups,
+                             MIN_ROWS_TO_GROUP, gamma_gamma_negative_log_likelihood, unique_tuples)
+from preprocessing import OutlierCapper, filter_cltv_p
+from synthetic import generate_transactions
+
+
+@pytest.fixture(scope="module")
+def cltv_df():
+    transactions = OutlierCapper().fit_transform(filter_cltv_p(generate_transactions(100_000, n_customers=3_000,
+                                                                                     seed=9)))
+    today_date = transactions["InvoiceDate"].max().normalize() + pd.Timedelta(days=2)
+    return lifetime_data(customer_summary(transactions), today_date)
+
+
+def _check_gradient(function, log_params, *args):
+    value, gradient = function(log_params, *args)
+    numeric = approx_fprime(log_params, lambda x: function(x, *args)[0], 1e-7)
+    np.testing.assert_allclose(gradient, numeric, rtol=1e-4, atol=1e-6)
+
+
+@pytest.mark.parametrize("log_params", [[-2.3] * 4, [0.5, -1.0, 1.2, 0.3], [1.5, 2.0, -0.7, 2.5]])
+def test_bgnbd_gradient(cltv_df, log_params):
+    frequency = cltv_df["frequency"].to_numpy()
+    weights = np.random.default_rng(0).integers(1, 4, len(frequency)).astype("float64")
+    scale = 1 / cltv_df["T"].max()
+    _check_gradient(bgnbd_negative_log_likelihood, np.array(log_params), frequency,
+                    cltv_df["recency"].to_numpy() * scale, cltv_df["T"].to_numpy() * scale, weights, 0.001,
+                    frequency_groups(frequency, weights))
+
+
+def test_bgnbd_matches_lifetimes(cltv_df):
+    columns = [cltv_df[col] for col in ("frequency", "recency", "T")]
+    reference = BetaGeoFitter(penalizer_coef=0.001).fit(*columns)
+    fitter = BGNBDFitter(penalizer_coef=0.001).fit(*columns)
+
+    np.testing.assert_allclose(fitter.params_[["r", "alpha", "a", "b"]], reference.params_[["r", "alpha", "a", "b"]],
+                               rtol=1e-6)
+    for t in (1, 4, 12):
+        np.testing.assert_allclose(fitter.predict(t, *columns), reference.predict(t, *columns), rtol=1e-6)
+
+
+def test_bgnbd_warm_start_reaches_the_same_fit(cltv_df):
+    columns = [cltv_df[col] for col in ("frequency", "recency", "T")]
+    cold = BGNBDFitter(penalizer_coef=0.001).fit(*columns)
+    warm = BGNBDFitter(penalizer_coef=0.001).fit(*columns, initial_params=cold.params_)
+    np.testing.assert_allclose(warm.params_, cold.params_, rtol=1e-5)
+    assert warm.n_iterations_ < cold.n_iterations_
+
+
+@pytest.mark.parametrize("log_params", [[-2.3] * 3, [1.2, 0.4, 1.5], [0.3, 2.0, -0.5]])
+def test_gamma_gamma_gradient(cltv_df, log_params):
+    weights = np.random.default_rng(1).integers(1, 4, len(cltv_df)).astype("float64")
+    _check_gradient(gamma_gamma_negative_log_likelihood, np.array(log_params), cltv_df["frequency"].to_numpy(),
+                    cltv_df["monetary"].to_numpy(), weights, 0.01)
+
+
+def test_gamma_gamma_and_clv_match_lifetimes(cltv_df):
+    columns = [cltv_df[col] for col in ("frequency", "recency", "T")]
+    reference_bgf = BetaGeoFitter(penalizer_coef=0.001).fit(*columns)
+    reference = GammaGammaFitter(penalizer_coef=0.01).fit(cltv_df["frequency"], cltv_df["monetary"])
+    bgf = BGNBDFitter(penalizer_coef=0.001).fit(*columns)
+    ggf = GGFitter(penalizer_coef=0.01).fit(cltv_df["frequency"], cltv_df["monetary"])
+
+    np.testing.assert_allclose(ggf.params_[["p", "q", "v"]], reference.params_[["p", "q", "v"]], rtol=1e-6)
+    np.testing.assert_allclose(ggf.conditional_expected_average_profit(cltv_df["frequency"], cltv_df["monetary"]),
+                               reference.conditional_expected_average_profit(cltv_df["frequency"],
+                                                                             cltv_df["monetary"]), rtol=1e-6)
+    # all the months of the CLTV predicted in one batch, as the lifetimes loop over the months
+    clv = ggf.customer_lifetime_value(bgf, *columns, cltv_df["monetary"], time=3, freq="W", discount_rate=0.01)
+    expected = reference.customer_lifetime_value(reference_bgf, *columns, cltv_df["monetary"], time=3, freq="W",
+                                                 discount_rate=0.01)
+    np.testing.assert_allclose(clv, expected, rtol=1e-6)
+
+
+def test_predict_horizons_matches_lifetimes(cltv_df):
+    columns = [cltv_df[col] for col in ("frequency", "recency", "T")]
+    reference = BetaGeoFitter(penalizer_coef=0.001).fit(*columns)
+    batch = BGNBDFitter(penalizer_coef=0.001).fit(*columns).predict_horizons(clv_horizons(3, "W"), *columns)
+    for i, t in enumerate(clv_horizons(3, "W")):
+        np.testing.assert_allclose(batch[:, i], reference.predict(t, *columns), rtol=1e-6, atol=1e-12)
+
+
+def test_unique_tuples_round_trip():
+    frequency = np.array([2.0, 3.0, 2.0, 2.0, 5.0])
+    monetary = np.array([10.0, 7.5, 10.0, 11.0, 7.5])
+    (x, m), weights, inverse = unique_tuples(frequency, monetary)
+    assert len(x) == 4 and weights.sum() == 5
+    np.testing.assert_array_equal(x[inverse], frequency)
+    np.testing.assert_array_equal(m[inverse], monetary)
+    assert weights[inverse[0]] == 2
+
+
+def test_weighted_tuple_fits_match_row_fits(cltv_df):
+    # every customer repeated 1 to 4 times, so that customers share tuples
+    counts = np.random.default_rng(2).integers(1, 5, len(cltv_df))
+    customers = cltv_df.iloc[np.repeat(np.arange(len(cltv_df)), counts)].sample(frac=1, random_state=0)
+
+    columns = [customers[col] for col in ("frequency", "recency", "T")]
+    (frequency, recency, T), weights, _ = unique_tuples(*columns)
+    assert len(frequency) == len(cltv_df)
+    rows = BGNBDFitter(penalizer_coef=0.001).fit(*columns)
+    tuples = BGNBDFitter(penalizer_coef=0.001).fit(frequency, recency, T, weights=weights)
+    np.testing.assert_allclose(tuples.params_, rows.params_, rtol=1e-6)
+
+    (frequency, monetary), weights, _ = unique_tuples(customers["frequency"], customers["monetary"])
+    rows = GGFitter(penalizer_coef=0.01).fit(customers["frequency"], customers["monetary"])
+    tuples = GGFitter(penalizer_coef=0.01).fit(frequency, monetary, weights=weights)
+    np.testing.assert_allclose(tuples.params_, rows.params_, rtol=1e-6)
+
+
+def test_grouped_predictions_match_row_predictions(cltv_df):
+    columns = [cltv_df[col] for col in ("frequency", "recency", "T")]
+    bgf = BGNBDFitter(penalizer_coef=0.001).fit(*columns)
+    # enough customers for predict_horizons to evaluate the hypergeometric term per distinct (frequency, T)
+    repeat = -(-MIN_ROWS_TO_GROUP // len(cltv_df))
+    many = [np.tile(col.to_numpy(), repeat) for col in columns]
+    horizons = clv_horizons(3, "W")
+    grouped = bgf.predict_horizons(horizons, *many)
+    rows = np.vstack([bgf.predict_horizons(horizons, *(col[start:start + 1_000] for col in many))
+                      for start in range(0, len(many[0]), 1_000)])
+    np.testing.assert_allclose(grouped, rows, rtol=1e-12)
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+from customer_summary import customer_summary
+from parallel import hash_partition, sharded_summary
+from preprocessing import OutlierCapper, filter_cltv_p, prepare_cltv, prepare_rfm
+from synthetic import generate_transactions
+
+
+@pytest.fixture(scope="module")
+def transactions():
+    return generate_transactions(30_000, seed=8)
+
+
+def _serial(transactions, pipeline):
+    if pipeline == "rfm":
+        return customer_summary(prepare_rfm(transactions))
+    if pipeline == "cltv_calculation":
+        return customer_summary(prepare_cltv(transactions))
+    return customer_summary(OutlierCapper().fit_transform(filter_cltv_p(transactions)))
+
+
+@pytest.mark.parametrize("pipeline", ["rfm", "cltv_calculation", "cltv_prediction"])
+@pytest.mark.parametrize("n_jobs", [1, 3])
+def test_sharded_summary_equals_serial(transactions, pipeline, n_jobs):
+    pd.testing.assert_frame_equal(sharded_summary(transactions, pipeline, n_jobs), _serial(transactions, pipeline))
+
+
+def test_sharded_capper_is_fitted_like_the_serial_one(transactions):
+    capper = OutlierCapper()
+    sharded_summary(transactions, "cltv_prediction", 2, capper=capper)
+    expected = OutlierCapper().fit(filter_cltv_p(transactions)).limits_
+    for col in OutlierCapper.columns:
+        assert capper.limits_[col] == pytest.approx(expected[col])
+
+
+def test_hash_partition_keeps_customers_together(transactions):
+    shards = hash_partition(transactions.dropna(subset=["Customer ID"]), 4)
+    assert sum(len(shard) for shard in shards) == transactions["Customer ID"].notna().sum()
+    customers = [set(shard["Customer ID"]) for shard in shards]
+    assert sum(len(ids) for ids in customers) == len(set().union(*customers))
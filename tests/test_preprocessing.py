@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+from preprocessing import OutlierCapper, ValueCounter, cap_outliers, filter_cltv_p
+from synthetic import generate_transactions
+
+
+@pytest.fixture(scope="module")
+def transactions():
+    return filter_cltv_p(generate_transactions(20_000, seed=4))
+
+
+@pytest.mark.parametrize("q", [0.0, 0.01, 0.25, 0.5, 0.99, 1.0])
+def test_value_counter_quantile_matches_series_quantile(transactions, q):
+    for col in ("Quantity", "Price"):
+        counter = ValueCounter()
+        for start in range(0, len(transactions), 3_000):
+            counter.update(transactions[col].iloc[start:start + 3_000])
+        assert counter.quantile(q) == pytest.approx(transactions[col].quantile(q), rel=1e-12)
+
+
+def test_value_counter_quantile_on_ties():
+    values = pd.Series([1, 1, 1, 2, 5, 5, 9, 9, 9, 9])
+    counter = ValueCounter().update(values)
+    for q in np.linspace(0, 1, 21):
+        assert counter.quantile(q) == pytest.approx(values.quantile(q))
+
+
+def test_partial_fit_limits_match_fit(transactions):
+    capper = OutlierCapper()
+    for start in range(0, len(transactions), 4_000):
+        capper.partial_fit(transactions.iloc[start:start + 4_000])
+    expected = OutlierCapper().fit(transactions).limits_
+    for col in OutlierCapper.columns:
+        np.testing.assert_allclose(capper.limits_[col], expected[col])
+
+
+def test_capping_does_not_modify_the_input(transactions):
+    before = transactions.copy()
+    capped = OutlierCapper().fit_transform(transactions)
+    pd.testing.assert_frame_equal(transactions, before)
+    assert "TotalPrice" not in transactions.columns
+    assert capped["Quantity"].max() < transactions["Quantity"].max()
+    np.testing.assert_allclose(capped["TotalPrice"], capped["Quantity"] * capped["Price"])
+
+    cap_outliers(transactions, (0, 1), (0, 1))
+    pd.testing.assert_frame_equal(transactions, before)
@@ -0,0 +1,47 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+from customer_summary import customer_summary, rfm_metrics
+from preprocessing import prepare_rfm
+from quantile_sketch import (QuantileScorer, QuantileSketch, merge_sketches, qcut_error, rfm_scores_approx,
+                             sketch_columns)
+from segmentation import rfm_scores
+from synthetic import generate_transactions
+
+
+@pytest.fixture(scope="module")
+def rfm():
+    transactions = generate_transactions(400_000, n_customers=20_000, seed=6)
+    rfm = rfm_metrics(customer_summary(prepare_rfm(transactions)), dt.datetime(2011, 12, 11))
+    return rfm[rfm["monetary"] > 0]
+
+
+def test_sketch_rank_error_within_bound():
+    values = np.random.default_rng(0).gamma(2.0, 100.0, 200_000)
+    sketch = QuantileSketch(200, seed=0)
+    for part in np.array_split(values, 9):
+        sketch.merge(QuantileSketch(200, seed=1).update(part))
+    q = np.linspace(0.01, 0.99, 99)
+    exact_ranks = np.searchsorted(np.sort(values), sketch.quantile(q), side="right") / len(values)
+    assert sketch.n == len(values)
+    assert np.abs(exact_ranks - q).max() <= sketch.rank_error_bound
+
+
+def test_approximate_scores_follow_exact_scores_on_ties(rfm):
+    # frequency has heavy ties, broken by customer id like rank(method="first")
+    assert rfm["frequency"].nunique() < len(rfm) / 20
+    sketches = None
+    for part in np.array_split(np.arange(len(rfm)), 5):
+        partial = sketch_columns(rfm.iloc[part])
+        sketches = partial if sketches is None else merge_sketches(sketches, partial)
+    scorer = QuantileScorer.from_sketches(sketches)
+
+    exact = rfm_scores(rfm.copy())
+    approx = rfm_scores_approx(rfm.copy(), scorer)
+    for col in ("recency", "frequency", "monetary"):
+        error = qcut_error(rfm[col], scorer, col)
+        assert error["max_rank_error"] <= sketches[col].rank_error_bound
+        mismatch = (exact[f"{col}_score"].astype(int) != approx[f"{col}_score"].astype(int)).mean()
+        assert mismatch == pytest.approx(error["mismatch_rate"])
+        assert mismatch < 0.05
@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+
+from ranking import top_k, top_k_by_segment, top_positions
+
+
+def test_top_k_matches_sort_values():
+    frame = pd.DataFrame({"clv": [3.0, np.nan, 5.0, 3.0, 1.0, 5.0], "segment": list("ABABAB")})
+    for k in range(8):
+        assert top_k(frame, k, "clv").equals(frame.sort_values("clv", ascending=False, kind="stable").dropna().head(k))
+        assert top_k(frame, k, "clv", largest=False).equals(frame.sort_values("clv", kind="stable").dropna().head(k))
+
+
+def test_k_zero_selects_nothing():
+    assert len(top_positions(np.array([1.0, 2.0]), 0)) == 0
+    assert len(top_positions(np.array([1.0, 2.0]), -1, largest=False)) == 0
+    frame = pd.DataFrame({"clv": [1.0, 2.0], "segment": ["A", "B"]})
+    assert top_k_by_segment(frame, "clv", 0).empty
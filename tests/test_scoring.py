@@ -0,0 +1,68 @@
+import asyncio
+import datetime as dt
+import json
+
+import numpy as np
+import pytest
+from customer_summary import customer_summary, lifetime_data
+from preprocessing import OutlierCapper, filter_cltv_p
+from scoring import CLTVModel, load_model, save_model, start_scoring_server
+from synthetic import generate_transactions
+
+CUSTOMER = {"Customer ID": 12347.0, "frequency": 7, "recency": 52.1, "T": 52.6, "monetary": 615.7}
+
+
+@pytest.fixture(scope="module")
+def model():
+    capper = OutlierCapper()
+    transactions = capper.fit_transform(filter_cltv_p(generate_transactions(40_000, seed=2)))
+    cltv_df = lifetime_data(customer_summary(transactions), dt.datetime(2011, 12, 11))
+    return CLTVModel.fit(cltv_df, outlier_limits=capper.to_dict())
+
+
+def test_save_load_round_trip(model, tmp_path):
+    first = save_model(model, str(tmp_path))
+    second = save_model(model, str(tmp_path))
+    assert [first, second] == [str(tmp_path / "cltv_model_v1.json"), str(tmp_path / "cltv_model_v2.json")]
+
+    loaded = load_model(str(tmp_path))
+    assert loaded.version == 2
+    assert load_model(str(tmp_path), version=1).version == 1
+    assert loaded.to_dict() == model.to_dict()
+    assert loaded.capper.limits_ == model.capper.limits_
+    assert loaded.score(CUSTOMER) == model.score(CUSTOMER)
+    features = [np.array([2.0, 7.0, 30.0]), np.array([3.0, 52.1, 80.0]), np.array([10.0, 52.6, 90.0]),
+                np.array([20.0, 615.7, 1500.0])]
+    for col, values in model.predict(*features).items():
+        np.testing.assert_array_equal(loaded.predict(*features)[col], values)
+
+
+async def _request(port, method, target, payload=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+    writer.write(f"{method} {target} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+                 .encode("latin-1") + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, data = response.partition(b"\r\n\r\n")
+    return head.split(b" ", 2)[1].decode(), json.loads(data)
+
+
+def test_http_endpoint(model):
+    async def run():
+        server = await start_scoring_server(model, port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return [await _request(port, "GET", "/health"),
+                    await _request(port, "POST", "/score", CUSTOMER),
+                    await _request(port, "POST", "/score", [CUSTOMER, dict(CUSTOMER, frequency=2)]),
+                    await _request(port, "POST", "/score", {"frequency": 2}),
+                    await _request(port, "GET", "/missing")]
+
+    health, one, batch, bad, missing = asyncio.run(run())
+    assert health == ("200", {"version": model.version})
+    assert one == ("200", model.score(CUSTOMER))
+    assert batch == ("200", model.score([CUSTOMER, dict(CUSTOMER, frequency=2)]))
+    assert bad[0] == "400" and "KeyError" in bad[1]["error"]
+    assert missing[0] == "404"
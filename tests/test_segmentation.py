@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+from segmentation import SEG_MAP, rfm_scores, rfm_segments
+
+
+def rfm_frame(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    rfm = pd.DataFrame({"recency": rng.integers(0, 400, n),
+                        "frequency": rng.integers(1, 30, n),
+                        "monetary": rng.gamma(2.0, 300.0, n)})
+    return rfm_scores(rfm)
+
+
+def replace_segments(rfm, seg_map):
+    # the regex replace of the create_rfm tutorial
+    score = rfm["recency_score"].astype(str) + rfm["frequency_score"].astype(str)
+    return score.replace(seg_map, regex=True)
+
+
+@pytest.mark.parametrize("seg_map", [SEG_MAP,
+                                     {"1": "x", "x2": "y"},
+                                     {"[1-2]2": "p", "p": "q"},
+                                     {"1": "a", "2": "b"}])
+def test_segments_match_regex_replace(seg_map):
+    rfm = rfm_frame()
+    expected = replace_segments(rfm, seg_map)
+    result = rfm_segments(rfm, seg_map)
+    assert (result.astype(str) == expected.astype(str)).all()
+
+
+def test_later_pattern_does_not_match_earlier_output():
+    rfm = pd.DataFrame({"recency_score": pd.Categorical([1, 2], categories=[5, 4, 3, 2, 1]),
+                        "frequency_score": pd.Categorical([2, 2], categories=[1, 2, 3, 4, 5])})
+    assert rfm_segments(rfm, {"1": "x", "x2": "y"}).astype(str).tolist() == ["x2", "22"]
+    assert rfm_segments(rfm, {"[1-2]2": "p", "p": "q"}).astype(str).tolist() == ["p", "p"]
@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+from customer_summary import customer_summary, rfm_metrics
+from preprocessing import prepare_rfm
+from segmentation import rfm_scores, rfm_segments
+from snapshots import CustomerHistory, rfm_snapshot, rfm_snapshots
+from synthetic import generate_transactions
+
+
+@pytest.fixture(scope="module")
+def transactions():
+    return generate_transactions(30_000, seed=11)
+
+
+def recomputed_rfm(transactions, as_of_date):
+    rfm = rfm_metrics(customer_summary(prepare_rfm(transactions[transactions["InvoiceDate"] < as_of_date])),
+                      as_of_date)
+    rfm = rfm[rfm["monetary"] > 0].copy()
+    rfm = rfm_scores(rfm)
+    rfm["segment"] = rfm_segments(rfm)
+    rfm.index = rfm.index.astype(int)
+    return rfm
+
+
+def test_snapshots_equal_a_recomputation_before_each_date(transactions):
+    dates = pd.date_range("2010-03-01", "2011-12-01", freq="QS")
+    snapshots = rfm_snapshots(transactions, dates)
+
+    for date in dates:
+        pd.testing.assert_frame_equal(snapshots.loc[date], recomputed_rfm(transactions, date), check_exact=False)
+
+
+def test_early_as_of_date_is_skipped_with_a_warning(transactions):
+    with pytest.warns(UserWarning, match="2009-01-01"):
+        snapshots = rfm_snapshots(transactions, ["2009-01-01", "2010-06-01"])
+
+    assert snapshots.index.names == ["as_of", "Customer ID"]
+    assert snapshots.index.get_level_values("as_of").unique().tolist() == [pd.Timestamp("2010-06-01")]
+    expected = rfm_snapshot(CustomerHistory(transactions), "2010-06-01")
+    pd.testing.assert_frame_equal(snapshots.loc[pd.Timestamp("2010-06-01")], expected)
+
+
+def test_early_as_of_date_alone_raises(transactions):
+    with pytest.warns(UserWarning), pytest.raises(ValueError, match="none of the as-of dates"):
+        rfm_snapshots(transactions, ["2009-01-01"])
+
+
+def test_few_customers_raise_a_value_error(transactions):
+    # the first day of the data has too few customers for 5 quantile bins
+    first_day = transactions["InvoiceDate"].min().normalize() + pd.Timedelta(hours=9)
+    with pytest.raises(ValueError):
+        rfm_snapshot(CustomerHistory(transactions), first_day)
+
+
+@pytest.mark.parametrize("rows", ["none", "cancelled"])
+def test_history_without_kept_rows_is_empty(transactions, rows):
+    if rows == "none":
+        dataframe = transactions.iloc[:0]
+    else:
+        dataframe = transactions[transactions["Invoice"].astype(str).str.startswith("C")]
+
+    history = CustomerHistory(dataframe)
+    rfm = history.rfm("2010-06-01")
+    assert rfm.empty
+    assert list(rfm.columns) == ["recency", "frequency", "monetary"]
+    with pytest.raises(ValueError, match="no customer"):
+        rfm_snapshot(history, "2010-06-01")
@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+from pipelines import create_rfm, create_cltv_calculation, create_cltv_p
+from sql_backend import PIPELINE_FILTERS, check_parity, file_summary, pandas_summary
+from streaming import read_chunks
+from synthetic import write_transactions
+
+N_ROWS = 20_000
+
+
+@pytest.fixture(scope="module")
+def transaction_files(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("transactions")
+    return {extension: write_transactions(str(directory / f"transactions.{extension}"), N_ROWS, seed=7,
+                                          chunk_rows=7_000)
+            for extension in ("parquet", "csv")}
+
+
+@pytest.mark.parametrize("extension", ["parquet", "csv"])
+def test_duckdb_parity(transaction_files, extension):
+    pytest.importorskip("duckdb")
+    differences = check_parity(transaction_files[extension], "duckdb")
+    assert set(differences) == set(PIPELINE_FILTERS)
+
+
+@pytest.mark.parametrize("extension", ["parquet", "csv"])
+def test_sqlite_parity(transaction_files, extension):
+    differences = check_parity(transaction_files[extension], "sqlite")
+    assert set(differences) == set(PIPELINE_FILTERS)
+
+
+def test_duckdb_options_are_forwarded(transaction_files, tmp_path):
+    duckdb = pytest.importorskip("duckdb")
+    path = transaction_files["parquet"]
+    result = file_summary(path, "cltv_prediction", "duckdb", memory_limit="64MB", temp_directory=str(tmp_path),
+                          threads=1)
+    expected = pandas_summary(path, "cltv_prediction")
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-9)
+
+    # an invalid option reaches DuckDB
+    with pytest.raises(duckdb.Error, match="Memory"):
+        file_summary(path, "rfm", "duckdb", memory_limit="not a size")
+
+
+@pytest.mark.parametrize("function", [create_rfm, create_cltv_calculation, create_cltv_p])
+def test_duckdb_pipelines_equal_pandas_pipelines(transaction_files, function):
+    pytest.importorskip("duckdb")
+    path = transaction_files["parquet"]
+    expected = function(pd.concat(read_chunks(path), ignore_index=True))
+    result = function(path, backend="duckdb")
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-9)
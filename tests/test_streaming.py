@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+from customer_summary import customer_summary
+from preprocessing import prepare_rfm
+from streaming import CustomerAccumulator, read_chunks
+from synthetic import generate_transactions, write_transactions
+
+
+@pytest.fixture(scope="module")
+def path(tmp_path_factory):
+    return write_transactions(str(tmp_path_factory.mktemp("streaming") / "transactions.parquet"), 40_000, seed=5)
+
+
+@pytest.mark.parametrize("chunksize", [40_000, 5_000, 333])
+def test_chunked_summary_equals_customer_summary(path, chunksize):
+    accumulator = CustomerAccumulator()
+    for chunk in read_chunks(path, chunksize):
+        accumulator.update(prepare_rfm(chunk))
+
+    expected = customer_summary(prepare_rfm(next(read_chunks(path, 10 ** 6))))
+    pd.testing.assert_frame_equal(accumulator.summary(), expected, check_exact=False)
+
+
+def test_merge_of_consecutive_parts(path):
+    chunks = [prepare_rfm(chunk) for chunk in read_chunks(path, 3_000)]
+    head, tail = CustomerAccumulator(), CustomerAccumulator()
+    for chunk in chunks[:5]:
+        head.update(chunk)
+    for chunk in chunks[5:]:
+        tail.update(chunk)
+
+    expected = customer_summary(pd.concat(chunks))
+    pd.testing.assert_frame_equal(head.merge(tail).summary(), expected, check_exact=False)
+
+
+def test_interleaved_invoices_raise():
+    transactions = prepare_rfm(generate_transactions(2_000, seed=5)).sample(frac=1, random_state=0)
+    with pytest.raises(ValueError, match="consecutive"):
+        CustomerAccumulator().update(transactions)